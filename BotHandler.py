@@ -4,6 +4,7 @@ import gevent
 
 from DideRobot import DideRobot
 import GlobalStore
+from StartupProfiler import measureIfProfiling
 
 
 class BotHandler:
@@ -12,6 +13,7 @@ class BotHandler:
 	def __init__(self, serverfolderList):
 		self.logger = logging.getLogger('DideRobot')
 		GlobalStore.bothandler = self
+		self.botStartGreenlets = []  # The greenlets that start the bots passed to this init, so code that needs the bots to be started can wait for them
 
 		#Since a lot of modules save stuff to the 'data' subfolder, make sure it exists to save all of them some checking time
 		if not os.path.exists(os.path.join(GlobalStore.scriptfolder, 'data')):
@@ -22,7 +24,7 @@ class BotHandler:
 			self.shutdown()
 		else:		
 			for serverfolder in serverfolderList:
-				gevent.spawn(self.startBot, serverfolder)
+				self.botStartGreenlets.append(gevent.spawn(self.startBot, serverfolder))
 
 	def startBot(self, serverfolder):
 		if serverfolder in self.bots:
@@ -32,7 +34,8 @@ class BotHandler:
 			self.logger.error("BotHandler got command to join server '{}', which I don't have settings for".format(serverfolder))
 			return False
 		#Start the bot, woo!
-		self.bots[serverfolder] = DideRobot(serverfolder)
+		with measureIfProfiling('bot start', serverfolder):
+			self.bots[serverfolder] = DideRobot(serverfolder)
 		return True
 
 	def stopBot(self, serverfolder, quitmessage="Quitting..."):
@@ -46,6 +49,9 @@ class BotHandler:
 		if serverfolder not in self.bots:
 			self.logger.warning("Asked to unregister non-registered bot '{}'".format(serverfolder))
 		else:
+			#Make sure all the logged messages get written before the bot goes away
+			if self.bots[serverfolder].messageLogger:
+				self.bots[serverfolder].messageLogger.stop()
 			del self.bots[serverfolder]
 			self.logger.info("Successfully unregistered bot '{}'".format(serverfolder))
 		#If there's no more bots running, there's no need to hang about
@@ -53,6 +59,7 @@ class BotHandler:
 			self.logger.info("Out of bots, shutting down!")
 			#Unload all commands. This will mean there won't be any greenlets left running, so the main loop will quit
 			GlobalStore.commandhandler.unloadAllCommands()
+			GlobalStore.commandhandler.stopProcessPool()
 
 	def shutdown(self, quitmessage='Shutting down...'):
 		#Give all bots the same quit message
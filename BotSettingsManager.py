@@ -1,7 +1,7 @@
-import logging, json, os
-from typing import Any
+import logging, json, os, types
+from typing import Any, Mapping
 
-import GlobalStore
+import Constants, GlobalStore
 from CustomExceptions import SettingException
 
 
@@ -11,6 +11,8 @@ class BotSettingsManager(object):
 		self._logger = logging.getLogger("DideRobot")
 		self.settings = {}
 		self.loadedSuccessfully = False
+		self.version = 0  # Increases every time the settings change, so other code can cache values based on the settings and check whether they're still up to date
+		self._resolvedViews = {}  # Keys are channels (or None for the server-wide settings), values are read-only views of the settings that apply there. Cleared when the settings change
 
 		self.serverfolder = serverfolder
 		self._settingsPath = os.path.join(GlobalStore.scriptfolder, "serverSettings", self.serverfolder, "settings.json")
@@ -41,6 +43,48 @@ class BotSettingsManager(object):
 				self.loadedSuccessfully = previousSettingsLoadSuccess
 			else:
 				self.settings = {}
+		self.settingsChanged()
+
+	def settingsChanged(self):
+		"""
+		Should be called after the settings got changed, so the resolved settings views get rebuilt and cached values based on the settings know they're outdated
+		Changing a setting through 'mySettingsManager[key] = value' or reloading the settings calls this automatically, but changing a nested value (like a channel setting or a list item) doesn't
+		"""
+		self.version += 1
+		self._resolvedViews = {}
+
+	def getResolvedView(self, channel: str = None) -> Mapping[str, Any]:
+		"""
+		Get a read-only view of the settings that apply to the provided channel, so the server-wide settings with the channel-specific settings of the provided channel applied on top
+		The view is built once and reused until the settings change, so getting values from it is faster than checking for channel overrides every time. Lists in the view are tuples, so they can't be changed by accident
+		:param channel: The channel to get the settings for. If omitted, or if the channel doesn't have channel-specific settings, the server-wide settings are returned
+		:return: A read-only mapping of setting names to their values. Doesn't contain the 'channelSettings' key
+		"""
+		resolvedView = self._resolvedViews.get(channel, None)
+		if resolvedView is not None:
+			return resolvedView
+		if not channel or not self.settings or channel not in self.settings['channelSettings']:
+			#Channels without channel-specific settings use the server-wide view
+			resolvedView = self._resolvedViews.get(None, None)
+			if resolvedView is None:
+				resolvedView = BotSettingsManager._makeReadOnly({key: value for key, value in self.settings.items() if key != 'channelSettings'})
+				self._resolvedViews[None] = resolvedView
+		else:
+			resolvedSettings = {key: value for key, value in self.settings.items() if key != 'channelSettings'}
+			resolvedSettings.update(self.settings['channelSettings'][channel])
+			resolvedView = BotSettingsManager._makeReadOnly(resolvedSettings)
+		#Store the view for channels only, private message sources are users and there could be a lot of those
+		if channel and channel[0] in Constants.CHANNEL_PREFIXES:
+			self._resolvedViews[channel] = resolvedView
+		return resolvedView
+
+	@staticmethod
+	def _makeReadOnly(value: Any) -> Any:
+		if isinstance(value, dict):
+			return types.MappingProxyType({key: BotSettingsManager._makeReadOnly(item) for key, item in value.items()})
+		if isinstance(value, list):
+			return tuple(BotSettingsManager._makeReadOnly(item) for item in value)
+		return value
 
 	def loadSettings(self):
 		try:
@@ -110,11 +154,13 @@ class BotSettingsManager(object):
 
 	def __setitem__(self, key, value):
 		self.settings[key] = value
+		self.settingsChanged()
 
 	def __delitem__(self, key):
 		if key not in self.settings:
 			raise KeyError("Key '{}' does not exist".format(key))
 		del self.settings[key]
+		self.settingsChanged()
 
 	def __nonzero__(self):
 		"""Makes it possible to do 'if mySettingsManager' to see if loading went successfully"""
@@ -132,11 +178,12 @@ class BotSettingsManager(object):
 		:param keyname: The name of the settings key to retrieve the value of
 		:param defaultValue: The value to return if the settings key doesn't exist
 		:param channel: If provided, check if that channel has an override for the provided value. If not passed or no override value exists, the non-channel-specific value is used
-		:return: The value of the setting specified by the keyname, optionally taking the channel override into account, or the 'defaultValue' value if that key does not exist
+		:return: The value of the setting specified by the keyname, optionally taking the channel override into account, or the 'defaultValue' value if that key does not exist. Lists are returned as tuples, see 'getResolvedView'
 		"""
-		if channel and self.settings and channel in self.settings['channelSettings'] and keyname in self.settings['channelSettings'][channel]:
-			return self.settings['channelSettings'][channel][keyname]
-		return self.settings.get(keyname, defaultValue)
+		resolvedView = self._resolvedViews.get(channel, None)
+		if resolvedView is None:
+			resolvedView = self.getResolvedView(channel)
+		return resolvedView.get(keyname, defaultValue)
 
 	def has_key(self, keyname):
 		return keyname in self.settings
@@ -0,0 +1,376 @@
+import string
+import typing
+from collections.abc import Mapping
+
+
+# How each of the CASEMAPPING values a server can send in its RPL_ISUPPORT message maps uppercase characters to lowercase ones. Unknown casemappings fall back to Python's lowercasing
+_CASEMAPPING_TRANSLATIONS = {
+	'ascii': str.maketrans(string.ascii_uppercase, string.ascii_lowercase),
+	'rfc1459': str.maketrans(string.ascii_uppercase + "[]\\~", string.ascii_lowercase + "{}|^"),
+	'strict-rfc1459': str.maketrans(string.ascii_uppercase + "[]\\", string.ascii_lowercase + "{}|")
+}
+DEFAULT_CASEMAPPING = 'rfc1459'
+DEFAULT_PREFIXES = '(ov)@+'
+DEFAULT_CHANNEL_MODE_TYPES = 'beI,k,l,imnpst'
+
+
+class ChannelUser(object):
+	"""A user we share at least one channel with. The same instance is used for every channel the user is in, so an address change only has to be stored once"""
+	__slots__ = ('nickname', 'username', 'host', 'isAway')
+
+	def __init__(self, nickname: str, username: str = None, host: str = None, isAway: bool = False):
+		self.nickname = nickname
+		self.username = username  # The username and host are None if the server didn't tell us what they are (yet)
+		self.host = host
+		self.isAway = isAway  # Only kept up to date if the server supports the 'away-notify' capability
+
+	@property
+	def address(self) -> str:
+		"""The full 'nick!user@host' address of this user, or just the nickname if the rest of the address isn't known"""
+		if self.username is None or self.host is None:
+			return self.nickname
+		return "{}!{}@{}".format(self.nickname, self.username, self.host)
+
+	def __repr__(self):
+		return "<ChannelUser {}>".format(self.address)
+
+
+class Channel(object):
+	"""A channel we're in, with the users in it"""
+	__slots__ = ('name', 'userPrefixes')
+
+	def __init__(self, name: str):
+		self.name = name  # The channel name as we first saw it, not case-folded
+		self.userPrefixes = {}  # Keys are the case-folded nicks of the users in this channel, values are the status prefixes that user has here (like '@' for op or '+' for voice), or an empty string for none
+
+
+class ChannelMembership(object):
+	"""
+	Keeps track of which users are in which of the channels we're in. Channel names and nicks are stored case-folded according to the server's casemapping, so lookups are dict lookups
+	Besides the users per channel, there's a reverse index of the channels per user, so quits and nick changes only need to touch the channels the user is actually in
+	"""
+
+	def __init__(self):
+		self.channels = {}  # Keys are case-folded channel names, values are Channel instances
+		self.users = {}  # Keys are case-folded nicks, values are ChannelUser instances
+		self.channelsPerUser = {}  # Keys are case-folded nicks, values are sets with the case-folded names of the channels that user is in
+		self.caseMapping = DEFAULT_CASEMAPPING
+		self._caseMappingTranslation = _CASEMAPPING_TRANSLATIONS[DEFAULT_CASEMAPPING]
+		self.prefixPerMode = {}  # Keys are the channel mode letters that give a status prefix (like 'o'), values are those prefixes (like '@')
+		self.prefixOrder = ''  # All the status prefixes, from highest to lowest rank
+		self.setPrefixes(DEFAULT_PREFIXES)
+		self.channelModeTypes = ()
+		self.setChannelModeTypes(DEFAULT_CHANNEL_MODE_TYPES)
+
+	def clear(self):
+		"""Remove all channels and users, and go back to the default server settings, for instance because we disconnected"""
+		self.channels.clear()
+		self.users.clear()
+		self.channelsPerUser.clear()
+		self.setCaseMapping(DEFAULT_CASEMAPPING)
+		self.setPrefixes(DEFAULT_PREFIXES)
+		self.setChannelModeTypes(DEFAULT_CHANNEL_MODE_TYPES)
+
+	def foldCase(self, name: str) -> str:
+		"""
+		Turn a channel name or nick into the form the server considers it equal to, to use for lookups
+		:param name: The channel name or nick to case-fold
+		:return: The case-folded name, using the server's casemapping
+		"""
+		if self._caseMappingTranslation is None:
+			return name.lower()
+		return name.translate(self._caseMappingTranslation)
+
+	def setCaseMapping(self, caseMapping: str):
+		"""
+		Set how the server compares channel names and nicks. If there's already channels or users stored, they get re-indexed with the new casemapping
+		:param caseMapping: The CASEMAPPING value from the server's RPL_ISUPPORT message, like 'rfc1459' or 'ascii'
+		"""
+		caseMapping = caseMapping.lower() if caseMapping else DEFAULT_CASEMAPPING
+		if caseMapping == self.caseMapping:
+			return
+		self.caseMapping = caseMapping
+		self._caseMappingTranslation = _CASEMAPPING_TRANSLATIONS.get(caseMapping, None)
+		if self.channels or self.users:
+			previousUsers = self.users
+			self.users = {self.foldCase(user.nickname): user for user in previousUsers.values()}
+			self.channels = {self.foldCase(channel.name): channel for channel in self.channels.values()}
+			self.channelsPerUser = {}
+			for foldedChannelName, channel in self.channels.items():
+				channel.userPrefixes = {self.foldCase(previousUsers[previousFoldedNick].nickname): prefixes for previousFoldedNick, prefixes in channel.userPrefixes.items()}
+				for foldedNick in channel.userPrefixes:
+					self.channelsPerUser.setdefault(foldedNick, set()).add(foldedChannelName)
+
+	def setPrefixes(self, prefixes: str):
+		"""
+		Set which channel modes give users a status prefix
+		:param prefixes: The PREFIX value from the server's RPL_ISUPPORT message, like '(ov)@+', with the modes between brackets and the matching prefixes after it, from highest to lowest rank
+		"""
+		if not prefixes or not prefixes.startswith('(') or ')' not in prefixes:
+			prefixes = DEFAULT_PREFIXES
+		modeLetters, prefixCharacters = prefixes[1:].split(')', 1)
+		self.prefixPerMode = dict(zip(modeLetters, prefixCharacters))
+		self.prefixOrder = prefixCharacters
+
+	def setChannelModeTypes(self, channelModeTypes: str):
+		"""
+		Set which channel modes take a parameter, so mode changes can be parsed properly
+		:param channelModeTypes: The CHANMODES value from the server's RPL_ISUPPORT message, like 'beI,k,l,imnpst'. The first two groups always take a parameter, the third only when the mode gets set, the fourth never
+		"""
+		channelModeTypes = (channelModeTypes or DEFAULT_CHANNEL_MODE_TYPES).split(',')
+		# Make sure there's always at least four groups, even if the server sent fewer
+		channelModeTypes.extend([''] * (4 - len(channelModeTypes)))
+		self.channelModeTypes = tuple(channelModeTypes)
+
+	def __contains__(self, channelName: str) -> bool:
+		return self.foldCase(channelName) in self.channels
+
+	def getChannel(self, channelName: str) -> typing.Union[None, Channel]:
+		return self.channels.get(self.foldCase(channelName), None)
+
+	def addChannel(self, channelName: str) -> Channel:
+		"""
+		Store that we're in the provided channel. If it was already stored, its users are removed, since those should get retrieved again
+		:param channelName: The name of the channel we joined
+		:return: The Channel instance for the provided channel
+		"""
+		foldedChannelName = self.foldCase(channelName)
+		if foldedChannelName in self.channels:
+			self.clearChannelUsers(channelName)
+		else:
+			self.channels[foldedChannelName] = Channel(channelName)
+		return self.channels[foldedChannelName]
+
+	def removeChannel(self, channelName: str) -> bool:
+		"""
+		Remove the provided channel and its users, for instance because we left it
+		:param channelName: The name of the channel to remove
+		:return: True if the channel was stored and got removed, False if it wasn't stored
+		"""
+		foldedChannelName = self.foldCase(channelName)
+		if foldedChannelName not in self.channels:
+			return False
+		self.clearChannelUsers(channelName)
+		del self.channels[foldedChannelName]
+		return True
+
+	def clearChannelUsers(self, channelName: str):
+		"""Remove all the users from the provided channel, but keep the channel itself, for instance because the user list is going to be retrieved again"""
+		foldedChannelName = self.foldCase(channelName)
+		channel = self.channels.get(foldedChannelName, None)
+		if not channel:
+			return
+		for foldedNick in channel.userPrefixes:
+			self._removeChannelFromUser(foldedNick, foldedChannelName)
+		channel.userPrefixes.clear()
+
+	def _removeChannelFromUser(self, foldedNick: str, foldedChannelName: str):
+		userChannels = self.channelsPerUser.get(foldedNick, None)
+		if userChannels is not None:
+			userChannels.discard(foldedChannelName)
+			# If we don't share any channels with this user anymore, we can't keep their info up to date, so forget about them
+			if not userChannels:
+				del self.channelsPerUser[foldedNick]
+				del self.users[foldedNick]
+
+	def addUser(self, channelName: str, nickname: str, username: str = None, host: str = None, prefixes: str = '', isAway: bool = None) -> ChannelUser:
+		"""
+		Store that the provided user is in the provided channel. If the channel isn't stored yet, it gets added
+		:param channelName: The channel the user is in
+		:param nickname: The nick of the user
+		:param username: The username of the user, if known. If it's None and the user is already known, the stored username is kept
+		:param host: The host of the user, if known. If it's None and the user is already known, the stored host is kept
+		:param prefixes: The status prefixes the user has in the channel, like '@' for an op. Any characters that aren't status prefixes are ignored, so WHO reply flags can be passed as-is
+		:param isAway: Whether the user is away. If it's None, it's not known, and for an already known user the stored away status is kept
+		:return: The ChannelUser instance for this user
+		"""
+		foldedChannelName = self.foldCase(channelName)
+		channel = self.channels.get(foldedChannelName, None)
+		if channel is None:
+			channel = Channel(channelName)
+			self.channels[foldedChannelName] = channel
+		foldedNick = self.foldCase(nickname)
+		user = self.users.get(foldedNick, None)
+		if user is None:
+			user = ChannelUser(nickname, username, host, bool(isAway))
+			self.users[foldedNick] = user
+			self.channelsPerUser[foldedNick] = {foldedChannelName}
+		else:
+			# Update the stored info, since it could have changed while we didn't share a channel, or we didn't know it yet
+			user.nickname = nickname
+			if username is not None:
+				user.username = username
+			if host is not None:
+				user.host = host
+			if isAway is not None:
+				user.isAway = isAway
+			self.channelsPerUser[foldedNick].add(foldedChannelName)
+		if prefixes:
+			prefixes = "".join(prefix for prefix in self.prefixOrder if prefix in prefixes)
+		channel.userPrefixes[foldedNick] = prefixes
+		return user
+
+	def addUserFromNamesEntry(self, channelName: str, namesEntry: str) -> ChannelUser:
+		"""
+		Store a user from a NAMES reply in the provided channel
+		:param channelName: The channel the NAMES reply is about
+		:param namesEntry: A single user entry from the NAMES reply. This is the user's nick, preceded by their status prefixes (all of them if the server supports 'multi-prefix', otherwise just the highest one),
+			and if the server supports 'userhost-in-names' followed by the rest of their address, so for instance '@+Nick!user@host'
+		:return: The ChannelUser instance for this user
+		"""
+		prefixes = ''
+		nickStartIndex = 0
+		while nickStartIndex < len(namesEntry) and namesEntry[nickStartIndex] in self.prefixOrder:
+			nickStartIndex += 1
+		if nickStartIndex > 0:
+			prefixes = namesEntry[:nickStartIndex]
+			namesEntry = namesEntry[nickStartIndex:]
+		if '!' in namesEntry:
+			nickname, userAddress = namesEntry.split('!', 1)
+			username, separator, host = userAddress.partition('@')
+			return self.addUser(channelName, nickname, username, host if separator else None, prefixes)
+		return self.addUser(channelName, namesEntry, prefixes=prefixes)
+
+	def removeUser(self, channelName: str, nickname: str) -> bool:
+		"""
+		Remove the provided user from the provided channel, for instance because they left it
+		:return: True if the user was in the channel and got removed, False if they weren't in the channel
+		"""
+		foldedChannelName = self.foldCase(channelName)
+		channel = self.channels.get(foldedChannelName, None)
+		foldedNick = self.foldCase(nickname)
+		if channel is None or foldedNick not in channel.userPrefixes:
+			return False
+		del channel.userPrefixes[foldedNick]
+		self._removeChannelFromUser(foldedNick, foldedChannelName)
+		return True
+
+	def removeUserFromAllChannels(self, nickname: str) -> typing.List[str]:
+		"""
+		Remove the provided user from every channel they're in, for instance because they quit
+		:param nickname: The nick of the user to remove
+		:return: A list of the names of the channels the user was in
+		"""
+		foldedNick = self.foldCase(nickname)
+		userChannels = self.channelsPerUser.pop(foldedNick, None)
+		if not userChannels:
+			return []
+		del self.users[foldedNick]
+		channelNames = []
+		for foldedChannelName in userChannels:
+			channel = self.channels[foldedChannelName]
+			channel.userPrefixes.pop(foldedNick, None)
+			channelNames.append(channel.name)
+		return channelNames
+
+	def renameUser(self, oldNickname: str, newNickname: str) -> typing.List[str]:
+		"""
+		Change the nick of the provided user, keeping their channels and status prefixes
+		:param oldNickname: The nick the user had
+		:param newNickname: The nick the user has now
+		:return: A list of the names of the channels the user is in
+		"""
+		foldedOldNick = self.foldCase(oldNickname)
+		foldedNewNick = self.foldCase(newNickname)
+		user = self.users.get(foldedOldNick, None)
+		if user is None:
+			return []
+		user.nickname = newNickname
+		userChannels = self.channelsPerUser[foldedOldNick]
+		channelNames = []
+		if foldedNewNick != foldedOldNick:
+			del self.users[foldedOldNick]
+			del self.channelsPerUser[foldedOldNick]
+			self.users[foldedNewNick] = user
+			self.channelsPerUser[foldedNewNick] = userChannels
+			for foldedChannelName in userChannels:
+				channel = self.channels[foldedChannelName]
+				channel.userPrefixes[foldedNewNick] = channel.userPrefixes.pop(foldedOldNick)
+				channelNames.append(channel.name)
+		else:
+			# Only the capitalisation changed, so the indexes can stay the same
+			for foldedChannelName in userChannels:
+				channelNames.append(self.channels[foldedChannelName].name)
+		return channelNames
+
+	def getUser(self, nickname: str) -> typing.Union[None, ChannelUser]:
+		"""Get the info we have on the user with the provided nick, or None if we don't share a channel with them"""
+		return self.users.get(self.foldCase(nickname), None)
+
+	def getChannelUser(self, channelName: str, nickname: str) -> typing.Union[None, ChannelUser]:
+		"""Get the info we have on the user with the provided nick, or None if they're not in the provided channel"""
+		channel = self.channels.get(self.foldCase(channelName), None)
+		foldedNick = self.foldCase(nickname)
+		if channel is None or foldedNick not in channel.userPrefixes:
+			return None
+		return self.users[foldedNick]
+
+	def getUserChannelNames(self, nickname: str) -> typing.List[str]:
+		"""Get the names of the channels the user with the provided nick is in, or an empty list if we don't share any channels with them"""
+		return [self.channels[foldedChannelName].name for foldedChannelName in self.channelsPerUser.get(self.foldCase(nickname), ())]
+
+	def getUserPrefixes(self, channelName: str, nickname: str) -> str:
+		"""Get the status prefixes the provided user has in the provided channel, like '@' for an op or '+' for voice, highest rank first. Returns an empty string if they don't have any, or if they're not in the channel"""
+		channel = self.channels.get(self.foldCase(channelName), None)
+		if channel is None:
+			return ''
+		return channel.userPrefixes.get(self.foldCase(nickname), '')
+
+	def applyModeChange(self, channelName: str, modeString: str, modeParameters: typing.List[str]):
+		"""
+		Update the status prefixes of the users in the provided channel from a channel MODE change
+		:param channelName: The channel whose modes changed
+		:param modeString: The mode changes, like '+ov-v'
+		:param modeParameters: The parameters of the mode changes, in order, like the nicks that got op or voice
+		"""
+		channel = self.channels.get(self.foldCase(channelName), None)
+		if channel is None:
+			return
+		modeParameterIndex = 0
+		isAddingMode = True
+		for modeCharacter in modeString:
+			if modeCharacter == '+':
+				isAddingMode = True
+			elif modeCharacter == '-':
+				isAddingMode = False
+			elif modeCharacter in self.prefixPerMode:
+				if modeParameterIndex >= len(modeParameters):
+					break
+				foldedNick = self.foldCase(modeParameters[modeParameterIndex])
+				modeParameterIndex += 1
+				if foldedNick in channel.userPrefixes:
+					prefix = self.prefixPerMode[modeCharacter]
+					currentPrefixes = channel.userPrefixes[foldedNick]
+					if isAddingMode:
+						channel.userPrefixes[foldedNick] = "".join(orderedPrefix for orderedPrefix in self.prefixOrder if orderedPrefix == prefix or orderedPrefix in currentPrefixes)
+					else:
+						channel.userPrefixes[foldedNick] = currentPrefixes.replace(prefix, '')
+			# Skip over the parameters of other modes. Modes in the first two groups always have a parameter, modes in the third group only when they're set
+			elif modeCharacter in self.channelModeTypes[0] or modeCharacter in self.channelModeTypes[1] or (isAddingMode and modeCharacter in self.channelModeTypes[2]):
+				modeParameterIndex += 1
+
+
+class ChannelsUserListView(Mapping):
+	"""
+	A read-only dict-like view of a ChannelMembership, with the channel names as keys and a tuple of the 'nick!user@host' addresses of the users in that channel as values
+	Checking whether a channel is in this view is case-insensitive according to the server's casemapping, and doesn't build the user list
+	"""
+
+	def __init__(self, channelMembership: ChannelMembership):
+		self._channelMembership = channelMembership
+
+	def __getitem__(self, channelName: str) -> typing.Tuple[str, ...]:
+		channel = self._channelMembership.getChannel(channelName)
+		if channel is None:
+			raise KeyError(channelName)
+		users = self._channelMembership.users
+		return tuple(users[foldedNick].address for foldedNick in channel.userPrefixes)
+
+	def __contains__(self, channelName) -> bool:
+		return isinstance(channelName, str) and channelName in self._channelMembership
+
+	def __iter__(self):
+		return (channel.name for channel in list(self._channelMembership.channels.values()))
+
+	def __len__(self) -> int:
+		return len(self._channelMembership.channels)
@@ -0,0 +1,163 @@
+import collections, logging, time
+from typing import Callable, Dict, Hashable, Union
+
+import gevent
+
+
+class _QueuedJob(object):
+	__slots__ = ('commandname', 'maxWorkersForCommand', 'userKey', 'function', 'args', 'rejectionCallback', 'queuedAt', 'expirationGreenlet')
+
+	def __init__(self, commandname: str, maxWorkersForCommand: int, userKey: Hashable, function: Callable, args: tuple, rejectionCallback: Callable):
+		self.commandname = commandname
+		self.maxWorkersForCommand = maxWorkersForCommand
+		self.userKey = userKey
+		self.function = function
+		self.args = args
+		self.rejectionCallback = rejectionCallback
+		self.queuedAt = time.monotonic()
+		self.expirationGreenlet = None
+
+
+class CommandExecutor(object):
+	"""
+	Runs the commands that have 'callInThread' set in their own greenlet, but limits how many of those can run at the same time, in total, per command, and per user
+	That way a single user or a single busy command can't spawn so many greenlets that the bot grinds to a halt
+	Jobs that can't start immediately wait in a queue, and get rejected if the queue is full or if they've waited too long
+	"""
+
+	def __init__(self, maxWorkers: int = 20, maxWorkersPerCommand: int = 5, maxWorkersPerUser: int = 2, maxQueueLength: int = 50, maxQueuedJobsPerUser: int = 5, maxSecondsInQueue: float = 15.0):
+		"""
+		:param maxWorkers: How many jobs can run at the same time in total
+		:param maxWorkersPerCommand: How many jobs of the same command can run at the same time. Commands can lower or raise this with their 'maxConcurrentExecutions' attribute
+		:param maxWorkersPerUser: How many jobs started by the same user can run at the same time
+		:param maxQueueLength: How many jobs can wait for a free worker. If the queue is full, new jobs are rejected immediately
+		:param maxQueuedJobsPerUser: How many jobs started by the same user can wait in the queue, so a single user can't fill up the whole queue
+		:param maxSecondsInQueue: How long a job can wait in the queue before it gets rejected
+		"""
+		self.logger = logging.getLogger('DideRobot')
+		self.maxWorkers = maxWorkers
+		self.maxWorkersPerCommand = maxWorkersPerCommand
+		self.maxWorkersPerUser = maxWorkersPerUser
+		self.maxQueueLength = maxQueueLength
+		self.maxQueuedJobsPerUser = maxQueuedJobsPerUser
+		self.maxSecondsInQueue = maxSecondsInQueue
+
+		self.activeWorkerCount = 0
+		self.activeWorkersPerCommand = {}  # Keys are command names, values are how many jobs of that command are currently running
+		self.activeWorkersPerUser = {}  # Keys are user keys, values are how many jobs started by that user are currently running
+		self.queue = collections.deque()  # Holds '_QueuedJob' instances, in the order they were submitted
+		self.queuedJobsPerUser = {}  # Keys are user keys, values are how many jobs started by that user are waiting in the queue
+
+		#Statistics, so the limits can be tuned
+		self.startedJobCount = 0
+		self.queuedJobCount = 0
+		self.rejectedJobCount = 0  # Jobs rejected because the queue was full
+		self.expiredJobCount = 0  # Jobs rejected because they waited in the queue too long
+		self.maxObservedQueueLength = 0
+		self.totalSecondsInQueue = 0.0
+
+	def submit(self, commandname: str, userKey: Hashable, function: Callable, args: tuple = (), rejectionCallback: Callable = None, maxWorkersForCommand: int = None) -> bool:
+		"""
+		Run the provided function in a worker greenlet, as soon as the limits allow it
+		:param commandname: The name of the command this job is for, used for the per-command limit
+		:param userKey: Something that identifies the user that caused this job, used for the per-user limit
+		:param function: The function to call in the worker greenlet
+		:param args: The arguments to pass to the function
+		:param rejectionCallback: Called without arguments if the job gets rejected, either immediately because the queue is full, or later because it waited in the queue too long
+		:param maxWorkersForCommand: If provided, this overrides the default per-command limit for this command
+		:return: True if the job was started or queued, False if it was rejected immediately
+		"""
+		if maxWorkersForCommand is None:
+			maxWorkersForCommand = self.maxWorkersPerCommand
+		if self._canStart(commandname, maxWorkersForCommand, userKey):
+			self._start(commandname, userKey, function, args)
+			return True
+		if len(self.queue) >= self.maxQueueLength or self.queuedJobsPerUser.get(userKey, 0) >= self.maxQueuedJobsPerUser:
+			self.rejectedJobCount += 1
+			self.logger.debug("|CommandExecutor| Rejecting '{}' job because the queue is full ({:,} jobs waiting, {:,} running)".format(commandname, len(self.queue), self.activeWorkerCount))
+			if rejectionCallback:
+				rejectionCallback()
+			return False
+		queuedJob = _QueuedJob(commandname, maxWorkersForCommand, userKey, function, args, rejectionCallback)
+		queuedJob.expirationGreenlet = gevent.spawn_later(self.maxSecondsInQueue, self._expireQueuedJob, queuedJob)
+		self.queue.append(queuedJob)
+		self.queuedJobsPerUser[userKey] = self.queuedJobsPerUser.get(userKey, 0) + 1
+		self.queuedJobCount += 1
+		if len(self.queue) > self.maxObservedQueueLength:
+			self.maxObservedQueueLength = len(self.queue)
+		return True
+
+	def _canStart(self, commandname: str, maxWorkersForCommand: int, userKey: Hashable) -> bool:
+		if self.activeWorkerCount >= self.maxWorkers:
+			return False
+		if self.activeWorkersPerCommand.get(commandname, 0) >= maxWorkersForCommand:
+			return False
+		if self.activeWorkersPerUser.get(userKey, 0) >= self.maxWorkersPerUser:
+			return False
+		return True
+
+	def _start(self, commandname: str, userKey: Hashable, function: Callable, args: tuple):
+		self.activeWorkerCount += 1
+		self.activeWorkersPerCommand[commandname] = self.activeWorkersPerCommand.get(commandname, 0) + 1
+		self.activeWorkersPerUser[userKey] = self.activeWorkersPerUser.get(userKey, 0) + 1
+		self.startedJobCount += 1
+		gevent.spawn(self._runJob, commandname, userKey, function, args)
+
+	def _runJob(self, commandname: str, userKey: Hashable, function: Callable, args: tuple):
+		try:
+			function(*args)
+		except Exception as e:
+			self.logger.error("|CommandExecutor| {} exception while running '{}' job: {}".format(type(e).__name__, commandname, e), exc_info=True)
+		finally:
+			self.activeWorkerCount -= 1
+			self._decreaseCount(self.activeWorkersPerCommand, commandname)
+			self._decreaseCount(self.activeWorkersPerUser, userKey)
+			self._startQueuedJobs()
+
+	@staticmethod
+	def _decreaseCount(countDict: dict, key: Hashable):
+		count = countDict[key] - 1
+		if count <= 0:
+			del countDict[key]
+		else:
+			countDict[key] = count
+
+	def _startQueuedJobs(self):
+		"""Start as many of the queued jobs as the limits allow. Jobs that are blocked by their command or user limit don't block the jobs queued after them"""
+		if not self.queue or self.activeWorkerCount >= self.maxWorkers:
+			return
+		jobsToKeep = collections.deque()
+		now = time.monotonic()
+		while self.queue:
+			queuedJob = self.queue.popleft()
+			if self.activeWorkerCount < self.maxWorkers and self._canStart(queuedJob.commandname, queuedJob.maxWorkersForCommand, queuedJob.userKey):
+				queuedJob.expirationGreenlet.kill(block=False)
+				self._decreaseCount(self.queuedJobsPerUser, queuedJob.userKey)
+				self.totalSecondsInQueue += now - queuedJob.queuedAt
+				self._start(queuedJob.commandname, queuedJob.userKey, queuedJob.function, queuedJob.args)
+			else:
+				jobsToKeep.append(queuedJob)
+		self.queue = jobsToKeep
+
+	def _expireQueuedJob(self, queuedJob: _QueuedJob):
+		try:
+			self.queue.remove(queuedJob)
+		except ValueError:
+			#Job already got started or removed
+			return
+		self._decreaseCount(self.queuedJobsPerUser, queuedJob.userKey)
+		self.expiredJobCount += 1
+		self.totalSecondsInQueue += time.monotonic() - queuedJob.queuedAt
+		self.logger.debug("|CommandExecutor| '{}' job waited in the queue for more than {} seconds, rejecting it".format(queuedJob.commandname, self.maxSecondsInQueue))
+		if queuedJob.rejectionCallback:
+			queuedJob.rejectionCallback()
+
+	def getStatistics(self) -> Dict[str, Union[int, float, Dict[str, int]]]:
+		"""
+		Get statistics about the executor, to see whether the limits fit the load
+		:return: A dictionary with the number of running and queued jobs, the running jobs per command, the number of started, queued, rejected, and expired jobs, the maximum queue length, and the average number of seconds a queued job waited
+		"""
+		waitedJobCount = self.queuedJobCount - len(self.queue)
+		return {'activeWorkerCount': self.activeWorkerCount, 'maxWorkers': self.maxWorkers, 'queueLength': len(self.queue), 'maxQueueLength': self.maxObservedQueueLength,
+				'activeWorkersPerCommand': dict(self.activeWorkersPerCommand), 'startedJobCount': self.startedJobCount, 'queuedJobCount': self.queuedJobCount,
+				'rejectedJobCount': self.rejectedJobCount, 'expiredJobCount': self.expiredJobCount, 'averageSecondsInQueue': self.totalSecondsInQueue / waitedJobCount if waitedJobCount > 0 else 0.0}
@@ -0,0 +1,126 @@
+import collections, sys, time
+from typing import Any, Callable, Dict, Hashable, Union
+
+
+_NOT_CACHED = object()  # Returned when there's no valid cached result for a key
+
+
+def estimateSize(value: Any, _seenIds: set = None) -> int:
+	"""
+	Estimate how many bytes the provided value uses, including the contents of containers and the attributes of objects
+	This is an estimate, shared objects are only counted once and objects without a '__dict__' only count their own size
+	"""
+	if _seenIds is None:
+		_seenIds = set()
+	if id(value) in _seenIds:
+		return 0
+	_seenIds.add(id(value))
+	size = sys.getsizeof(value)
+	if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+		return size
+	if isinstance(value, dict):
+		for key, entry in value.items():
+			size += estimateSize(key, _seenIds) + estimateSize(entry, _seenIds)
+	elif isinstance(value, (list, tuple, set, frozenset)):
+		for entry in value:
+			size += estimateSize(entry, _seenIds)
+	elif hasattr(value, '__dict__'):
+		size += estimateSize(vars(value), _seenIds)
+	return size
+
+
+class CommandFunctionCache(object):
+	"""
+	Stores the results of a command function, so calling it again with the same arguments doesn't recompute the result
+	Entries expire after a set time, and the least recently used entries are removed when the cache holds too many entries or uses too much memory
+	Exceptions and None results aren't cached, since those usually mean the call failed, so it gets retried the next time
+	"""
+
+	def __init__(self, ttlInSeconds: float = None, maxEntries: int = 128, maxMemoryInBytes: int = None, keyFunction: Callable = None):
+		"""
+		:param ttlInSeconds: How many seconds a result stays valid. If None, results stay valid until they get pushed out or the cache gets cleared
+		:param maxEntries: How many results can be stored. If None, there is no limit on the number of entries
+		:param maxMemoryInBytes: How many bytes all the stored results can use together, estimated. If None, there is no limit on memory use
+		:param keyFunction: Gets called with the same arguments as the command function, and should return a hashable key for those arguments, or None if the result for those arguments shouldn't be cached (for instance because it's random)
+			If not provided, the arguments themselves are used as key, and the result isn't cached if the arguments aren't hashable
+		"""
+		self.ttlInSeconds = ttlInSeconds
+		self.maxEntries = maxEntries
+		self.maxMemoryInBytes = maxMemoryInBytes
+		self.keyFunction = keyFunction
+		self.entries = collections.OrderedDict()  # Keys are cache keys, values are (expirationTime, sizeInBytes, result) tuples. Ordered from least to most recently used
+		self.memoryInBytes = 0
+
+		#Statistics
+		self.hitCount = 0
+		self.missCount = 0
+		self.uncacheableCount = 0  # Calls that couldn't be cached because the key function returned None or the arguments weren't hashable
+		self.evictionCount = 0  # Entries removed because the cache was full
+		self.expirationCount = 0  # Entries removed because they were too old
+
+	def call(self, function: Callable, *args, **kwargs) -> Any:
+		"""
+		Return the cached result for the provided arguments if there is one, otherwise call the function and cache its result
+		"""
+		key = self._getKey(args, kwargs)
+		if key is None:
+			self.uncacheableCount += 1
+			return function(*args, **kwargs)
+		result = self._get(key)
+		if result is not _NOT_CACHED:
+			self.hitCount += 1
+			return result
+		self.missCount += 1
+		result = function(*args, **kwargs)
+		if result is not None:
+			self._set(key, result)
+		return result
+
+	def _getKey(self, args: tuple, kwargs: dict) -> Union[Hashable, None]:
+		if self.keyFunction:
+			return self.keyFunction(*args, **kwargs)
+		key = (args, tuple(sorted(kwargs.items())))
+		try:
+			hash(key)
+		except TypeError:
+			return None
+		return key
+
+	def _get(self, key: Hashable) -> Any:
+		entry = self.entries.get(key, None)
+		if entry is None:
+			return _NOT_CACHED
+		if entry[0] is not None and entry[0] <= time.monotonic():
+			self._remove(key)
+			self.expirationCount += 1
+			return _NOT_CACHED
+		self.entries.move_to_end(key)
+		return entry[2]
+
+	def _set(self, key: Hashable, result: Any):
+		size = estimateSize(result) if self.maxMemoryInBytes else 0
+		if self.maxMemoryInBytes and size > self.maxMemoryInBytes:
+			#Storing this would push out everything else and still not fit, so don't bother
+			return
+		if key in self.entries:
+			self._remove(key)
+		self.entries[key] = (time.monotonic() + self.ttlInSeconds if self.ttlInSeconds else None, size, result)
+		self.memoryInBytes += size
+		#Remove the least recently used entries until we're within the limits again
+		while (self.maxEntries and len(self.entries) > self.maxEntries) or (self.maxMemoryInBytes and self.memoryInBytes > self.maxMemoryInBytes):
+			self._remove(next(iter(self.entries)))
+			self.evictionCount += 1
+
+	def _remove(self, key: Hashable):
+		self.memoryInBytes -= self.entries.pop(key)[1]
+
+	def clear(self):
+		self.entries.clear()
+		self.memoryInBytes = 0
+
+	def getStatistics(self) -> Dict[str, Union[int, float, None]]:
+		"""
+		:return: A dictionary with the number of entries and their estimated memory use (only tracked if there's a memory limit), the limits, and the number of hits, misses, uncacheable calls, evictions, and expirations
+		"""
+		return {'entryCount': len(self.entries), 'maxEntries': self.maxEntries, 'memoryInBytes': self.memoryInBytes, 'maxMemoryInBytes': self.maxMemoryInBytes, 'ttlInSeconds': self.ttlInSeconds,
+				'hitCount': self.hitCount, 'missCount': self.missCount, 'uncacheableCount': self.uncacheableCount, 'evictionCount': self.evictionCount, 'expirationCount': self.expirationCount}
@@ -1,21 +1,41 @@
-import importlib, json, logging, os
-
-import gevent
+import ast, functools, importlib, json, logging, os, time
+from typing import FrozenSet, List, Union
 
 import GlobalStore
+from CommandExecutor import CommandExecutor
+from CommandFunctionCache import CommandFunctionCache
+from CommandRateLimiter import CommandRateLimiter
+from commands.CommandTemplate import CommandTemplate
 from CustomExceptions import CommandException
+from DideRobot import DideRobot
 from IrcMessage import IrcMessage
+from ProcessPool import ProcessPool
+from StartupProfiler import measureIfProfiling
 
 
 class CommandHandler:
 	commands = {}
 	commandFunctions = {}
 	apikeys = {}
+	#Indexes to quickly find the commands that could be interested in a message, instead of asking every loaded command
+	commandnamesByTrigger = {}  #Keys are triggers, values are lists of the names of the commands with that trigger
+	passiveListenerNamesByMessageType = {}  #Keys are message types, values are lists of the names of the passive listener commands interested in that message type. Commands interested in all message types are stored with 'None' as key
+	commandLoadOrder = {}  #Keys are command names, values are numbers that increase with each loaded command. Interested commands are asked in load order, like they would be when going through all commands
+	_loadCount = 0
+	SECONDS_BETWEEN_BUSY_NOTIFICATIONS = 30  #How long a user doesn't get told again that the bot is too busy to run their command, so those replies don't add to the load
+	allowedCommandNamesCache = {}  #Keys are bot serverfolders, values are a tuple of the bot's settings version and a dict with a channel (or None for server-wide) as key and a frozenset of the names of the commands allowed there as value. Cleared when the loaded commands change
 
 
 	def __init__(self):
 		self.logger = logging.getLogger("DideRobot")
 		GlobalStore.commandhandler = self
+		self.commandExecutor = CommandExecutor()  #Runs the commands that have 'callInThread' set, limiting how many run at the same time
+		self.commandRateLimiter = CommandRateLimiter()  #Limits how often users and channels can call commands, so nobody can keep the bot busy
+		self.busyNotificationEndTimes = {}  #Keys are user keys, values are the monotonic time until which that user doesn't need to be told again that the bot is too busy
+		self.processPool = None  #If worker processes are enabled, this is a ProcessPool that CPU-heavy functions can be run in, so they don't block the bots
+		self.shouldLoadCommandsLazily = False  #If True, commands that only react to their triggers are only loaded the first time one of their triggers is used, which makes starting up faster
+		self.lazyCommandnamesByTrigger = {}  #Keys are triggers of commands that haven't been loaded yet because of lazy loading, values are the name of the command with that trigger
+		self.lazyCommandFolders = {}  #Keys are the names of commands that haven't been loaded yet because of lazy loading, values are the folder they're in
 		self.loadApiKeys()
 
 	def loadApiKeys(self):
@@ -51,7 +71,7 @@ class CommandHandler:
 			apiKey = None
 		return apiKey
 
-	def addCommandFunction(self, module, name, function):
+	def addCommandFunction(self, module, name, function, runInProcess=False, cacheTtl=None, cacheMaxEntries=None, cacheMaxMemory=None, cacheKeyFunction=None):
 		"""
 		Add a global function available to all commands thorugh 'CommandHandler.runCommandFunction'
 		Usually called in the 'onLoad' of a command
@@ -59,13 +79,21 @@ class CommandHandler:
 		:param module: The name of the module, usually '__file__' in the command class. This is needed to automatically remove the command function when the command module gets unloaded
 		:param name: The name of the command function. This is the string other command modules have to use with 'runCommandFunction'. Not case-sensitive
 		:param function: The local function inside the command module that 'runCommandFunction' should call when the name is called
+		:param runInProcess: If True and worker processes are enabled, the function is run in a worker process, so CPU-heavy functions don't block the bots. The function then has to be a static method or module-level function, and its arguments and result have to be picklable
+		:param cacheTtl: If this or one of the other cache parameters is set, results of the function are cached, so calls with the same arguments don't recompute them. This sets for how many seconds a result stays valid
+		:param cacheMaxEntries: How many results can be cached. Defaults to 128 if caching is enabled
+		:param cacheMaxMemory: How many bytes the cached results can use together, estimated. No limit if not set
+		:param cacheKeyFunction: Gets called with the same arguments as the function, and should return a hashable key for the cache, or None if that call shouldn't be cached. If not set, the arguments are used as key
 		:return: True if the adding succeeded, False otherwise (for instance if the name already exists)
 		"""
 		name = name.lower()
 		if name in self.commandFunctions:
 			self.logger.warning("Trying to add a commandFuction called '{}' but it already exists".format(name))
 			return False
-		self.commandFunctions[name] = {'module': os.path.basename(module).split('.', 1)[0], 'function': function}
+		cache = None
+		if cacheTtl or cacheMaxEntries or cacheMaxMemory or cacheKeyFunction:
+			cache = CommandFunctionCache(cacheTtl, cacheMaxEntries or 128, cacheMaxMemory, cacheKeyFunction)
+		self.commandFunctions[name] = {'module': os.path.basename(module).split('.', 1)[0], 'function': function, 'runInProcess': runInProcess, 'cache': cache}
 		self.logger.info("Adding command function '{}' from module '{}'".format(name, self.commandFunctions[name]['module']))
 		return True
 
@@ -105,7 +133,50 @@ class CommandHandler:
 		if name not in self.commandFunctions:
 			self.logger.warning("Unknown commandFunction '{}' called".format(name))
 			return defaultValue
-		return self.commandFunctions[name]['function'](*args, **kwargs)
+		commandFunction = self.commandFunctions[name]
+		if commandFunction['cache']:
+			return commandFunction['cache'].call(functools.partial(self._callCommandFunction, commandFunction), *args, **kwargs)
+		return self._callCommandFunction(commandFunction, *args, **kwargs)
+
+	def _callCommandFunction(self, commandFunction, *args, **kwargs):
+		if commandFunction['runInProcess'] and self.processPool:
+			return self.processPool.run(commandFunction['function'], *args, **kwargs)
+		return commandFunction['function'](*args, **kwargs)
+
+	def clearCommandFunctionCache(self, name=None):
+		"""
+		Remove the cached results of the provided command function, for instance because the data it uses changed
+		:param name: The name of the command function to clear the cache of. If not provided, the caches of all command functions are cleared
+		:return: The number of cached results that were removed
+		"""
+		removedCount = 0
+		for functionName, commandFunction in self.commandFunctions.items():
+			if commandFunction['cache'] and (name is None or functionName == name.lower()):
+				removedCount += len(commandFunction['cache'].entries)
+				commandFunction['cache'].clear()
+		return removedCount
+
+	def getCommandFunctionCacheStatistics(self):
+		"""
+		:return: A dict with the names of the command functions that have caching enabled as keys, and the statistics of their cache as values
+		"""
+		return {name: commandFunction['cache'].getStatistics() for name, commandFunction in self.commandFunctions.items() if commandFunction['cache']}
+
+	def startProcessPool(self, workerCount: int):
+		"""
+		Start worker processes that CPU-heavy functions can be run in, see the 'runInProcess' parameter of 'addCommandFunction' and the 'runInProcess' method of CommandTemplate
+		:param workerCount: The number of worker processes to start
+		"""
+		if self.processPool:
+			self.processPool.stop()
+		self.logger.info("Starting {} worker processes".format(workerCount))
+		self.processPool = ProcessPool(workerCount)
+
+	def stopProcessPool(self):
+		if self.processPool:
+			self.logger.info("Stopping worker processes")
+			self.processPool.stop()
+			self.processPool = None
 
 	def handleMessage(self, message):
 		"""
@@ -115,23 +186,76 @@ class CommandHandler:
 		if message.bot.shouldUserBeIgnored(message.user, message.userNickname, message.userAddress):
 			return
 
-		#Then check whether any of our loaded commands need to react to this message
-		settingSource = None if message.isPrivateMessage else message.source
-		for commandname, command in self.getCommandsIterator(message.bot, settingSource):
+		#If the trigger belongs to a command that hasn't been loaded yet, load it now. Only do that if the command would actually react, so normal traffic like quit messages or blocked commands doesn't load it
+		#  Lazily loaded commands use the default message types, see 'getLazyLoadTriggers'
+		if message.trigger and message.trigger in self.lazyCommandnamesByTrigger and message.messageType in CommandTemplate.allowedMessageTypes:
+			lazyCommandname = self.lazyCommandnamesByTrigger[message.trigger]
+			if self.isCommandAllowedForBot(message.bot, lazyCommandname, None if message.isPrivateMessage else message.source):
+				self.loadLazyCommand(lazyCommandname)
+
+		#Then check whether any of our loaded commands need to react to this message. Only ask the commands that have the message's trigger, and the passive listeners interested in this type of message
+		#  Copy the names, since a command could (re)load or unload commands, which changes the indexes
+		triggerCommandNames = self.commandnamesByTrigger.get(message.trigger, None) if message.trigger else None
+		passiveListenerNames = self.passiveListenerNamesByMessageType.get(message.messageType, None)
+		allTypesListenerNames = self.passiveListenerNamesByMessageType.get(None, None)
+		if passiveListenerNames or allTypesListenerNames:
+			interestedCommandnames = (triggerCommandNames or []) + (passiveListenerNames or []) + (allTypesListenerNames or [])
+			interestedCommandnames.sort(key=self.commandLoadOrder.__getitem__)
+		elif triggerCommandNames:
+			interestedCommandnames = list(triggerCommandNames)
+		else:
+			return
+		allowedCommandNames = self.getAllowedCommandNames(message.bot, None if message.isPrivateMessage else message.source)
+		for commandname in interestedCommandnames:
+			command = self.commands.get(commandname, None)
+			if command is None:
+				continue
+			if command.passiveListenerNeedsUrl and 'http://' not in message.message and 'https://' not in message.message:
+				continue
+			if command.passiveListenerTriggerFilter is not None and command.passiveListenerTriggerFilter != bool(message.trigger):
+				continue
+			if commandname not in allowedCommandNames:
+				continue
 			if command.shouldExecute(message):
 				if command.minPermissionLevel and not message.doesSenderHavePermission(command.minPermissionLevel):
 					message.reply("Sorry, this command can only be used by {}s".format(command.minPermissionLevel))
+				#Only rate-limit calls through a trigger, passive listeners react to normal chat and shouldn't use up the user's allowance
+				elif message.trigger and message.trigger in command.triggers and not self.commandRateLimiter.isAllowed(message, commandname, command.rateLimitCost):
+					#The trigger call is skipped, but commands that also do passive work on every message (like delivering waiting tells) should still get to do that
+					if type(command).executeWhenRateLimited is not CommandTemplate.executeWhenRateLimited:
+						self.executeCommand(commandname, message, True)
+					continue
 				else:
 					if command.callInThread:
-						gevent.spawn(self.executeCommand, commandname, message)
+						#Only tell the user their job got dropped if they explicitly called the command, passive listeners shouldn't speak up unasked, especially not when the bot is already overloaded
+						rejectionCallback = functools.partial(self._notifyTooBusy, message) if message.trigger and message.trigger in command.triggers else None
+						self.commandExecutor.submit(commandname, (message.bot.serverfolder, message.userAddress or message.user), self.executeCommand, (commandname, message), rejectionCallback, command.maxConcurrentExecutions)
 					else:
 						self.executeCommand(commandname, message)
 					if command.stopAfterThisCommand:
 						break
 
-	def executeCommand(self, commandname, message):
+	def _notifyTooBusy(self, message):
+		"""
+		Tell the sender of the provided message that their command couldn't be run because the bot is too busy, but only once per user every so often, so the notifications don't flood the channel
+		:type message: IrcMessage
+		"""
+		userKey = (message.bot.serverfolder, message.userAddress or message.user)
+		now = time.monotonic()
+		if self.busyNotificationEndTimes.get(userKey, 0) > now:
+			return
+		#Don't let the notification times of users that stopped calling commands pile up
+		if len(self.busyNotificationEndTimes) >= 1000:
+			self.busyNotificationEndTimes = {storedUserKey: endTime for storedUserKey, endTime in self.busyNotificationEndTimes.items() if endTime > now}
+		self.busyNotificationEndTimes[userKey] = now + self.SECONDS_BETWEEN_BUSY_NOTIFICATIONS
+		message.reply("Sorry, I'm too busy to handle that right now, please try again in a bit")
+
+	def executeCommand(self, commandname, message, wasRateLimited=False):
 		try:
-			self.commands[commandname].execute(message)
+			if wasRateLimited:
+				self.commands[commandname].executeWhenRateLimited(message)
+			else:
+				self.commands[commandname].execute(message)
 		except Exception as e:
 			displayMessage = "Sorry, an error occurred while executing this command. It has been logged, and if you tell my owner(s), they could probably fix it"
 			shouldLogError = True
@@ -149,9 +273,11 @@ class CommandHandler:
 			if shouldLogError:
 				self.logger.error("{} exception thrown while handling command '{}' and message '{}': {}".format(type(e).__name__, commandname, message.rawText, str(e)), exc_info=shouldLogStacktrace)
 
-	@staticmethod
-	def isCommandAllowedForBot(bot, commandname: str, channel: str = None, allowlist = None, blocklist = None):
+	@classmethod
+	def isCommandAllowedForBot(cls, bot, commandname: str, channel: str = None, allowlist = None, blocklist = None):
 		if allowlist is None and blocklist is None:
+			if commandname in cls.commands:
+				return commandname in cls.getAllowedCommandNames(bot, channel)
 			allowlist, blocklist = bot.getCommandAllowAndBlockLists(channel)
 		if allowlist and commandname not in allowlist:
 			return False
@@ -159,40 +285,206 @@ class CommandHandler:
 			return False
 		return True
 	
+	@classmethod
+	def getAllowedCommandNames(cls, bot, channel: str = None) -> FrozenSet[str]:
+		"""
+		Get the names of the loaded commands that are allowed for the provided bot and optionally the provided channel
+		The result is cached, so this doesn't need to check the allow- and blocklists on every call. The cache is rebuilt when the bot's settings version changes or when commands get (un)loaded
+		:param bot: The bot instance to get the allowed command names for
+		:param channel: The channel to get the allowed command names for. If omitted, or if no channel-specific allow- or blocklist is set for the provided channel, the command names allowed for the server are returned
+		:return: A frozenset with the names of the allowed commands
+		"""
+		settingsVersion, allowedCommandNamesPerChannel = cls.allowedCommandNamesCache.get(bot.serverfolder, (None, None))
+		if settingsVersion != bot.settings.version:
+			allowedCommandNamesPerChannel = {}
+			cls.allowedCommandNamesCache[bot.serverfolder] = (bot.settings.version, allowedCommandNamesPerChannel)
+		allowedCommandNames = allowedCommandNamesPerChannel.get(channel, None)
+		if allowedCommandNames is None:
+			allowlist, blocklist = bot.getCommandAllowAndBlockLists(channel)
+			allowedCommandNames = frozenset(commandname for commandname in cls.commands if (not allowlist or commandname in allowlist) and (not blocklist or commandname not in blocklist))
+			allowedCommandNamesPerChannel[channel] = allowedCommandNames
+		return allowedCommandNames
+
+	@classmethod
+	def clearAllowedCommandNamesCache(cls, serverfolder: str = None):
+		"""
+		Clear the cached allowed command names, so they get determined again the next time they're needed
+		:param serverfolder: The serverfolder of the bot to clear the cache for. If omitted, the cache gets cleared for all bots
+		"""
+		if serverfolder is None:
+			cls.allowedCommandNamesCache.clear()
+		else:
+			cls.allowedCommandNamesCache.pop(serverfolder, None)
+
 	def loadCommands(self, folder='commands'):
 		modulesToIgnore = ('__init__.py', 'CommandTemplate.py')
 		commandsWithErrors = []
-		self.logger.info("Loading commands from subfolder '{}'".format(folder))
+		self.logger.info("Loading commands from subfolder '{}'{}".format(folder, " lazily" if self.shouldLoadCommandsLazily else ""))
+		if self.shouldLoadCommandsLazily:
+			lazyLoadManifest = self.loadLazyLoadManifest()
+			lazyLoadManifestChanged = False
 		for commandFile in os.listdir(os.path.join(GlobalStore.scriptfolder, folder)):
 			if not commandFile.endswith(".py"):
 				continue
 			commandName = commandFile[:-3]
 			if commandFile in modulesToIgnore or commandName in modulesToIgnore:
 				continue
+			if self.shouldLoadCommandsLazily:
+				#Scanning the source code is relatively slow, so use the scan result stored in the manifest file if the command file didn't change since then
+				commandFilePath = os.path.join(GlobalStore.scriptfolder, folder, commandFile)
+				commandFileStat = os.stat(commandFilePath)
+				manifestKey = folder + '/' + commandFile
+				manifestEntry = lazyLoadManifest.get(manifestKey, None)
+				if manifestEntry and manifestEntry['modifiedAt'] == commandFileStat.st_mtime_ns and manifestEntry['size'] == commandFileStat.st_size:
+					lazyLoadTriggers = manifestEntry['triggers']
+				else:
+					lazyLoadTriggers = self.getLazyLoadTriggers(commandFilePath)
+					lazyLoadManifest[manifestKey] = {'modifiedAt': commandFileStat.st_mtime_ns, 'size': commandFileStat.st_size, 'triggers': lazyLoadTriggers}
+					lazyLoadManifestChanged = True
+				if lazyLoadTriggers:
+					self.lazyCommandFolders[commandName] = folder
+					for trigger in lazyLoadTriggers:
+						self.lazyCommandnamesByTrigger[trigger] = commandName
+					continue
 			try:
 				self.loadCommand(commandName, folder)
 			except CommandException:
 				commandsWithErrors.append(commandName)
+		if self.shouldLoadCommandsLazily and lazyLoadManifestChanged:
+			self.saveLazyLoadManifest(lazyLoadManifest)
 		return commandsWithErrors
+
+	@staticmethod
+	def loadLazyLoadManifest():
+		"""
+		Load the stored results of checking which command modules can be loaded lazily
+		:return: A dict with the folder and filename of command modules as keys, and as values a dict with the modification time and size of the file when it was scanned, and the 'getLazyLoadTriggers' result
+		"""
+		manifestPath = os.path.join(GlobalStore.scriptfolder, 'data', 'CommandManifest.json')
+		if not os.path.isfile(manifestPath):
+			return {}
+		try:
+			with open(manifestPath, 'r', encoding='utf-8') as manifestFile:
+				return json.load(manifestFile)
+		except ValueError:
+			return {}
+
+	def saveLazyLoadManifest(self, lazyLoadManifest):
+		try:
+			with open(os.path.join(GlobalStore.scriptfolder, 'data', 'CommandManifest.json'), 'w', encoding='utf-8') as manifestFile:
+				json.dump(lazyLoadManifest, manifestFile)
+		except OSError as e:
+			self.logger.warning("Unable to save command manifest file: {}".format(e))
 		
+	@staticmethod
+	def getLazyLoadTriggers(commandFilePath: str) -> Union[None, List[str]]:
+		"""
+		Check from the source code of a command module whether it can be loaded lazily, without importing it
+		That's only possible if the command only reacts to its triggers, so it doesn't override 'shouldExecute' and has no scheduled function, and if no other module depends on it being loaded, so it doesn't register command functions or IRC message handlers
+		The command also has to react to the default message types, so it's clear from the message type alone whether a message could make the command execute
+		:param commandFilePath: The full path to the command module file
+		:return: The list of triggers of the command if it can be loaded lazily, or None if it should be loaded immediately
+		"""
+		with open(commandFilePath, 'r', encoding='utf-8') as commandFile:
+			commandSource = commandFile.read()
+		if 'addCommandFunction' in commandSource or 'addIrcMessageHandler' in commandSource:
+			return None
+		try:
+			moduleTree = ast.parse(commandSource, commandFilePath)
+		except SyntaxError:
+			#Let the normal loading handle and report this
+			return None
+		for node in moduleTree.body:
+			if isinstance(node, ast.ClassDef) and node.name == 'Command':
+				triggers = None
+				for classNode in node.body:
+					if isinstance(classNode, ast.FunctionDef) and classNode.name == 'shouldExecute':
+						return None
+					elif isinstance(classNode, ast.Assign) and len(classNode.targets) == 1 and isinstance(classNode.targets[0], ast.Name):
+						attributeName = classNode.targets[0].id
+						if attributeName == 'scheduledFunctionTime':
+							if not isinstance(classNode.value, ast.Constant) or classNode.value.value is not None:
+								return None
+						elif attributeName == 'allowedMessageTypes':
+							return None
+						elif attributeName == 'triggers':
+							try:
+								triggers = list(ast.literal_eval(classNode.value))
+							except ValueError:
+								return None
+				return triggers if triggers else None
+		return None
+
+	def loadLazyCommand(self, name: str):
+		"""
+		Load a command that wasn't loaded at startup because of lazy loading
+		:param name: The name of the command to load
+		"""
+		self.logger.info("Lazily loading command '{}' on first use".format(name))
+		try:
+			self.loadCommand(name, self.lazyCommandFolders[name])
+		except CommandException:
+			#Loading failed and got logged. Don't keep trying to load it on every use of its triggers
+			self._removeLazyCommand(name)
+
+	def loadLazyCommands(self):
+		"""Load all the commands that weren't loaded yet because of lazy loading, for instance because all the commands need to be listed"""
+		for commandname in list(self.lazyCommandFolders.keys()):
+			self.loadLazyCommand(commandname)
+
+	def _removeLazyCommand(self, name: str):
+		if self.lazyCommandFolders.pop(name, None):
+			for trigger in [trigger for trigger, commandname in self.lazyCommandnamesByTrigger.items() if commandname == name]:
+				del self.lazyCommandnamesByTrigger[trigger]
+
 	def loadCommand(self, name, folder='commands'):
 		self.logger.info("Loading command '{}.{}".format(folder, name))
+		self._removeLazyCommand(name)
 		commandFilename = os.path.join(GlobalStore.scriptfolder, folder, name + '.py')
 		if not os.path.exists(commandFilename):
 			self.logger.warning("File '{}' does not exist, aborting".format(commandFilename))
 			raise CommandException("File '{}' does not exist".format(name))
 		try:
-			loadedModule = importlib.import_module(folder + '.' + name)
-			#Since the module may already have been loaded in the past, make sure we have the latest version
-			importlib.reload(loadedModule)
-			command = loadedModule.Command()
+			with measureIfProfiling('command import', name):
+				loadedModule = importlib.import_module(folder + '.' + name)
+				#Since the module may already have been loaded in the past, make sure we have the latest version
+				importlib.reload(loadedModule)
+			with measureIfProfiling('command onLoad', name):
+				command = loadedModule.Command()
 			self.commands[name] = command
+			self._indexCommand(name, command)
+			self.clearAllowedCommandNamesCache()
 			return command
 		except Exception as e:
 			exceptionName = e.__class__.__name__
 			self.logger.error("A {} error occurred while trying to load command '{}': {}".format(exceptionName, name, e), exc_info=True)
 			raise CommandException("{} exception occurred while loading command '{}'".format(exceptionName, name))
 
+	def _indexCommand(self, name, command):
+		"""
+		Add the provided command to the indexes 'handleMessage' uses to find the commands that could be interested in a message
+		Commands that don't override 'shouldExecute' are indexed by their triggers, commands that do are stored as passive listeners, indexed by the message types they're interested in
+		"""
+		CommandHandler._loadCount += 1
+		self.commandLoadOrder[name] = CommandHandler._loadCount
+		if type(command).shouldExecute is CommandTemplate.shouldExecute:
+			for trigger in command.triggers:
+				self.commandnamesByTrigger.setdefault(trigger, []).append(name)
+		elif command.passiveListenerMessageTypes is None:
+			self.passiveListenerNamesByMessageType.setdefault(None, []).append(name)
+		else:
+			for messageType in command.passiveListenerMessageTypes:
+				self.passiveListenerNamesByMessageType.setdefault(messageType, []).append(name)
+
+	def _removeCommandFromIndexes(self, name):
+		for index in (self.commandnamesByTrigger, self.passiveListenerNamesByMessageType):
+			for key in list(index.keys()):
+				if name in index[key]:
+					index[key].remove(name)
+					if not index[key]:
+						del index[key]
+		self.commandLoadOrder.pop(name, None)
+
 	def unloadCommand(self, name, folder='commands'):
 		fullname = "{}.{}".format(folder, name)
 		self.logger.info("Unloading module '{}'".format(fullname))
@@ -204,6 +496,11 @@ class CommandHandler:
 			self.commands[name].unload()
 			#And remove the reference to it
 			del self.commands[name]
+			self._removeCommandFromIndexes(name)
+			self.clearAllowedCommandNamesCache()
+			#The worker processes could have the old version of the module loaded, make sure they get restarted
+			if self.processPool:
+				self.processPool.restartWorkers()
 			#Check if any registered command functions belong to this module
 			functionsToRemove = []
 			for funcName in self.commandFunctions.keys():
@@ -212,7 +509,14 @@ class CommandHandler:
 			if len(functionsToRemove) > 0:
 				self.logger.info("Removing {} registered command functions".format(len(functionsToRemove)))
 				for funcToRemove in functionsToRemove:
+					#Clear the cache too, in case something else still holds a reference to it
+					if self.commandFunctions[funcToRemove]['cache']:
+						self.commandFunctions[funcToRemove]['cache'].clear()
 					del self.commandFunctions[funcToRemove]
+			#Also remove any IRC message handlers this module registered
+			removedHandlerCount = DideRobot.removeIrcMessageHandlersForModule(name)
+			if removedHandlerCount > 0:
+				self.logger.info("Removed {} registered IRC message handlers".format(removedHandlerCount))
 		except Exception as e:
 			exceptionName = e.__class__.__name__
 			self.logger.error("A {}error occurred while trying to unload '{}': {}".format(exceptionName, name, e), exc_info=True)
@@ -244,7 +548,10 @@ class CommandHandler:
 		:param channel: The channel to get the allowed commands for. If omitted, or if no channel-specific allow- or blocklist is set for the provided channel, the commands allowed for the server are returned
 		:return: An iterator returning commandname-commandobject pairs for the allowed commands for the bot and optionally the channel
 		"""
-		allowlist, blocklist = bot.getCommandAllowAndBlockLists(channel)
+		#Make sure commands that would be loaded on first use are included too
+		if self.lazyCommandFolders:
+			self.loadLazyCommands()
+		allowedCommandNames = self.getAllowedCommandNames(bot, channel)
 		for commandname, command in self.commands.items():
-			if self.isCommandAllowedForBot(bot, commandname, allowlist=allowlist, blocklist=blocklist):
+			if commandname in allowedCommandNames:
 				yield commandname, command
@@ -0,0 +1,155 @@
+import logging, time
+from typing import Dict, Hashable, Union
+
+import PermissionLevel
+from util.RateLimitUtil import TokenBucket
+
+
+class _RateLimits(object):
+	"""The rate limits of a single bot, as read from its settings. The capacities are how many tokens can be used in a burst, the refill rates are how many tokens per second become available again"""
+	__slots__ = ('userCapacity', 'userRefillRate', 'channelCapacity', 'channelRefillRate', 'userCommandCapacity', 'userCommandRefillRate', 'exemptPermissionLevel')
+
+	def __init__(self, userCapacity: float, userRefillRate: float, channelCapacity: float, channelRefillRate: float, userCommandCapacity: float, userCommandRefillRate: float,
+				 exemptPermissionLevel: Union[PermissionLevel.PermissionLevel, None]):
+		self.userCapacity = userCapacity
+		self.userRefillRate = userRefillRate
+		self.channelCapacity = channelCapacity
+		self.channelRefillRate = channelRefillRate
+		self.userCommandCapacity = userCommandCapacity
+		self.userCommandRefillRate = userCommandRefillRate
+		self.exemptPermissionLevel = exemptPermissionLevel  # Users with at least this permission level aren't limited. None if everybody should be limited
+
+
+class CommandRateLimiter(object):
+	"""
+	Limits how often commands can be called, per user, per channel, and per user per command, so a single user or a flooding channel can't keep the bot busy with expensive commands
+	Each of those has a token bucket, and calling a command takes the command's 'rateLimitCost' number of tokens from all of the relevant buckets
+	The bucket sizes, refill rates, and exempt permission level are read from each bot's settings, see the README for the setting names
+	"""
+
+	#Keys are the names of the settings, values are the defaults used if a setting isn't set
+	DEFAULT_LIMITS = {'commandRateLimitUserCapacity': 10, 'commandRateLimitUserRefillRate': 0.5,
+					  'commandRateLimitChannelCapacity': 20, 'commandRateLimitChannelRefillRate': 0.5,
+					  'commandRateLimitUserCommandCapacity': 6, 'commandRateLimitUserCommandRefillRate': 0.2}
+	DEFAULT_EXEMPT_LEVEL = 'channel'
+	EXEMPT_LEVELS_BY_NAME = {'channel': PermissionLevel.CHANNEL, 'server': PermissionLevel.SERVER, 'bot': PermissionLevel.BOT, 'none': None}
+
+	def __init__(self):
+		self.logger = logging.getLogger('DideRobot')
+		self.limitsByServer = {}  # Keys are bot serverfolders, values are a tuple of the bot's settings version and a _RateLimits instance with the limits from that bot's settings
+
+		self.bucketsByUser = {}  # Keys are user keys, values are TokenBuckets
+		self.bucketsByChannel = {}  # Keys are channel keys, values are TokenBuckets
+		self.bucketsByUserAndCommand = {}  # Keys are (userKey, commandname) tuples, values are TokenBuckets
+		self.backOffNotificationEndTimes = {}  # Keys are user keys, values are the monotonic time until which that user doesn't need to be told again to slow down
+		self._checkCountSinceCleanup = 0
+
+		#Statistics
+		self.allowedCount = 0
+		self.limitedCount = 0
+		self.exemptCount = 0  # Calls that would have been limited but were allowed because the user has the exempt permission level
+
+	def getLimits(self, bot) -> _RateLimits:
+		"""
+		Get the rate limits from the provided bot's settings. These are cached until the bot's settings change
+		If the settings did change, the buckets of that bot are removed, so new buckets with the new limits get created
+		"""
+		settingsVersion, limits = self.limitsByServer.get(bot.serverfolder, (None, None))
+		if settingsVersion != bot.settings.version:
+			limitValues = {}
+			for settingName, defaultValue in self.DEFAULT_LIMITS.items():
+				limitValue = bot.settings.get(settingName, defaultValue)
+				if not isinstance(limitValue, (int, float)) or isinstance(limitValue, bool):
+					self.logger.warning("|{}| Rate limit setting '{}' should be a number but is '{}', using the default of {}".format(bot.serverfolder, settingName, limitValue, defaultValue))
+					limitValue = defaultValue
+				limitValues[settingName] = limitValue
+			exemptLevelName = bot.settings.get('commandRateLimitExemptLevel', self.DEFAULT_EXEMPT_LEVEL)
+			exemptLevelName = str(exemptLevelName).lower() if exemptLevelName is not None else 'none'
+			if exemptLevelName not in self.EXEMPT_LEVELS_BY_NAME:
+				self.logger.warning("|{}| Unknown rate limit exempt level '{}', should be one of {}. Using the default of '{}'".format(bot.serverfolder, exemptLevelName, ", ".join(self.EXEMPT_LEVELS_BY_NAME), self.DEFAULT_EXEMPT_LEVEL))
+				exemptLevelName = self.DEFAULT_EXEMPT_LEVEL
+			limits = _RateLimits(limitValues['commandRateLimitUserCapacity'], limitValues['commandRateLimitUserRefillRate'],
+								 limitValues['commandRateLimitChannelCapacity'], limitValues['commandRateLimitChannelRefillRate'],
+								 limitValues['commandRateLimitUserCommandCapacity'], limitValues['commandRateLimitUserCommandRefillRate'],
+								 self.EXEMPT_LEVELS_BY_NAME[exemptLevelName])
+			if settingsVersion is not None:
+				self.removeBucketsForServer(bot.serverfolder)
+			self.limitsByServer[bot.serverfolder] = (bot.settings.version, limits)
+		return limits
+
+	def isAllowed(self, message, commandname: str, cost: float) -> bool:
+		"""
+		Check whether the sender of the provided message is allowed to call the provided command right now, and if so, take the command's cost from the relevant buckets
+		If the user isn't allowed, they get told how long to wait, but only once per wait, so the back-off replies don't become spam themselves
+		:type message: IrcMessage
+		:param commandname: The name of the command that's being called
+		:param cost: How many tokens calling the command costs. If it's 0 or lower, the call is always allowed
+		:return: True if the command is allowed to run, False if it should be skipped
+		"""
+		if cost <= 0:
+			return True
+		self._checkCountSinceCleanup += 1
+		if self._checkCountSinceCleanup >= 1000:
+			self.removeUnusedBuckets()
+		limits = self.getLimits(message.bot)
+		userKey = (message.bot.serverfolder, message.userAddress or message.user)
+		#A capacity of 0 or lower disables that limit
+		buckets = []
+		if limits.userCapacity > 0:
+			buckets.append(self._getBucket(self.bucketsByUser, userKey, limits.userCapacity, limits.userRefillRate))
+		if limits.userCommandCapacity > 0:
+			buckets.append(self._getBucket(self.bucketsByUserAndCommand, (userKey, commandname), limits.userCommandCapacity, limits.userCommandRefillRate))
+		if not message.isPrivateMessage and limits.channelCapacity > 0:
+			buckets.append(self._getBucket(self.bucketsByChannel, (message.bot.serverfolder, message.source), limits.channelCapacity, limits.channelRefillRate))
+		if not buckets:
+			self.allowedCount += 1
+			return True
+		#Only take tokens if all the buckets have enough, otherwise a limited call would still use up the tokens of the buckets that did have enough
+		secondsUntilAllowed = max(bucket.getSecondsUntilAvailable(min(cost, bucket.capacity)) for bucket in buckets)
+		if secondsUntilAllowed <= 0:
+			for bucket in buckets:
+				bucket.tryConsume(min(cost, bucket.capacity))
+			self.allowedCount += 1
+			return True
+		#Only check permissions when the limit is reached, since that's rare and checking permissions is relatively slow
+		if limits.exemptPermissionLevel and message.doesSenderHavePermission(limits.exemptPermissionLevel):
+			self.exemptCount += 1
+			return True
+		self.limitedCount += 1
+		now = time.monotonic()
+		if self.backOffNotificationEndTimes.get(userKey, 0) <= now:
+			self.backOffNotificationEndTimes[userKey] = now + secondsUntilAllowed
+			message.reply("Slow down a little please, try again in {:.0f} second{}".format(secondsUntilAllowed, '' if round(secondsUntilAllowed) == 1 else 's'))
+		self.logger.debug("|CommandRateLimiter| Not running '{}' for '{}' in '{}', rate limit reached".format(commandname, message.userNickname, message.source))
+		return False
+
+	@staticmethod
+	def _getBucket(bucketDict: dict, key: Hashable, capacity: float, refillRate: float) -> TokenBucket:
+		bucket = bucketDict.get(key, None)
+		if bucket is None:
+			bucket = TokenBucket(capacity, refillRate)
+			bucketDict[key] = bucket
+		return bucket
+
+	def removeUnusedBuckets(self):
+		"""Remove the buckets that are full again, since those behave the same as new buckets. That keeps the bucket dictionaries from growing with every user the bot ever saw"""
+		self._checkCountSinceCleanup = 0
+		for bucketDict in (self.bucketsByUser, self.bucketsByChannel, self.bucketsByUserAndCommand):
+			for key in [key for key, bucket in bucketDict.items() if bucket.isFull()]:
+				del bucketDict[key]
+		now = time.monotonic()
+		for userKey in [userKey for userKey, endTime in self.backOffNotificationEndTimes.items() if endTime <= now]:
+			del self.backOffNotificationEndTimes[userKey]
+
+	def removeBucketsForServer(self, serverfolder: str):
+		"""Remove all the buckets of the provided server, for instance because its rate limits changed"""
+		for key in [key for key in self.bucketsByUser if key[0] == serverfolder]:
+			del self.bucketsByUser[key]
+		for key in [key for key in self.bucketsByChannel if key[0] == serverfolder]:
+			del self.bucketsByChannel[key]
+		for key in [key for key in self.bucketsByUserAndCommand if key[0][0] == serverfolder]:
+			del self.bucketsByUserAndCommand[key]
+
+	def getStatistics(self) -> Dict[str, Union[int, float]]:
+		return {'allowedCount': self.allowedCount, 'limitedCount': self.limitedCount, 'exemptCount': self.exemptCount,
+				'userBucketCount': len(self.bucketsByUser), 'channelBucketCount': len(self.bucketsByChannel), 'userCommandBucketCount': len(self.bucketsByUserAndCommand)}
@@ -1,6 +1,9 @@
 CTCP_DELIMITER = chr(1)
 MAX_LINE_LENGTH = 510  # Officially 512 bytes, but lines always end with '\r\n', so subtract 2
+RECEIVE_BUFFER_SIZE = 16384  # The initial size in bytes of the buffer incoming data from the server gets read into. Big enough to fit multiple full lines, so bursts of lines need fewer reads
 MAX_MESSAGE_LENGTH = 325  # The maximum number of characters in message to send. Message format is ':[nick,32]![username,12]@[hostmask,64] PRIVMSG [target,64] :[messagetext]', which leaves 326 characters for messagetext, round it down a bit to be safe
+#The IRCv3 capabilities we ask the server for, if it supports them. These let us keep track of channel users from NAMES replies and JOIN messages, instead of needing a WHO request per channel
+REQUESTED_CAPABILITIES = ('multi-prefix', 'userhost-in-names', 'extended-join', 'away-notify', 'chghost')
 CHANNEL_PREFIXES = "#&!+.~"  #All the characters that could possibly indicate something is a channel name (usually just '#' though)
 #Since a grey separator is often used to separate parts of a message, provide an easy way to get one
 GREY_SEPARATOR = ' \x0314|\x03 '  #'\x03' is the 'color' control char, 14 is the colour code for grey
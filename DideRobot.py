@@ -1,4 +1,7 @@
+import collections
 import logging
+import os
+import re
 import time
 from typing import List, Tuple, Union
 
@@ -8,7 +11,11 @@ import gevent.socket
 import Constants
 import GlobalStore
 from BotSettingsManager import BotSettingsManager
+from ChannelMembership import ChannelMembership, ChannelsUserListView
+from HostmaskMatcher import HostmaskMatcher
+import IrcLine
 from IrcMessage import IrcMessage
+import LineScheduler
 from MessageLogger import MessageLogger
 import MessageTypes
 import PermissionLevel
@@ -16,17 +23,41 @@ from util import IrcFormattingUtil, StringUtil
 
 
 class DideRobot(object):
+	_WHOX_TOKEN = '152'  # Sent along with our WHOX requests, so we can recognise the replies to them
+	#Tables mapping IRC message types and CTCP types to a tuple of functions that handle them. Built once per class, see '_buildMessageHandlerTables'
+	_ircMessageHandlers = None
+	_ctcpMessageHandlers = None
+	#Handlers for IRC message types added by modules through 'addIrcMessageHandler'. Keys are message types, values are lists of (modulename, function) tuples
+	_extraIrcMessageHandlers = {}
+
 	def __init__(self, serverfolder):
 		self.logger = logging.getLogger('DideRobot')
 		self.logger.info("New bot for server '{}' created".format(serverfolder))
+		if type(self).__dict__.get('_ircMessageHandlers', None) is None:
+			type(self)._buildMessageHandlerTables()
 
 		#Initialize some variables (in init() instead of outside it to prevent object sharing between instances)
 		self.serverfolder = serverfolder
 		self.ircSocket = None
+		self._nickname = None
+		self.nicknameAddressRegex = None  # Matches text that addresses us by starting with our nickname, like 'DideRobot: help'. Gets updated whenever our nickname changes
 		self.nickname = None  # Will get set once we connect, when we know if we have the nickname we want
-		self.channelsUserList = {}  # Will be a dict with joined channels as keys and a list of users in those channels as values
+		self.userAddress = None  # The 'user@host' part of our full user address, as the server shows it to others. Gets set once the server tells us, 'None' until then
+		self.serverSupport = {}  # The features the server supports, as reported by the server in RPL_ISUPPORT messages. Keys are the feature names, values the (possibly empty) feature values
+		self.maxLineLength = Constants.MAX_LINE_LENGTH  # The maximum length in bytes of a line, without the line ending. Can be changed by the server through RPL_ISUPPORT
+		self.maxTargetsPerCommand = {}  # How many targets commands like PRIVMSG can have at once, as reported by the server in RPL_ISUPPORT. 'None' means unlimited, missing commands only support one target
+		self.channelMembership = ChannelMembership()  # Keeps track of the channels we're in and the users in them
+		self.channelsUserList = ChannelsUserListView(self.channelMembership)  # A read-only dict-like view with joined channels as keys and a tuple of the addresses of the users in those channels as values
 		self.isUpdatingChannelsUserList = False
+		self.channelsAwaitingUserRetrieval = collections.deque()  # The channels we still need to send a WHO request for. These are sent one at a time, so we don't get flooded with replies
+		self.channelRetrievingUsersFor = None  # The channel we sent a WHO request for and are waiting on the replies of, or None if there isn't one
+		self.serverCapabilities = {}  # The IRCv3 capabilities the server supports, with the capability names as keys and their (possibly empty) values as values
+		self.enabledCapabilities = set()  # The IRCv3 capabilities the server agreed to enable for us
+		self.isNegotiatingCapabilities = False  # The server doesn't finish our registration until we end capability negotiation, so keep track of whether we still need to do that
 		self.isMuted = False
+		self._hostmaskMatchers = {}  # Keys are the IDs of user lists from the settings (like the admin list), values are a tuple of that list and a HostmaskMatcher for it. Rebuilt when the settings change
+		self._userInListResults = {}  # Keys are full user addresses, values are dicts with user list IDs as keys and whether the user is in that list as value. Cleared for a user when they change nick or quit
+		self._userListsSettingsVersion = None  # The settings version the matchers and results were made for
 
 		self.connectedAt = None  # Will be set to the timestamp on which we connect. 'None' means we're not connected
 		self.connectionManagerGreenlet = None  # This will get a reference to the greenlet keeping the connection alive. If this ends, the bot is closed down
@@ -35,11 +66,10 @@ class DideRobot(object):
 		self.reconnectionAttempCount = None  # Will keep a count of how many times we've tried to connect, to see if we've exceeded the limit (if any)
 		self.maxConnectionRetries = None  # None means unlimited attempts, can be set by settings file
 
-		self.secondsBetweenLineSends = None  # If it's 'None', there's no rate limiting, otherwise it's a float of seconds between line sends
-		self.linesToSend = None  # A list with all the lines to send if there is a queue and rate limiting
-		self.lineSendingGreenlet = None  # Will store the greenlet that is currently working its way through the message queue, or is None if there is none
+		self.lineScheduler = LineScheduler.LineScheduler(self)  # Queues and paces the lines we send, since some servers are rate limited
 
 		#Load the settings, and only connect to the server if that succeeded
+		self.messageLogger = None
 		self.settings = BotSettingsManager(self.serverfolder)
 		if self.settings.loadedSuccessfully:
 			self.parseSettings()
@@ -50,6 +80,16 @@ class DideRobot(object):
 			#Also tell the bot manager that we'll stop existing
 			GlobalStore.bothandler.unregisterBot(self.serverfolder)
 
+	@property
+	def nickname(self) -> Union[str, None]:
+		return self._nickname
+
+	@nickname.setter
+	def nickname(self, newNickname: Union[str, None]):
+		self._nickname = newNickname
+		#Compile the regex that checks whether a message addresses us here, instead of for every message. Nicknames can contain characters like '[' and '|', so escape it
+		self.nicknameAddressRegex = re.compile("@?{}:? ".format(re.escape(newNickname))) if newNickname else None
+
 	def parseSettings(self):
 		"""Retrieve some frequently-used values, to store them in a more easily-accessible way"""
 		#Load in the maximum connection settings to try, if there is any
@@ -58,10 +98,11 @@ class DideRobot(object):
 		if self.maxConnectionRetries < 0:
 			self.maxConnectionRetries = None
 
-		#Time in seconds (can have decimals) between line sends, because some servers are rate limited
-		self.secondsBetweenLineSends = self.settings.get('minSecondsBetweenMessages', -1)
-		if self.secondsBetweenLineSends <= 0:
-			self.secondsBetweenLineSends = None
+		#Time in seconds (can have decimals) between line sends, because some servers are rate limited. Some servers allow a short burst of lines before the rate limit applies
+		secondsBetweenLineSends = self.settings.get('minSecondsBetweenMessages', -1)
+		if secondsBetweenLineSends <= 0:
+			secondsBetweenLineSends = None
+		self.lineScheduler.setPacing(secondsBetweenLineSends, max(1, self.settings.get('messageBurstSize', 1)))
 
 	def reloadSettings(self):
 		self.settings.reloadSettings(True)
@@ -85,12 +126,17 @@ class DideRobot(object):
 				self.logger.error("Unable to connect to server '{}' ({}:{}), reason: {}".format(self.serverfolder, self.settings['server'], self.settings['port'], e))
 			else:
 				#Connecting was successful, authenticate
+				registrationLines = []
 				if self.settings.get('serverpassword', None):
-					self.sendLineToServer("PASS " + self.settings['serverpassword'])
-				self.sendLineToServer("NICK {}".format(self.settings['nickname']))
+					registrationLines.append(("PASS " + self.settings['serverpassword'], False))
+				#Ask which IRCv3 capabilities the server supports. Servers that don't support capabilities just ignore this and finish registration as normal
+				registrationLines.append(("CAP LS 302", True))
+				self.isNegotiatingCapabilities = True
+				registrationLines.append(("NICK {}".format(self.settings['nickname']), True))
 				#Use the specified realname, or fall back to the username if none is provided
 				realname = self.settings.get('realname', self.settings['nickname'])
-				self.sendLineToServer("USER {} 4 * :{}".format(self.settings['nickname'], realname))  #The '4' means we want WALLOPS messages but not invisibility
+				registrationLines.append(("USER {} 4 * :{}".format(self.settings['nickname'], realname), True))  #The '4' means we want WALLOPS messages but not invisibility
+				self.sendLinesToServer(registrationLines)
 				if self.settings.get('nicknamepassword', None):  #Use 'get' instead of 'in' so we also check for empty strings
 					self.sendMessage("nickserv", "identify {}".format(self.settings['nicknamepassword']))
 
@@ -98,17 +144,24 @@ class DideRobot(object):
 				self.handleConnection()
 				#If we reach here, 'handleConnection' returned, so we apparently lost the connection (either accidentally or intentionally)
 
-				#Check if we were still sending messages
-				if self.lineSendingGreenlet:
-					# Kill the message sending greenlet to prevent errors
-					self.lineSendingGreenlet.kill()
-					self.lineSendingGreenlet = None
-					#Also clear the message queue, just in case something in there caused the disconnect
-					self.linesToSend = None
+				#Stop sending queued messages to prevent errors, and clear the queue, just in case something in there caused the disconnect
+				queueStatistics = self.lineScheduler.getStatistics()
+				self.logger.info("|{}| Line queue statistics so far: {}".format(self.serverfolder, StringUtil.dictToString(queueStatistics)))
+				self.lineScheduler.clear()
 
 				#Clear the channels and users lists
-				self.channelsUserList = {}
+				self.channelMembership.clear()
+				#Clear what we know about the server, since we might end up on a different server of the network next time
+				self.userAddress = None
+				self.serverSupport = {}
+				self.maxLineLength = Constants.MAX_LINE_LENGTH
+				self.maxTargetsPerCommand = {}
+				self.serverCapabilities = {}
+				self.enabledCapabilities = set()
+				self.isNegotiatingCapabilities = False
 				self.isUpdatingChannelsUserList = False
+				self.channelsAwaitingUserRetrieval.clear()
+				self.channelRetrievingUsersFor = None
 
 				#Shutdown here because it only makes sense if we have been connected previously
 				self.ircSocket.shutdown(gevent.socket.SHUT_RDWR)
@@ -141,52 +194,147 @@ class DideRobot(object):
 
 	def handleConnection(self):
 		#Keep reading for possible incoming messages
-		incomingData = b""
+		# Received data gets written directly into a preallocated buffer, to prevent copying data around for every read and every line
+		receiveBuffer = bytearray(Constants.RECEIVE_BUFFER_SIZE)
+		receiveBufferView = memoryview(receiveBuffer)
+		receivedByteCount = 0  # How many bytes at the start of the buffer are filled with received but not yet handled data
 		# Set the timeout to 10 minutes, so if our computer loses connection to the server/internet, we notice
 		self.ircSocket.settimeout(600)
 		while self.shouldStayConnected:
+			#If a single line is longer than our buffer (which is rare, but possible with IRCv3 tags), grow the buffer so the whole line fits
+			if receivedByteCount == len(receiveBuffer):
+				receiveBufferView.release()
+				receiveBuffer.extend(bytes(len(receiveBuffer)))
+				receiveBufferView = memoryview(receiveBuffer)
 			try:
-				incomingData += self.ircSocket.recv(2048)
+				newByteCount = self.ircSocket.recv_into(receiveBufferView[receivedByteCount:])
 			except gevent.socket.timeout:
 				self.logger.warning("|{}| Our connection to the server timed out".format(self.serverfolder))
 				return
-			# A closed connection just makes recv return an empty string. Check for that
-			if incomingData == b"":
+			# A closed connection just makes recv return no data. Check for that
+			if newByteCount == 0:
 				self.logger.info("|{}| Server closed the connection".format(self.serverfolder))
 				return
 			# Handle all completely sent messages (delimited by \r\n), leave any unfinished messages for the next loop
-			while b'\r\n' in incomingData:
-				line, incomingData = incomingData.split(b'\r\n', 1)
-				# First deal with the simplest type of message, PING. Just reply PONG
-				if line.startswith(b"PING"):
-					self.sendLineToServer(line.replace(b"PING", b"PONG", 1), False)
-				else:
-					# Let's find out what kind of message this is!
-					lineParts = line.decode('utf-8').split(" ")
-					# A line consists at least of 'source messageType [target] content'
-					messageSource = lineParts[0]
-					# It usually starts with a colon, remove that
-					if messageSource.startswith(":"):
-						messageSource = messageSource[1:]
-					messageType = lineParts[1]
-					#Convert numerical replies to human-readable ones, if applicable. Otherwise make it uppercase, since that's the standard
-					messageType = MessageTypes.IRC_NUMERIC_TO_TYPE.get(messageType, messageType.upper())
-					#The IRC protocol uses ':' to denote the start of a multi-word string. Join those here too, for easier parsing later
-					messageParts = lineParts[2:]
-					for messagePartIndex, messagePart in enumerate(messageParts):
-						if messagePart.startswith(':'):
-							#Join all the separate parts of the wordgroup, and remove the starting colon
-							wordgroup = " ".join(messageParts[messagePartIndex:])[1:]
-							messageParts[messagePartIndex] = wordgroup
-							messageParts = messageParts[:messagePartIndex+1]
-							break
-					#Check if we have a function to deal with this type of message
-					messageTypeFunction = getattr(self, "irc_" + messageType, None)
-					if messageTypeFunction:
-						messageTypeFunction(messageSource, messageParts)
-					else:
-						#No function for this type of message, fall back to a generic function
-						self.irc_unknown_message_type(messageSource, messageType, lineParts)
+			# Only search through the new data, plus one byte before it in case the delimiter got split over two reads
+			lineStartIndex = 0
+			lineEndIndex = receiveBuffer.find(b'\r\n', max(0, receivedByteCount - 1), receivedByteCount + newByteCount)
+			receivedByteCount += newByteCount
+			while lineEndIndex != -1:
+				self.handleLine(bytes(receiveBufferView[lineStartIndex:lineEndIndex]))
+				lineStartIndex = lineEndIndex + 2
+				lineEndIndex = receiveBuffer.find(b'\r\n', lineStartIndex, receivedByteCount)
+			# Move any partial line to the start of the buffer, so the next read can append to it
+			if lineStartIndex > 0:
+				receivedByteCount -= lineStartIndex
+				receiveBuffer[:receivedByteCount] = receiveBuffer[lineStartIndex:lineStartIndex + receivedByteCount]
+
+	def handleLine(self, line: bytes):
+		line = line.decode('utf-8', errors='replace')
+		try:
+			parsedLine = IrcLine.parseLine(line)
+		except ValueError as e:
+			self.logger.warning("|{}| Received invalid line '{}' from server: {}".format(self.serverfolder, line, e))
+			return
+		#This is either a verb (like 'PRIVMSG') or a numeric reply (like '001')
+		messageType = parsedLine.verb
+		#Check if we have one or more functions to deal with this type of message. The handler table has entries for both the numeric and the readable message type
+		messageTypeFunctions = self._ircMessageHandlers.get(messageType, None)
+		if messageTypeFunctions is None:
+			#Make it uppercase, since that's the standard. Don't do this by default, since it's rarely needed
+			messageTypeFunctions = self._ircMessageHandlers.get(messageType.upper(), None)
+		if messageTypeFunctions:
+			for messageTypeFunction in messageTypeFunctions:
+				messageTypeFunction(self, parsedLine.prefix, parsedLine.params)
+		else:
+			#No function for this type of message, fall back to a generic function
+			self.irc_unknown_message_type(parsedLine.prefix, MessageTypes.IRC_NUMERIC_TO_TYPE.get(messageType, messageType.upper()), parsedLine.params)
+
+	@classmethod
+	def _buildMessageHandlerTables(cls):
+		"""
+		Build the tables that map IRC message types and CTCP types to the function(s) that handle them, so incoming lines can be dispatched with a single lookup
+		The tables are built from the 'irc_[messageType]' and 'ctcp_[ctcpType]' methods of this class, combined with the handlers registered through 'addIrcMessageHandler'
+		IRC message types are stored both under their readable name and, if there is one, their numeric, so numeric lines don't need to be converted first
+		"""
+		ircMessageHandlers = {}
+		ctcpMessageHandlers = {}
+		for attributeName in dir(cls):
+			if attributeName.endswith('_unknown_message_type'):
+				continue
+			if attributeName.startswith('irc_'):
+				ircMessageHandlers[attributeName[4:]] = [getattr(cls, attributeName)]
+			elif attributeName.startswith('ctcp_'):
+				ctcpMessageHandlers[attributeName[5:]] = (getattr(cls, attributeName),)
+		for messageType, moduleHandlers in cls._extraIrcMessageHandlers.items():
+			if messageType not in ircMessageHandlers:
+				ircMessageHandlers[messageType] = []
+			for moduleName, handlerFunction in moduleHandlers:
+				ircMessageHandlers[messageType].append(handlerFunction)
+		for numeric, messageType in MessageTypes.IRC_NUMERIC_TO_TYPE.items():
+			if messageType in ircMessageHandlers:
+				ircMessageHandlers[numeric] = ircMessageHandlers[messageType]
+		#Store the handlers as tuples, since they're faster to iterate over and can't accidentally get changed
+		cls._ircMessageHandlers = {messageType: tuple(handlers) for messageType, handlers in ircMessageHandlers.items()}
+		cls._ctcpMessageHandlers = ctcpMessageHandlers
+		#Subclasses have their own tables, make sure those include any newly registered handlers too
+		for subclass in cls.__subclasses__():
+			if subclass.__dict__.get('_ircMessageHandlers', None) is not None:
+				subclass._buildMessageHandlerTables()
+
+	@classmethod
+	def addIrcMessageHandler(cls, module: str, messageType: str, handlerFunction) -> bool:
+		"""
+		Add a function that gets called for every incoming IRC message of the provided type, for all bots. This allows commands to react to message types that don't get passed to commands, like server replies
+		Usually called in the 'onLoad' of a command. The handler gets removed automatically when the command is unloaded, or it can be manually removed with 'removeIrcMessageHandler'
+		:param module: The name of the module, usually '__file__' in the command class. This is needed to automatically remove the handler when the command module gets unloaded
+		:param messageType: The type of IRC message to handle, either as a name from the MessageTypes module (like 'RPL_ISUPPORT') or as the raw verb or numeric (like 'INVITE' or '005')
+		:param handlerFunction: The function to call when the message type is received. It gets called with the bot instance, the message source, and a list of the message parameters
+		:return: True if the handler was added, False if this handler was already registered for that message type
+		"""
+		messageType = MessageTypes.IRC_NUMERIC_TO_TYPE.get(messageType, messageType.upper())
+		moduleName = os.path.basename(module).split('.', 1)[0]
+		if messageType not in cls._extraIrcMessageHandlers:
+			cls._extraIrcMessageHandlers[messageType] = []
+		elif (moduleName, handlerFunction) in cls._extraIrcMessageHandlers[messageType]:
+			logging.getLogger('DideRobot').warning("Module '{}' tried to add a handler for IRC message type '{}' that's already registered".format(moduleName, messageType))
+			return False
+		cls._extraIrcMessageHandlers[messageType].append((moduleName, handlerFunction))
+		logging.getLogger('DideRobot').info("Adding IRC message handler for message type '{}' from module '{}'".format(messageType, moduleName))
+		DideRobot._buildMessageHandlerTables()
+		return True
+
+	@classmethod
+	def removeIrcMessageHandler(cls, messageType: str, handlerFunction) -> bool:
+		messageType = MessageTypes.IRC_NUMERIC_TO_TYPE.get(messageType, messageType.upper())
+		for moduleHandler in cls._extraIrcMessageHandlers.get(messageType, []):
+			if moduleHandler[1] == handlerFunction:
+				cls._extraIrcMessageHandlers[messageType].remove(moduleHandler)
+				if not cls._extraIrcMessageHandlers[messageType]:
+					del cls._extraIrcMessageHandlers[messageType]
+				DideRobot._buildMessageHandlerTables()
+				return True
+		logging.getLogger('DideRobot').warning("Trying to remove a handler for IRC message type '{}' while it is not registered".format(messageType))
+		return False
+
+	@classmethod
+	def removeIrcMessageHandlersForModule(cls, moduleName: str) -> int:
+		"""
+		Remove all the IRC message handlers that were registered by the provided module. Gets called automatically when a command gets unloaded
+		:param moduleName: The name of the module to remove the handlers of
+		:return: The number of handlers that were removed
+		"""
+		removedHandlerCount = 0
+		for messageType in list(cls._extraIrcMessageHandlers.keys()):
+			moduleHandlers = [moduleHandler for moduleHandler in cls._extraIrcMessageHandlers[messageType] if moduleHandler[0] != moduleName]
+			removedHandlerCount += len(cls._extraIrcMessageHandlers[messageType]) - len(moduleHandlers)
+			if moduleHandlers:
+				cls._extraIrcMessageHandlers[messageType] = moduleHandlers
+			else:
+				del cls._extraIrcMessageHandlers[messageType]
+		if removedHandlerCount > 0:
+			DideRobot._buildMessageHandlerTables()
+		return removedHandlerCount
 
 	def irc_RPL_WELCOME(self, source, parameters):
 		"""Called when we finished connecting to the server"""
@@ -198,55 +346,158 @@ class DideRobot(object):
 		self.nickname = parameters[0]
 		if self.nickname != self.settings['nickname']:
 			self.logger.info("|{}| Nickname not available. Wanted '{}', got '{}'".format(self.serverfolder, self.settings['nickname'], self.nickname))
+		# Most servers end the welcome message with our full user address, store that if it's there
+		welcomeMessageEnd = parameters[-1].rsplit(" ", 1)[-1]
+		if welcomeMessageEnd.startswith(self.nickname + "!") and '@' in welcomeMessageEnd:
+			self.userAddress = welcomeMessageEnd.split("!", 1)[1]
 		# Inform all the modules that we connected
 		message = IrcMessage(MessageTypes.RPL_WELCOME, self, None, source, " ".join(parameters))
 		GlobalStore.commandhandler.handleMessage(message)
-		# Join the channels we should, if there are any
-		if len(self.settings['joinChannels']) == 0:
-			self.logger.info("|{}| No join channels specified, idling".format(self.serverfolder))
-		else:
-			for channel in self.settings['joinChannels']:
-				self.joinChannel(channel)
 
 	def joinChannel(self, channelname):
-		if channelname[0] not in Constants.CHANNEL_PREFIXES:
-			channelname = "#" + channelname
-		if channelname in self.channelsUserList:
-			self.logger.warning("|{}| Asked to join '{}' but I'm already there".format(self.serverfolder, channelname))
-		else:
-			self.sendLineToServer("JOIN {}".format(channelname))
+		self.joinChannels((channelname,))
+
+	def joinChannels(self, channelnames):
+		"""
+		Join the provided channels. If the server allows it, multiple channels are joined with a single JOIN line, which saves a lot of time on rate-limited servers
+		:param channelnames: The names of the channels to join. If a name doesn't start with a channel prefix, '#' is added
+		"""
+		channelnamesToJoin = []
+		for channelname in channelnames:
+			if channelname[0] not in Constants.CHANNEL_PREFIXES:
+				channelname = "#" + channelname
+			if channelname in self.channelMembership:
+				self.logger.warning("|{}| Asked to join '{}' but I'm already there".format(self.serverfolder, channelname))
+			else:
+				channelnamesToJoin.append(channelname)
+		for joinTarget in self._combineTargets(channelnamesToJoin, 'JOIN', self.maxLineLength - len("JOIN ")):
+			self.queueLineToSend("JOIN {}".format(joinTarget), priority=LineScheduler.PRIORITY_PROTOCOL)
 
 	def leaveChannel(self, channelName, leaveMessage="Leaving..."):
-		if channelName not in self.channelsUserList:
+		if channelName not in self.channelMembership:
 			self.logger.warning("|{}| Asked to leave '{}', but I'm not there".format(self.serverfolder, channelName))
 		else:
-			self.sendLineToServer("PART {} :{}".format(channelName, leaveMessage))
+			self.queueLineToSend("PART {} :{}".format(channelName, leaveMessage), priority=LineScheduler.PRIORITY_PROTOCOL)
 
 	def setNick(self, nickname):
-		self.sendLineToServer("NICK " + nickname)
+		self.queueLineToSend("NICK " + nickname, priority=LineScheduler.PRIORITY_PROTOCOL)
+
+	def irc_RPL_ENDOFMOTD(self, prefix, params):
+		"""Called when the server finished sending the message of the day, which is the last part of connecting. By now we know the server's limits, so we can join efficiently"""
+		# Join the channels we should, if there are any
+		if len(self.settings['joinChannels']) == 0:
+			self.logger.info("|{}| No join channels specified, idling".format(self.serverfolder))
+		else:
+			self.joinChannels(self.settings['joinChannels'])
+
+	def irc_ERR_NOMOTD(self, prefix, params):
+		"""Called instead of 'irc_RPL_ENDOFMOTD' when the server doesn't have a message of the day"""
+		self.irc_RPL_ENDOFMOTD(prefix, params)
+
+	def irc_RPL_ISUPPORT(self, prefix, params):
+		"""Called when the server tells us which features it supports and what its limits are. This can be spread out over multiple messages"""
+		# 'params' starts with our nick, then the feature tokens like 'NETWORK=ExampleNet', 'SAFELIST' or '-EXCEPTS' (which means the feature isn't supported anymore), and ends with a human-readable description
+		for token in params[1:-1]:
+			if token.startswith('-'):
+				self.serverSupport.pop(token[1:], None)
+			else:
+				featureName, separator, featureValue = token.partition('=')
+				# Values can contain escaped characters, like '\x20' for a space
+				if '\\x' in featureValue:
+					featureValue = re.sub(r"\\x([0-9A-Fa-f]{2})", lambda match: chr(int(match.group(1), 16)), featureValue)
+				self.serverSupport[featureName] = featureValue
+		# Store the features we use often in a more accessible way
+		self.channelMembership.setCaseMapping(self.serverSupport.get('CASEMAPPING', None))
+		self.channelMembership.setPrefixes(self.serverSupport.get('PREFIX', None))
+		self.channelMembership.setChannelModeTypes(self.serverSupport.get('CHANMODES', None))
+		self.maxLineLength = Constants.MAX_LINE_LENGTH
+		if self.serverSupport.get('LINELEN', None):
+			try:
+				# The server's line length includes the '\r\n' line ending
+				self.maxLineLength = int(self.serverSupport['LINELEN']) - 2
+			except ValueError:
+				self.logger.warning("|{}| Server sent invalid LINELEN value '{}'".format(self.serverfolder, self.serverSupport['LINELEN']))
+		self.maxTargetsPerCommand = {}
+		try:
+			if self.serverSupport.get('TARGMAX', None):
+				# Format is 'PRIVMSG:4,NOTICE:4,JOIN:', where an empty limit means there is no limit
+				for commandLimit in self.serverSupport['TARGMAX'].split(','):
+					command, separator, limit = commandLimit.partition(':')
+					self.maxTargetsPerCommand[command.upper()] = int(limit) if limit else None
+			elif self.serverSupport.get('MAXTARGETS', None):
+				# Older servers use this to specify the limit for both messages and notices
+				maxTargets = int(self.serverSupport['MAXTARGETS'])
+				self.maxTargetsPerCommand[MessageTypes.SAY] = maxTargets
+				self.maxTargetsPerCommand[MessageTypes.NOTICE] = maxTargets
+		except ValueError:
+			self.logger.warning("|{}| Server sent invalid target limits. TARGMAX: '{}', MAXTARGETS: '{}'".format(self.serverfolder, self.serverSupport.get('TARGMAX', None), self.serverSupport.get('MAXTARGETS', None)))
+			self.maxTargetsPerCommand = {}
+
+	def irc_RPL_HOSTHIDDEN(self, prefix, params):
+		"""Called when the server changes the host it shows to others, for instance because we got a cloak"""
+		# 'params' is our nick, then our new host, then a human-readable description
+		if self.userAddress:
+			self.userAddress = self.userAddress.split('@', 1)[0] + '@' + params[1]
 
 	def irc_ERR_NICKNAMEINUSE(self, source, parameters):
 		# The nickname we want is apparently in use. Just append an underscore and try again
 		newNicknameAttempt = parameters[1] + "_"
 		self.logger.info("|{}| Requested nickname '{}' in use, retrying with nickname '{}'".format(self.serverfolder, parameters[1], newNicknameAttempt))
-		self.sendLineToServer("NICK " + newNicknameAttempt)
+		self.queueLineToSend("NICK " + newNicknameAttempt, priority=LineScheduler.PRIORITY_PROTOCOL)
+
+	def retrieveChannelUsers(self, channel, shouldRequestNames=True):
+		"""
+		(Re)build the list of users in the provided channel
+		:param channel: The channel to get the users of
+		:param shouldRequestNames: Whether a NAMES request should be sent. Set this to False if the server sends the NAMES reply by itself, which happens when we join a channel
+		"""
+		#Make sure we don't keep users that left while we weren't keeping track
+		self.channelMembership.clearChannelUsers(channel)
+		if 'userhost-in-names' in self.enabledCapabilities:
+			#NAMES replies include the full user addresses, so that's all we need
+			if shouldRequestNames:
+				self.queueLineToSend("NAMES {}".format(channel), priority=LineScheduler.PRIORITY_BACKGROUND)
+		else:
+			#NAMES replies only have nicks, so we need to ask for the user addresses with WHO. Do that one channel at a time, so joining a lot of channels doesn't flood us with replies
+			if channel not in self.channelsAwaitingUserRetrieval:
+				self.channelsAwaitingUserRetrieval.append(channel)
+			self.isUpdatingChannelsUserList = True
+			self._sendNextWhoRequest()
+
+	def _sendNextWhoRequest(self):
+		if self.channelRetrievingUsersFor or not self.channelsAwaitingUserRetrieval:
+			return
+		self.channelRetrievingUsersFor = self.channelsAwaitingUserRetrieval.popleft()
+		if 'WHOX' in self.serverSupport:
+			#Only ask for the fields we need: the token, the channel, the username, the host, the nick, and the flags
+			self.queueLineToSend("WHO {} %tcuhnf,{}".format(self.channelRetrievingUsersFor, self._WHOX_TOKEN), priority=LineScheduler.PRIORITY_BACKGROUND)
+		else:
+			self.queueLineToSend("WHO {}".format(self.channelRetrievingUsersFor), priority=LineScheduler.PRIORITY_BACKGROUND)
+
+	def requestCapabilities(self, availableCapabilities):
+		"""
+		Ask the server to enable the capabilities we want, from the provided capabilities. If there aren't any we want, capability negotiation is ended if that's still in progress
+		:param availableCapabilities: The names of the capabilities the server supports
+		"""
+		capabilitiesToRequest = [capability for capability in Constants.REQUESTED_CAPABILITIES if capability in availableCapabilities and capability not in self.enabledCapabilities]
+		if capabilitiesToRequest:
+			self.queueLineToSend("CAP REQ :" + " ".join(capabilitiesToRequest), priority=LineScheduler.PRIORITY_PROTOCOL)
+		else:
+			self.endCapabilityNegotiation()
 
-	#Create a list of user addresses per channel
-	def retrieveChannelUsers(self, channel):
-		self.isUpdatingChannelsUserList = True
-		#Make sure we don't get duplicate data
-		if channel in self.channelsUserList:
-			self.channelsUserList[channel].clear()
-		self.sendLineToServer("WHO {}".format(channel))
+	def endCapabilityNegotiation(self):
+		if self.isNegotiatingCapabilities:
+			self.isNegotiatingCapabilities = False
+			self.queueLineToSend("CAP END", priority=LineScheduler.PRIORITY_PROTOCOL)
 
 	def quit(self, quitMessage=None):
 		self.shouldReconnect = False
 		#If we are connected to a server, let it know we want to quit
 		if self.connectedAt is not None:
 			if quitMessage:
-				self.sendLineToServer("QUIT :" + quitMessage)
+				self.queueLineToSend("QUIT :" + quitMessage, priority=LineScheduler.PRIORITY_PROTOCOL)
 			else:
-				self.sendLineToServer("QUIT")
+				self.queueLineToSend("QUIT", priority=LineScheduler.PRIORITY_PROTOCOL)
 		# If we're not connected (yet?), stop trying to connect
 		elif self.connectionManagerGreenlet:
 			self.logger.info("|{}| Asked to quit, but not connected. Stopping wait before next connection attempt".format(self.serverfolder))
@@ -264,6 +515,10 @@ class DideRobot(object):
 	def ctcp_unknown_message_type(self, ctcpType, user, messageTarget, message):
 		self.logger.info("|{}| Received unknown CTCP command '{}' on {} from {}, message '{}'".format(self.serverfolder, ctcpType, messageTarget, user, message))
 
+	def irc_PING(self, prefix, params):
+		# The server wants to know if we're still here. Reply with whatever it sent us
+		self.queueLineToSend("PONG :" + params[-1] if params else "PONG", priority=LineScheduler.PRIORITY_PROTOCOL, shouldLogLine=False)
+
 	def irc_RPL_MOTD(self, prefix, params):
 		self.messageLogger.log("Server message of the day: " + params[1])
 
@@ -272,15 +527,19 @@ class DideRobot(object):
 		# 'prefix' is the user, 'params' is a list with apparently just one entry, the channel
 		message = IrcMessage(MessageTypes.JOIN, self, prefix, params[0])
 		self.messageLogger.log("JOIN: {nick} ({address})".format(nick=message.userNickname, address=prefix), params[0])
+		# Our own join shows our full user address the way others see it
+		if message.userNickname == self.nickname and message.userAddress:
+			self.userAddress = message.userAddress
 		# If we just joined a channel, or if don't have a record of this channel yet, get all the users in it
-		if message.userNickname == self.nickname or params[0] not in self.channelsUserList:
-			# Already create a userlist entry, so the rest of the bot knows we're in this channel, even if retrieving the channel users goes wrong somehow (Looking at you, Twitch Chat)
-			self.channelsUserList[params[0]] = []
-			# Then try to fill the userlist
-			self.retrieveChannelUsers(params[0])
-		# If we don't know this user yet, add it to our list
-		elif prefix not in self.channelsUserList[params[0]]:
-			self.channelsUserList[params[0]].append(prefix)
+		if message.userNickname == self.nickname or params[0] not in self.channelMembership:
+			# Already create a channel entry, so the rest of the bot knows we're in this channel, even if retrieving the channel users goes wrong somehow (Looking at you, Twitch Chat)
+			self.channelMembership.addChannel(params[0])
+			# Then try to fill the userlist. When we join, the server sends the NAMES reply without us asking for it
+			self.retrieveChannelUsers(params[0], shouldRequestNames=message.userNickname != self.nickname)
+		# Otherwise just add this user to the channel
+		else:
+			username, separator, host = message.userAddress.partition('@') if message.userAddress else (None, None, None)
+			self.channelMembership.addUser(params[0], message.userNickname, username, host, isAway=False)
 		GlobalStore.commandhandler.handleMessage(message)
 
 	def irc_PART(self, prefix, params):
@@ -289,17 +548,18 @@ class DideRobot(object):
 		message = IrcMessage(MessageTypes.PART, self, prefix, params[0])
 		self.messageLogger.log("PART: {nick} ({address})".format(nick=message.userNickname, address=prefix), params[0])
 		# If a user parts before we have a proper channellist built, catch that error
-		if params[0] not in self.channelsUserList:
+		if params[0] not in self.channelMembership:
 			self.logger.warning("|{}| Unexpected PART, user '{}' parted from channel '{}' but we had no record of them".format(self.serverfolder, prefix, params[0]))
 			# Schedule a rebuild of the userlist
-			if not self.isUpdatingChannelsUserList:
+			if not self.isUpdatingChannelsUserList and message.userNickname != self.nickname:
+				self.channelMembership.addChannel(params[0])
 				self.retrieveChannelUsers(params[0])
 		# Keep track of the channels we're in
 		elif message.userNickname == self.nickname:
-			self.channelsUserList.pop(params[0])
+			self.channelMembership.removeChannel(params[0])
 		# Keep track of channel users
-		elif prefix in self.channelsUserList[params[0]]:
-			self.channelsUserList[params[0]].remove(prefix)
+		else:
+			self.channelMembership.removeUser(params[0], message.userNickname)
 		GlobalStore.commandhandler.handleMessage(message)
 
 	def irc_QUIT(self, prefix, params):
@@ -308,24 +568,22 @@ class DideRobot(object):
 		# log for every channel the user was in that they quit
 		message = IrcMessage(MessageTypes.QUIT, self, prefix, None, params[0])
 		logMessage = "QUIT: {nick} ({address}): '{quitmessage}' ".format(nick=message.userNickname, address=prefix, quitmessage=params[0])
-		for channel, userlist in self.channelsUserList.items():
-			if prefix in userlist:
-				self.messageLogger.log(logMessage, channel)
-				userlist.remove(prefix)
+		for channel in self.channelMembership.removeUserFromAllChannels(message.userNickname):
+			self.messageLogger.log(logMessage, channel)
 		GlobalStore.commandhandler.handleMessage(message)
+		self._userInListResults.pop(prefix, None)
 
 	def irc_KICK(self, prefix, params):
 		"""Called when a user is kicked"""
-		# 'prefix' is the kicker, params[0] is the channel, params[1] is the user address of the kicked, params[-1] is the kick reason
+		# 'prefix' is the kicker, params[0] is the channel, params[1] is the nick of the kicked, params[-1] is the kick reason
 		message = IrcMessage(MessageTypes.KICK, self, prefix, params[0], params[-1])
 		kickedUserNick = params[1].split("!", 1)[0]
 		self.messageLogger.log("KICK: {} was kicked by {}, reason: '{}'".format(kickedUserNick, message.userNickname, params[-1]), params[0])
 		# Keep track of the channels we're in
 		if kickedUserNick == self.nickname:
-			if params[0] in self.channelsUserList:
-				self.channelsUserList.pop(params[0])
-		elif params[1] in self.channelsUserList[params[0]]:
-			self.channelsUserList[params[0]].remove(params[1])
+			self.channelMembership.removeChannel(params[0])
+		else:
+			self.channelMembership.removeUser(params[0], kickedUserNick)
 		GlobalStore.commandhandler.handleMessage(message)
 
 	def irc_NICK(self, prefix, params):
@@ -334,25 +592,20 @@ class DideRobot(object):
 		message = IrcMessage(MessageTypes.NICK, self, prefix, None, params[0])
 		oldnick = message.userNickname
 		newnick = params[0]
-		# New nick plus old address
-		newaddress = newnick + "!" + prefix.split("!", 1)[1]
 		# If it's about us, apparently a nick change was successful
 		if oldnick == self.nickname:
 			self.nickname = newnick
 			self.logger.info("|{}| Our nick got changed from '{}' to '{}'".format(self.serverfolder, oldnick, self.nickname))
-		# Log the change in every channel where it's relevant
-		for channel, userlist in self.channelsUserList.items():
-			if prefix in userlist:
-				# Update the userlists for all channels this user is in
-				userlist.remove(prefix)
-				userlist.append(newaddress)
-				self.messageLogger.log("NICK CHANGE: {oldnick} changed their nick to {newnick}".format(oldnick=oldnick, newnick=newnick), channel)
+		# Update the user info for all channels this user is in, and log the change in every channel where it's relevant
+		for channel in self.channelMembership.renameUser(oldnick, newnick):
+			self.messageLogger.log("NICK CHANGE: {oldnick} changed their nick to {newnick}".format(oldnick=oldnick, newnick=newnick), channel)
 		GlobalStore.commandhandler.handleMessage(message)
+		self._userInListResults.pop(prefix, None)
 
 	def irc_MODE(self, prefix, params):
 		#There are two possible MODE commands
 		# The first is server-wide. Here the prefix is our user address, the first param is our username, and the second param is the mode change
-		if len(params) == 2:
+		if params[0][0] not in Constants.CHANNEL_PREFIXES:
 			self.logger.info("|{}| Our mode got set to '{}'".format(self.serverfolder, params[1]))
 		# The second is channel-specific. Here the prefix is who or what is making the change, the first param is the channel,
 		#  the second param is the mode change, and the rest of the params are the nicks whose mode got changed
@@ -362,6 +615,8 @@ class DideRobot(object):
 			if '!' in modeChanger:
 				modeChanger = modeChanger.split('!', 1)[0]
 			self.messageLogger.log("{} set mode to '{}' of user(s) {}".format(modeChanger, params[1], ", ".join(params[2:])), params[0])
+			# Keep track of who got or lost op or voice
+			self.channelMembership.applyModeChange(params[0], params[1], params[2:])
 
 	def irc_TOPIC(self, prefix, params):
 		self.logger.debug("irc_TOPIC called, prefix is '{}', params is '{}'".format(prefix, params))
@@ -374,14 +629,107 @@ class DideRobot(object):
 
 	def irc_RPL_WHOREPLY(self, prefix, params):
 		#'prefix' is the server, 'params' is a list, with meaning [own_nick, channel, other_username, other_address, other_server, other_nick, flags, hops realname]
-		# Flags can be H for active or G for away, and a * for oper, + for voiced
-		if params[1] not in self.channelsUserList:
-			self.channelsUserList[params[1]] = []
-		self.channelsUserList[params[1]].append("{nick}!{username}@{address}".format(nick=params[5], username=params[2], address=params[3]))
+		# Flags can be H for active or G for away, and a * for oper, followed by the user's status prefixes in the channel, like @ for op or + for voiced
+		self._storeWhoReplyUser(params[1], params[5], params[2], params[3], params[6])
+
+	def irc_RPL_WHOSPCRPL(self, prefix, params):
+		#This is the reply to a WHOX request. 'prefix' is the server, 'params' has our own nick followed by the fields we asked for, in the order [token, channel, username, host, nick, flags]
+		if len(params) < 7 or params[1] != self._WHOX_TOKEN:
+			return
+		self._storeWhoReplyUser(params[2], params[5], params[3], params[4], params[6])
+
+	def _storeWhoReplyUser(self, channel, nickname, username, host, flags):
+		#Ignore replies for channels we're not in (anymore)
+		if channel not in self.channelMembership:
+			return
+		self.channelMembership.addUser(channel, nickname, username, host, flags[1:], isAway=flags.startswith('G'))
+		# We're in the channel too, so this is also a good way to learn how others see our user address
+		if nickname == self.nickname:
+			self.userAddress = "{username}@{address}".format(username=username, address=host)
 
 	def irc_RPL_ENDOFWHO(self, prefix, params):
-		self.isUpdatingChannelsUserList = False
-		self.logger.info("|{}| Userlist for channels {} collected".format(self.serverfolder, ", ".join(self.channelsUserList.keys())))
+		#'params' is our own nick, the channel or mask the WHO request was for, and a human-readable message
+		if self.channelRetrievingUsersFor and self.channelMembership.foldCase(params[1]) == self.channelMembership.foldCase(self.channelRetrievingUsersFor):
+			self.channelRetrievingUsersFor = None
+			if self.channelsAwaitingUserRetrieval:
+				self._sendNextWhoRequest()
+			else:
+				self.isUpdatingChannelsUserList = False
+				self.logger.info("|{}| Userlist for channels {} collected".format(self.serverfolder, ", ".join(self.channelsUserList)))
+
+	def irc_RPL_NAMREPLY(self, prefix, params):
+		#'prefix' is the server, 'params' is our own nick, the channel type ('=' for public, '*' for private, '@' for secret), the channel, and a space-separated list of the users in the channel
+		if params[2] in self.channelMembership:
+			for namesEntry in params[3].split(' '):
+				if namesEntry:
+					self.channelMembership.addUserFromNamesEntry(params[2], namesEntry)
+
+	def irc_RPL_ENDOFNAMES(self, prefix, params):
+		#'params' is our own nick, the channel, and a human-readable message
+		if 'userhost-in-names' in self.enabledCapabilities:
+			self.logger.info("|{}| Userlist for channel {} collected".format(self.serverfolder, params[1]))
+
+	def irc_CAP(self, prefix, params):
+		"""Called when the server replies to our IRCv3 capability negotiation. See https://ircv3.net/specs/extensions/capability-negotiation"""
+		#'params' is our own nick (or '*' if we don't have one yet), the subcommand, optionally a '*' if the capability list continues on the next line, and a space-separated list of capabilities
+		subcommand = params[1].upper()
+		capabilities = params[-1].split()
+		if subcommand == 'LS' or subcommand == 'NEW':
+			newCapabilities = []
+			for capability in capabilities:
+				capabilityName, separator, capabilityValue = capability.partition('=')
+				self.serverCapabilities[capabilityName] = capabilityValue
+				newCapabilities.append(capabilityName)
+			if subcommand == 'NEW':
+				self.requestCapabilities(newCapabilities)
+			#Wait until we have the whole list before requesting anything
+			elif len(params) < 4 or params[2] != '*':
+				self.requestCapabilities(self.serverCapabilities)
+		elif subcommand == 'DEL':
+			for capability in capabilities:
+				self.serverCapabilities.pop(capability, None)
+				self.enabledCapabilities.discard(capability)
+		elif subcommand == 'ACK':
+			for capability in capabilities:
+				if capability.startswith('-'):
+					self.enabledCapabilities.discard(capability[1:])
+				else:
+					self.enabledCapabilities.add(capability)
+			self.logger.info("|{}| Enabled capabilities: {}".format(self.serverfolder, ", ".join(sorted(self.enabledCapabilities))))
+			self.endCapabilityNegotiation()
+		elif subcommand == 'NAK':
+			self.logger.warning("|{}| Server refused to enable capabilities '{}'".format(self.serverfolder, params[-1]))
+			self.endCapabilityNegotiation()
+
+	def irc_ERR_UNKNOWNCOMMAND(self, prefix, params):
+		#'params' is our own nick, the command the server doesn't know, and a human-readable message
+		unknownCommand = params[1].upper()
+		self.logger.warning("|{}| Server doesn't know the command '{}'".format(self.serverfolder, unknownCommand))
+		if unknownCommand == 'CAP':
+			self.isNegotiatingCapabilities = False
+		elif unknownCommand == 'WHO':
+			#No use sending more WHO requests, so stop trying to retrieve user addresses
+			self.channelsAwaitingUserRetrieval.clear()
+			self.channelRetrievingUsersFor = None
+			self.isUpdatingChannelsUserList = False
+
+	def irc_AWAY(self, prefix, params):
+		"""Called when a user we share a channel with goes away or comes back. Only sent if the server supports the 'away-notify' capability"""
+		#'prefix' is the user, 'params' has the away message if the user went away, and is empty if the user came back
+		channelUser = self.channelMembership.getUser(prefix.split('!', 1)[0])
+		if channelUser:
+			channelUser.isAway = bool(params)
+
+	def irc_CHGHOST(self, prefix, params):
+		"""Called when the username or host of a user we share a channel with changes. Only sent if the server supports the 'chghost' capability"""
+		#'prefix' is the user with their old address, 'params' is the new username and the new host
+		nickname = prefix.split('!', 1)[0]
+		channelUser = self.channelMembership.getUser(nickname)
+		if channelUser:
+			channelUser.username = params[0]
+			channelUser.host = params[1]
+		if nickname == self.nickname:
+			self.userAddress = "{}@{}".format(params[0], params[1])
 
 
 	#CTCP FUNCTIONS
@@ -431,9 +779,10 @@ class DideRobot(object):
 				ctcpType = ctcpType[:-1]
 			ctcpType = ctcpType[1:]  #Remove the CTCP delimiter
 			#Check if we have a function to handle this type of CTCP message, otherwise fall back on a default
-			ctcpFunction = getattr(self, "ctcp_" + ctcpType, None)
-			if ctcpFunction:
-				ctcpFunction(user, messageSource, messageText)
+			ctcpFunctions = self._ctcpMessageHandlers.get(ctcpType, None) or self._ctcpMessageHandlers.get(ctcpType.upper(), None)
+			if ctcpFunctions:
+				for ctcpFunction in ctcpFunctions:
+					ctcpFunction(self, user, messageSource, messageText)
 			else:
 				self.ctcp_unknown_message_type(ctcpType, user, messageSource, messageText)
 		#Normal message
@@ -465,21 +814,39 @@ class DideRobot(object):
 
 	#SENDING OUT MESSAGES
 	def sendLineToServer(self, lineToSend, shouldLogMessage=True):
+		"""
+		Send the provided line to the server right away, skipping the line queue. Usually you want 'queueLineToSend' instead, so rate limits are respected
+		:param lineToSend: The line to send, as a string or as bytes
+		:param shouldLogMessage: Whether the line should be written to the program log
+		"""
+		self.sendLinesToServer(((lineToSend, shouldLogMessage),))
+
+	def sendLinesToServer(self, linesToSend):
+		"""
+		Send the provided lines to the server right away in a single socket write, skipping the line queue
+		:param linesToSend: A list of tuples, with as first entry the line to send as a string or as bytes, and as second entry whether the line should be written to the program log
+		"""
 		if not self.ircSocket:
-			self.logger.error("|{}| Asked to send line '{}' to server, but socket closed".format(self.serverfolder, lineToSend))
+			self.logger.error("|{}| Asked to send lines '{}' to server, but socket closed".format(self.serverfolder, "', '".join(str(lineTuple[0]) for lineTuple in linesToSend)))
 			return
-		if shouldLogMessage:
-			self.logger.debug("|{}| > {}".format(self.serverfolder, lineToSend))
-		try:
+		encodedLines = []
+		for lineToSend, shouldLogMessage in linesToSend:
+			if shouldLogMessage:
+				self.logger.debug("|{}| > {}".format(self.serverfolder, lineToSend))
 			if isinstance(lineToSend, str):
 				lineToSend = lineToSend.encode('utf-8')
-			self.ircSocket.send(lineToSend + b"\r\n")
+			encodedLines.append(lineToSend)
+		# Add an empty entry, so the join also ends the last line with a line break
+		encodedLines.append(b"")
+		try:
+			# 'sendall' keeps writing until all the data is sent, even if the socket only accepts part of it at a time
+			self.ircSocket.sendall(b"\r\n".join(encodedLines))
 		except gevent.socket.error as socketError:
-			self.logger.error("|{}| Socket error occurred when sending line '{}': {}".format(self.serverfolder, lineToSend, socketError))
+			self.logger.error("|{}| Socket error occurred when sending {} line(s) to the server: {}".format(self.serverfolder, len(linesToSend), socketError))
 			#If the socket is giving errors, we should close the socket and make the bot reconnect
 			self.shouldStayConnected = False
 		except Exception as e:
-			self.logger.error("|{}| Tried sending line '{}' to server, but a '{}' exception was raised: {}".format(self.serverfolder, lineToSend, type(e).__name__, e))
+			self.logger.error("|{}| Tried sending {} line(s) to the server, but a '{}' exception was raised: {}".format(self.serverfolder, len(linesToSend), type(e).__name__, e))
 
 	def irc_ERR_NOTEXTTOSEND(self, prefix, params):
 		self.logger.error("|{}| We just sent an empty line to the server, which is probably a bug in a module!".format(self.serverfolder))
@@ -488,37 +855,24 @@ class DideRobot(object):
 	def formatCtcpMessage(ctcpType, messageText):
 		return "{delim}{ctcpType} {msg}{delim}".format(delim=Constants.CTCP_DELIMITER, ctcpType=ctcpType, msg=messageText)
 
-	def sendLineFromQueue(self):
-		try:
-			while True:
-				#Verify that we're still connected and there is still a message in the queue, otherwise reset everything
-				if self.connectedAt is None or not self.linesToSend or len(self.linesToSend) == 0:
-					self.linesToSend = None
-					self.lineSendingGreenlet = None
-					break
-				#Remove the first queued message and send it
-				self.sendLineToServer(self.linesToSend.pop(0))
-				#Keep going through the message queue until it's empty
-				gevent.sleep(self.secondsBetweenLineSends)
-		except gevent.GreenletExit:
-			self.logger.info("|{}| Line sender greenlet was killed".format(self.serverfolder))
-
-	def queueLineToSend(self, lineToSend):
-		#If there's no rate limiting, there's no need for queueing either. Send the message now
-		if not self.secondsBetweenLineSends:
-			self.sendLineToServer(lineToSend)
-			return
-		#If there are no lines queued, the list is set to 'None'. Create a new list
-		if not self.linesToSend:
-			self.linesToSend = [lineToSend]
-		# Add the message to the queue
-		else:
-			self.linesToSend.append(lineToSend)
-		# If there's not yet a greenlet clearing the message queue, create one
-		if not self.lineSendingGreenlet:
-			self.lineSendingGreenlet = gevent.spawn(self.sendLineFromQueue)
+	def queueLineToSend(self, lineToSend, target=None, priority=LineScheduler.PRIORITY_REPLY, shouldLogLine=True):
+		"""
+		Queue a line to be sent to the server. Lines are sent in order of priority, and lines with the same priority take turns per target, so a busy target can't hold up the others
+		:param lineToSend: The line to send
+		:param target: The channel or user the line is meant for, if any
+		:param priority: The priority of the line, one of the 'PRIORITY_' constants in the LineScheduler module
+		:param shouldLogLine: Whether the line should be written to the program log when it gets sent
+		"""
+		self.lineScheduler.queueLine(lineToSend, target, priority, shouldLogLine)
+
+	def queueLinesToSend(self, linesToSend, target=None, priority=LineScheduler.PRIORITY_REPLY, shouldLogLines=True):
+		"""
+		Queue multiple lines for the same target at once. They will be sent in the provided order. See 'queueLineToSend' for the other parameters
+		:param linesToSend: A list of the lines to send
+		"""
+		self.lineScheduler.queueLines(linesToSend, target, priority, shouldLogLines)
 
-	def sendMessage(self, target, messageText, messageType=MessageTypes.SAY):
+	def sendMessage(self, target, messageText, messageType=MessageTypes.SAY, priority=LineScheduler.PRIORITY_REPLY):
 		if not target or not messageText:
 			self.logger.warning("Asked to send an empty message or send a message to an empty target. Target: '{}', messageText: '{}'".format(target, messageText))
 			return
@@ -529,55 +883,70 @@ class DideRobot(object):
 			if messageType == MessageTypes.ACTION:
 				#An action is just a special type of Say
 				logtext += "*"
-				messageText = self.formatCtcpMessage(MessageTypes.ACTION, messageText)
 			elif messageType == MessageTypes.NOTICE:
 				logtext += "[notice] "
 				messageCommand = MessageTypes.NOTICE
 			logtext += "{user}: {message}"
 			if self.settings.get('textDecoration', 'irc') != 'irc':
 				messageText = IrcFormattingUtil.removeFormatting(messageText)
-			extraMessages = None
-			# Turn newlines in this message into multiple messages
+			# Turn newlines in this message into multiple messages. Don't use 'splitlines' for this, since that also splits on some characters that IRC uses for formatting
 			if '\n' in messageText or '\r' in messageText:
-				extraMessages = messageText.splitlines()
-				messageText = extraMessages.pop(0)
-			# Check if the message isn't too long to send
-			maxMessageLength = Constants.MAX_LINE_LENGTH - self.calculateMessagePrefixLength(target, messageType)
-			if len(messageText) > maxMessageLength:
-				if not extraMessages:
-					extraMessages = []
-				extraMessages.insert(0, messageText[maxMessageLength + 1:])
-				messageText = messageText[:maxMessageLength + 1]
-			line = "{} {} :{}".format(messageCommand, target, messageText)
-			if target[0] not in Constants.CHANNEL_PREFIXES:
-				#If it's a PM, bypass the message queue
-				self.sendLineToServer(line)
+				messageLines = messageText.replace('\r\n', '\n').replace('\r', '\n').split('\n')
 			else:
-				self.queueLineToSend(line)
-			self.messageLogger.log(logtext.format(user=self.nickname, message=messageText), target)
-			#Make sure any non-empty extra lines get sent too
-			if extraMessages:
-				for extraMessage in extraMessages:
-					if extraMessage:
-						self.sendMessage(target, extraMessage, messageType)
-
-	def sendLengthLimitedMessage(self, target, messageTextToShorten, suffix=None, messageType=MessageTypes.SAY):
+				messageLines = (messageText,)
+			# Lines that are too long to send need to be split up too. The line length limit is in bytes, so split on that
+			maxMessageLength = self.maxLineLength - self.calculateMessagePrefixLength(target, messageType)
+			messageParts = []
+			for messageLine in messageLines:
+				if messageLine:
+					messageParts.extend(IrcFormattingUtil.splitTextByByteLength(messageLine, maxMessageLength))
+			if not messageParts:
+				return
+			linePrefix = "{} {} :".format(messageCommand, target)
+			if messageType == MessageTypes.ACTION:
+				linesToSend = [linePrefix + self.formatCtcpMessage(MessageTypes.ACTION, messagePart) for messagePart in messageParts]
+			else:
+				linesToSend = [linePrefix + messagePart for messagePart in messageParts]
+			self.queueLinesToSend(linesToSend, target, priority)
+			#A message can get sent to multiple targets at once, log it for each of them
+			logTargets = target.split(',')
+			for messagePart in messageParts:
+				logLine = logtext.format(user=self.nickname, message=messagePart)
+				for logTarget in logTargets:
+					self.messageLogger.log(logLine, logTarget)
+
+	def sendLengthLimitedMessage(self, target, messageTextToShorten, suffix=None, messageType=MessageTypes.SAY, priority=LineScheduler.PRIORITY_REPLY):
 		"""
 		Send a message to the provided target, limited to the maximum length allowed for a message to that target
-		:param target: The user or channel to send the message to
+		:param target: The user or channel to send the message to, or multiple targets combined by 'combineMessageTargets'
 		:param messageTextToShorten: The main message text that will be shortened if it exceeds the maximum message length, taking the suffix into account
 		:param suffix: An optional string to add to the end of the messageTextToShorten. This suffix will not be shortened, and its length will be taken into account when shortening the messageText
 		:type suffix: str
 		:param messageType: The type of the message to send, or a normal text message if not provided
+		:param priority: The priority of the message, one of the 'PRIORITY_' constants in the LineScheduler module. Direct replies to users by default, use the background priority for announcements
 		"""
-		maxMessageLength = Constants.MAX_LINE_LENGTH - self.calculateMessagePrefixLength(target, messageType)
+		maxMessageLength = self.maxLineLength - self.calculateMessagePrefixLength(target, messageType)
 		if self.settings.get('textDecoration', 'irc') != 'irc':
 			messageTextToShorten = IrcFormattingUtil.removeFormatting(messageTextToShorten)
 		shortenedMessageText = StringUtil.limitStringLength(messageTextToShorten, maxMessageLength, suffixes=suffix)
-		self.sendMessage(target, shortenedMessageText, messageType)
+		# The maximum length is in bytes but 'limitStringLength' counts characters, so if there are multi-byte characters, it needs to be shortened some more
+		# Each removed character is at least one byte, so this usually only needs one extra pass
+		excessByteCount = len(shortenedMessageText.encode('utf-8')) - maxMessageLength
+		while excessByteCount > 0:
+			shortenedMessageText = StringUtil.limitStringLength(messageTextToShorten, len(shortenedMessageText) - excessByteCount, suffixes=suffix)
+			excessByteCount = len(shortenedMessageText.encode('utf-8')) - maxMessageLength
+		self.sendMessage(target, shortenedMessageText, messageType, priority)
 
 	def calculateMessagePrefixLength(self, target, messageType):
 		# Format of a server-side message (to send our message to everybody in a channel) is ':[nick,32]![username,12]@[hostmask,64] PRIVMSG [target,64] :[messagetext]'
+		if self.userAddress:
+			# We know how the server shows our address to others, so we can calculate the exact length: 'nick!user@host' plus the command and the target, plus two colons and three spaces
+			messageCommand = MessageTypes.NOTICE if messageType == MessageTypes.NOTICE else MessageTypes.SAY
+			prefixLength = len(self.nickname) + 1 + len(self.userAddress) + len(messageCommand) + len(target.encode('utf-8')) + 5
+			# Action messages are normal text messages with an extra CTCP part, '[CTCP delimiter]ACTION ' at the start and the CTCP delimiter at the end
+			if messageType == MessageTypes.ACTION:
+				prefixLength += 9
+			return prefixLength
 		# Assume the maximum length for realname and hostname since we don't know if those are set properly or changed server-side
 		prefixLength = len(target) + len(messageType) + 83  # +12 (realname), +64 (hostname), +7 (colons, spaces, etc), = 83
 		if self.nickname:
@@ -590,6 +959,43 @@ class DideRobot(object):
 			prefixLength += 10
 		return prefixLength
 
+	def combineMessageTargets(self, targets: List[str], messageType: str = MessageTypes.SAY) -> List[str]:
+		"""
+		Combine the provided targets into as few target strings as the server allows, so the same message can be sent to multiple targets with fewer lines, which means less waiting on rate limiting
+		:param targets: The channels and/or users the same message needs to be sent to
+		:param messageType: The type of message that will be sent, since servers can have different target limits for different message types
+		:return: A list of target strings, each of which can be used as the target in 'sendMessage' or 'sendLengthLimitedMessage'. If the server doesn't allow multiple targets, this is just the provided targets
+		"""
+		messageCommand = MessageTypes.NOTICE if messageType == MessageTypes.NOTICE else MessageTypes.SAY
+		return self._combineTargets(targets, messageCommand)
+
+	def _combineTargets(self, targets: List[str], command: str, maxCombinedLength: int = None) -> List[str]:
+		"""
+		Combine the provided targets into comma-separated target strings, as far as the server's target limit for the provided command allows
+		:param targets: The targets to combine
+		:param command: The IRC command the targets are for, like 'PRIVMSG' or 'JOIN'
+		:param maxCombinedLength: If provided, combined target strings won't be made longer than this
+		:return: A list of target strings. If the server doesn't allow multiple targets for the command, this is just the provided targets
+		"""
+		maxTargets = self.maxTargetsPerCommand.get(command, 1)
+		if maxTargets is None:
+			maxTargets = len(targets)
+		if maxTargets <= 1 or len(targets) <= 1:
+			return list(targets)
+		combinedTargets = []
+		currentTargets = []
+		currentLength = -1  # Start at -1 since the first target doesn't need a comma before it
+		for target in targets:
+			if currentTargets and (len(currentTargets) >= maxTargets or (maxCombinedLength and currentLength + 1 + len(target) > maxCombinedLength)):
+				combinedTargets.append(",".join(currentTargets))
+				currentTargets = []
+				currentLength = -1
+			currentTargets.append(target)
+			currentLength += 1 + len(target)
+		if currentTargets:
+			combinedTargets.append(",".join(currentTargets))
+		return combinedTargets
+
 	def getCommandAllowAndBlockLists(self, channel: str = None) -> Tuple[Union[None, List[str]], Union[None, List[str]]]:
 		"""
 		Get the command allow and block lists for this bot, optionally for the specified channel. Can be useful if you'ree going to iterate over commands and check permissions, so you don't have to keep getting the allow and/or block lists
@@ -608,43 +1014,59 @@ class DideRobot(object):
 
 	#USER LIST CHECKING FUNCTIONS
 	def isUserAdmin(self, user, userNick=None, userAddress=None):
-		return self._isUserInList(self.settings['admins'], user, userNick, userAddress)
+		return self._isUserInList(self.settings.get('admins'), user, userNick, userAddress)
 
 	def shouldUserBeIgnored(self, user, userNick=None, userAddress=None):
-		return self._isUserInList(self.settings['userIgnoreList'], user, userNick, userAddress)
+		return self._isUserInList(self.settings.get('userIgnoreList'), user, userNick, userAddress)
 
 	def doesUserHavePermission(self, permissionLevel: PermissionLevel.PermissionLevel, user: str, userNick: str, userAddress: str, channel: str = None) -> bool:
 		if permissionLevel <= PermissionLevel.BASIC:
 			return True
-		if permissionLevel <= PermissionLevel.BOT and self._isUserInList(self.settings['admins'], user, userNick, userAddress):
+		if permissionLevel <= PermissionLevel.BOT and self._isUserInList(self.settings.get('admins'), user, userNick, userAddress):
 			return True
-		elif permissionLevel <= PermissionLevel.SERVER and self._isUserInList(self.settings.get('serverAdmins', []), user, userNick, userAddress):
+		elif permissionLevel <= PermissionLevel.SERVER and self._isUserInList(self.settings.get('serverAdmins'), user, userNick, userAddress):
 			return True
-		elif permissionLevel <= PermissionLevel.CHANNEL and self._isUserInList(self.settings.get('channelAdmins', [], channel), user, userNick, userAddress):
+		elif permissionLevel <= PermissionLevel.CHANNEL and self._isUserInList(self.settings.get('channelAdmins', None, channel), user, userNick, userAddress):
 			return True
 		return False
 
 	def getUserPermissionLevel(self, user: str, userNick: str, userAddress: str, channel: str = None):
-		if self._isUserInList(self.settings['admins'], user, userNick, userAddress):
+		if self._isUserInList(self.settings.get('admins'), user, userNick, userAddress):
 			return PermissionLevel.BOT
-		elif self._isUserInList(self.settings.get('serverAdmins', []), user, userNick, userAddress):
+		elif self._isUserInList(self.settings.get('serverAdmins'), user, userNick, userAddress):
 			return PermissionLevel.SERVER
-		elif self._isUserInList(self.settings.get('channelAdmins', [], channel), user, userNick, userAddress):
+		elif self._isUserInList(self.settings.get('channelAdmins', None, channel), user, userNick, userAddress):
 			return PermissionLevel.CHANNEL
 		return PermissionLevel.BASIC
 
-	@staticmethod
-	def _isUserInList(userlist, user, userNick=None, userAddress=None) -> bool:
-		if user is None:
+	def _isUserInList(self, userlist, user, userNick=None, userAddress=None) -> bool:
+		"""
+		Check whether the provided user matches an entry in the provided user list from the settings. Entries can contain wildcards, see the HostmaskMatcher class
+		The result is cached per user until the settings change or the user changes nick or quits, since this gets checked for every message
+		:param userlist: The user list from the settings, as returned by 'self.settings.get', so it stays the same object until the settings change
+		"""
+		if not userlist or user is None:
 			return False
-		if user in userlist or user.lower() in userlist:
-			return True
-		#If a usernick is provided, use that, otherwise split the full user address ourselves (if possible)
-		if userNick is None or userAddress is None:
-			if '!' in user:
-				userNick, userAddress = user.split('!', 1)
-			else:
-				return False
-		if userNick in userlist or userNick.lower() in userlist or userAddress in userlist or userAddress.lower() in userlist:
-			return True
-		return False
+		if self._userListsSettingsVersion != self.settings.version:
+			self._hostmaskMatchers = {}
+			self._userInListResults = {}
+			self._userListsSettingsVersion = self.settings.version
+		resultsForUser = self._userInListResults.get(user, None)
+		if resultsForUser is None:
+			#Users that left without us seeing a quit would stay in the cache, so keep it from growing endlessly
+			if len(self._userInListResults) >= 2000:
+				self._userInListResults = {}
+			resultsForUser = {}
+			self._userInListResults[user] = resultsForUser
+		else:
+			result = resultsForUser.get(id(userlist), None)
+			if result is not None:
+				return result
+		matcherEntry = self._hostmaskMatchers.get(id(userlist), None)
+		if matcherEntry is None:
+			#Store the list too, so its ID can't get reused by another list while the matcher exists
+			matcherEntry = (userlist, HostmaskMatcher(userlist))
+			self._hostmaskMatchers[id(userlist)] = matcherEntry
+		result = matcherEntry[1].matches(user, userNick, userAddress)
+		resultsForUser[id(userlist)] = result
+		return result
@@ -2,7 +2,9 @@ import os, typing
 if typing.TYPE_CHECKING:
 	from BotHandler import BotHandler
 	from CommandHandler import CommandHandler
+	from StartupProfiler import StartupProfiler
 
 scriptfolder: str = os.path.dirname(os.path.abspath(__file__))
 bothandler: "BotHandler" = None
 commandhandler: "CommandHandler" = None
+startupProfiler: "StartupProfiler" = None  # Only set while starting up with startup profiling enabled
@@ -0,0 +1,59 @@
+import re
+from typing import Iterable, Union
+
+
+class HostmaskMatcher(object):
+	"""
+	Checks whether a user matches any entry of a user list from the settings, like the admin or ignore lists
+	Entries can be a full user address ('nick!user@host'), a nickname, or a 'user@host' address. Entries with '*' or '?' wildcards are matched case-insensitively,
+	  so '*!*@example.com' matches everybody from that host. Wildcard entries without a '!' are matched against the nickname and the 'user@host' address separately
+	Literal entries are stored in a set and the wildcard entries are combined into a single regex, so checking a user takes the same time no matter how long the list is
+	"""
+
+	def __init__(self, userlist: Iterable[str]):
+		self.literalEntries = set()
+		fullAddressMasks = []
+		partialMasks = []
+		for entry in userlist:
+			if '*' in entry or '?' in entry:
+				maskRegex = re.escape(entry).replace(r'\*', '.*').replace(r'\?', '.')
+				if '!' in entry:
+					fullAddressMasks.append(maskRegex)
+				else:
+					partialMasks.append(maskRegex)
+			else:
+				self.literalEntries.add(entry)
+		self.fullAddressMaskRegex = HostmaskMatcher._combineMasks(fullAddressMasks)
+		self.partialMaskRegex = HostmaskMatcher._combineMasks(partialMasks)
+
+	@staticmethod
+	def _combineMasks(maskRegexes) -> Union[re.Pattern, None]:
+		if not maskRegexes:
+			return None
+		return re.compile("(?:{})".format("|".join(maskRegexes)), re.IGNORECASE)
+
+	def matches(self, user: str, userNick: str = None, userAddress: str = None) -> bool:
+		"""
+		Check whether the provided user matches an entry of the user list
+		:param user: The full user address, in 'nick!user@host' format
+		:param userNick: The nickname part of the full user address. If this or 'userAddress' isn't provided, they're split from the full user address
+		:param userAddress: The 'user@host' part of the full user address
+		:return: True if the user matches an entry in the list, False otherwise
+		"""
+		if user is None:
+			return False
+		literalEntries = self.literalEntries
+		if user in literalEntries or user.lower() in literalEntries:
+			return True
+		if userNick is None or userAddress is None:
+			if '!' in user:
+				userNick, userAddress = user.split('!', 1)
+			else:
+				userNick = userAddress = None
+		if userNick is not None and (userNick in literalEntries or userNick.lower() in literalEntries or userAddress in literalEntries or userAddress.lower() in literalEntries):
+			return True
+		if self.fullAddressMaskRegex and self.fullAddressMaskRegex.fullmatch(user):
+			return True
+		if self.partialMaskRegex and (self.partialMaskRegex.fullmatch(user) or (userNick is not None and (self.partialMaskRegex.fullmatch(userNick) or self.partialMaskRegex.fullmatch(userAddress)))):
+			return True
+		return False
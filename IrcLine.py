@@ -0,0 +1,102 @@
+from typing import Dict, List, Union
+
+
+class IrcLine(object):
+	"""
+	A single line received from an IRC server, split into its parts: the optional IRCv3 message tags, the optional prefix, the verb, and the parameters
+	Message tags are only parsed when the 'tags' field is read, since most lines don't need them
+	"""
+	__slots__ = ('_rawTags', '_tags', 'prefix', 'verb', 'params')
+
+	def __init__(self, rawTags: Union[None, str], prefix: Union[None, str], verb: str, params: List[str]):
+		self._rawTags = rawTags  # The unparsed tags string, without the starting '@', or None if the line didn't have tags
+		self._tags = None  # Gets filled with a dict the first time the tags are requested
+		self.prefix = prefix  # The source of the line without the starting colon, usually a server name or a 'nick!user@host' user address. None if the line didn't have a prefix
+		self.verb = verb  # The command or numeric reply, like 'PRIVMSG' or '001'
+		self.params = params  # A list of the parameters, with the trailing parameter (the one starting with a colon) as the last entry, without its colon
+
+	@property
+	def tags(self) -> Dict[str, str]:
+		"""A dictionary of the IRCv3 message tags of this line, with unescaped values. Tags without a value have an empty string as value"""
+		if self._tags is None:
+			self._tags = parseTags(self._rawTags) if self._rawTags else {}
+		return self._tags
+
+	def __repr__(self):
+		return "<IrcLine tags={!r} prefix={!r} verb={!r} params={!r}>".format(self._rawTags, self.prefix, self.verb, self.params)
+
+
+_TAG_VALUE_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+def _unescapeTagValue(tagValue: str) -> str:
+	if '\\' not in tagValue:
+		return tagValue
+	unescapedParts = []
+	index = 0
+	tagValueLength = len(tagValue)
+	while index < tagValueLength:
+		backslashIndex = tagValue.find('\\', index)
+		if backslashIndex == -1:
+			unescapedParts.append(tagValue[index:])
+			break
+		unescapedParts.append(tagValue[index:backslashIndex])
+		# A backslash at the very end of a value should just be dropped, and an unknown escape sequence becomes the escaped character
+		if backslashIndex + 1 < tagValueLength:
+			escapedCharacter = tagValue[backslashIndex + 1]
+			unescapedParts.append(_TAG_VALUE_ESCAPES.get(escapedCharacter, escapedCharacter))
+		index = backslashIndex + 2
+	return "".join(unescapedParts)
+
+def parseTags(rawTags: str) -> Dict[str, str]:
+	"""
+	Parse an IRCv3 message tags string into a dictionary, as specified in https://ircv3.net/specs/extensions/message-tags
+	:param rawTags: The tags part of a line, without the starting '@' (so for instance 'time=2023-01-01T12:00:00.000Z;+draft/reply=abc')
+	:return: A dictionary with the tag keys as keys and the unescaped tag values as values. Tags without a value get an empty string as value. If a key appears more than once, the last value is used
+	"""
+	tags = {}
+	for tag in rawTags.split(';'):
+		if not tag:
+			continue
+		key, separator, value = tag.partition('=')
+		tags[key] = _unescapeTagValue(value)
+	return tags
+
+def parseLine(line: str) -> IrcLine:
+	"""
+	Parse a single line received from an IRC server into its separate parts
+	The line format is '[@tags] [:prefix] verb [params...] [:trailing param]', parts can be separated by more than one space
+	:param line: The line to parse, without the line-ending '\\r\\n'
+	:return: An IrcLine instance with the parts of the provided line
+	:raise ValueError: Raised when the provided line doesn't contain a verb
+	"""
+	rawTags = None
+	prefix = None
+	if line.startswith('@'):
+		rawTags, separator, line = line[1:].partition(' ')
+		line = line.lstrip(' ')
+	if line.startswith(':'):
+		prefix, separator, line = line[1:].partition(' ')
+		line = line.lstrip(' ')
+	verb, separator, paramsString = line.partition(' ')
+	if not verb:
+		raise ValueError("IRC line doesn't contain a verb")
+	paramsString = paramsString.lstrip(' ')
+	if not paramsString:
+		return IrcLine(rawTags, prefix, verb, [])
+
+	# The trailing parameter is the first one starting with a colon. It's always the last parameter, and it can contain spaces
+	if paramsString.startswith(':'):
+		return IrcLine(rawTags, prefix, verb, [paramsString[1:]])
+	trailingStartIndex = paramsString.find(' :')
+	if trailingStartIndex == -1:
+		params = paramsString.split(' ')
+		trailingParam = None
+	else:
+		params = paramsString[:trailingStartIndex].split(' ')
+		trailingParam = paramsString[trailingStartIndex + 2:]
+	# Only multiple spaces in a row and trailing spaces lead to empty parameters, so skip the filtering if those can't be there
+	if '' in params:
+		params = [param for param in params if param]
+	if trailingParam is not None:
+		params.append(trailingParam)
+	return IrcLine(rawTags, prefix, verb, params)
@@ -1,4 +1,3 @@
-import re
 import time
 import typing
 if typing.TYPE_CHECKING:
@@ -11,7 +10,12 @@ from PermissionLevel import PermissionLevel
 
 
 class IrcMessage(object):
-	"""Parses incoming messages into usable parts like the command trigger"""
+	"""
+	Parses incoming messages into usable parts like the command trigger
+	A lot of messages are never checked for a command, so the text-derived fields ('trigger', 'message', 'messageParts', and 'messagePartsLength') are only determined the first time they're needed
+	"""
+	__slots__ = ('createdAt', 'messageType', 'bot', 'user', 'userNickname', 'userAddress', 'source', 'isPrivateMessage', 'rawText', '_trigger', '_message', '_messageParts')
+	_NOT_PARSED = object()  # The value of the lazily determined fields until they're determined
 
 	def __init__(self, messageType, bot: 'DideRobot', user=None, source=None, rawText=""):
 		self.createdAt = time.time()
@@ -37,40 +41,62 @@ class IrcMessage(object):
 			self.source = source
 			self.isPrivateMessage = False
 
-		#Handle the text component, including seeing if it starts with the bot's command character
 		self.rawText = rawText.strip()
+		self._trigger = IrcMessage._NOT_PARSED
+		self._message = IrcMessage._NOT_PARSED
+		self._messageParts = None
+
+	def _parseText(self):
+		"""Determine the command trigger and the message text, by seeing if the text starts with the bot's command prefix or nickname"""
 		#There isn't always text
 		if not self.rawText:
-			self.trigger = None
-			self.message = ""
-			self.messageParts = []
-			self.messagePartsLength = 0
+			self._trigger = None
+			self._message = ""
+			return
+		#Collect information about the possible command in this message
+		commandPrefix = self.bot.settings.get("commandPrefix", None, self.source)
+		if commandPrefix and self.rawText.startswith(commandPrefix):
+			#Get the part from the end of the command prefix to the first space (the 'help' part of '!help say')
+			self._trigger = self.rawText[len(commandPrefix):].split(" ", 1)[0].lower()
+			self._message = self.rawText[len(commandPrefix) + len(self._trigger):].lstrip()
+		# Check if the text starts with the nick of the bot, and then something that could be a command trigger, for instance 'DideRobot help', '@DideRobot generate random', or 'DideRobot: source'
+		elif self.bot.nicknameAddressRegex and self.bot.nicknameAddressRegex.match(self.rawText):
+			messageParts = self.rawText.split(" ", 2)
+			self._trigger = messageParts[1].lower()
+			self._message = messageParts[2] if len(messageParts) > 2 else ""
+		#In private messages we should respond too if there's no command character, because there's no other reason to PM a bot
+		elif self.isPrivateMessage:
+			self._trigger = self.rawText.split(" ", 1)[0].lower()
+			self._message = self.rawText[len(self._trigger)+1:]
 		else:
-			#Collect information about the possible command in this message
-			commandPrefix = bot.settings.get("commandPrefix", None, self.source)
-			if commandPrefix and self.rawText.startswith(commandPrefix):
-				#Get the part from the end of the command prefix to the first space (the 'help' part of '!help say')
-				self.trigger = self.rawText[len(commandPrefix):].split(" ", 1)[0].lower()
-				self.message = self.rawText[len(commandPrefix) + len(self.trigger):].lstrip()
-			# Check if the text starts with the nick of the bot, and then something that could be a command trigger, for instance 'DideRobot help', '@DideRobot generate random', or 'DideRobot: source'
-			elif bot.nickname and bot.nickname in self.rawText and re.match(f"@?{bot.nickname}:? ", self.rawText):
-				messageParts = self.rawText.split(" ", 2)
-				self.trigger = messageParts[1].lower()
-				self.message = messageParts[2] if len(messageParts) > 2 else ""
-			#In private messages we should respond too if there's no command character, because there's no other reason to PM a bot
-			elif self.isPrivateMessage:
-				self.trigger = self.rawText.split(" ", 1)[0].lower()
-				self.message = self.rawText[len(self.trigger)+1:]
-			else:
-				self.trigger = None
-				self.message = self.rawText
-
-			if self.message:
-				self.messageParts = self.message.split(" ")
-				self.messagePartsLength = len(self.messageParts)
-			else:
-				self.messageParts = []
-				self.messagePartsLength = 0
+			self._trigger = None
+			self._message = self.rawText
+
+	@property
+	def trigger(self) -> typing.Optional[str]:
+		"""The command trigger in this message, in lowercase, or None if there isn't one"""
+		if self._trigger is IrcMessage._NOT_PARSED:
+			self._parseText()
+		return self._trigger
+
+	@property
+	def message(self) -> str:
+		"""The text of this message, without the command prefix and trigger if there was one"""
+		if self._message is IrcMessage._NOT_PARSED:
+			self._parseText()
+		return self._message
+
+	@property
+	def messageParts(self) -> typing.List[str]:
+		"""The message text split on spaces, or an empty list if there's no text"""
+		if self._messageParts is None:
+			message = self.message
+			self._messageParts = message.split(" ") if message else []
+		return self._messageParts
+
+	@property
+	def messagePartsLength(self) -> int:
+		return len(self.messageParts)
 
 	def _determineReplyMessageType(self):
 		# Reply with a notice to a user's notice (not a channel one, that spams everybody!), and with a normal message to anything else
@@ -0,0 +1,164 @@
+import collections, logging, time
+import typing
+if typing.TYPE_CHECKING:
+	from DideRobot import DideRobot
+
+import gevent
+
+from util.RateLimitUtil import TokenBucket
+
+
+#Lines get sent in order of priority. Lines with the same priority are sent round-robin per target, so one busy channel can't hold up the others
+PRIORITY_PROTOCOL = 0  # Lines the server or the connection depend on, like PONG replies, nick changes, and joining or leaving channels
+PRIORITY_REPLY = 1  # Direct replies to users, for instance to commands they called
+PRIORITY_BACKGROUND = 2  # Lines nobody is directly waiting for, like announcements from watcher modules
+_PRIORITIES = (PRIORITY_PROTOCOL, PRIORITY_REPLY, PRIORITY_BACKGROUND)
+
+
+class LineScheduler(object):
+	"""
+	Queues lines that need to be sent to the IRC server, and sends them paced by a token bucket
+	This way a short burst of lines can go out immediately, while the long-term rate stays below what the server allows
+	Lines are sent highest priority first, and within a priority each target gets a turn in round-robin order
+	All the lines that are allowed to be sent at the same moment are written to the socket together, to prevent a lot of tiny separate writes
+	"""
+
+	def __init__(self, bot: 'DideRobot'):
+		self.logger = logging.getLogger('DideRobot')
+		self.bot = bot
+		self.tokenBucket = None  # If it's 'None', there's no rate limiting, otherwise it's a TokenBucket that every sent line takes a token from
+		# For each priority, an ordered dict with targets as keys, and as value a deque of the lines queued for that target. The order of the targets is the order they get their turn in
+		# The deque entries are tuples with the line to send, the monotonic time it got queued at, and whether it should be logged when sent
+		self.queuesByPriority = tuple(collections.OrderedDict() for priority in _PRIORITIES)
+		self.queueLength = 0
+		self.lineSendingGreenlet = None  # Will store the greenlet that is currently working its way through the queue, or is None if there is none
+
+		#Statistics, so the pacing settings can be tuned per server
+		self.maxQueueLength = 0
+		self.sentQueuedLineCount = 0
+		self.totalSecondsInQueue = 0.0
+		self.maxSecondsInQueue = 0.0
+		self.socketWriteCount = 0
+
+	def setPacing(self, secondsBetweenLines: float = None, burstSize: int = 1):
+		"""
+		Set how fast lines can be sent
+		:param secondsBetweenLines: The average number of seconds between line sends, or None to disable rate limiting
+		:param burstSize: How many lines can be sent in quick succession before the pacing kicks in
+		"""
+		if not secondsBetweenLines:
+			self.tokenBucket = None
+		elif self.tokenBucket:
+			self.tokenBucket.setRate(burstSize, 1 / secondsBetweenLines)
+		else:
+			self.tokenBucket = TokenBucket(burstSize, 1 / secondsBetweenLines)
+
+	def queueLine(self, lineToSend: str, target: str = None, priority: int = PRIORITY_REPLY, shouldLogLine: bool = True):
+		"""
+		Queue a line to be sent to the server. If there's no rate limiting, it gets sent as soon as the current greenlet yields, together with any other lines queued before that
+		:param lineToSend: The line to send to the server
+		:param target: The channel or user this line is meant for, if any. Lines for different targets with the same priority take turns being sent
+		:param priority: The priority of the line, one of the 'PRIORITY_' constants in this module. Lines with a higher priority are always sent before lines with a lower priority
+		:param shouldLogLine: Whether the line should be written to the program log when it's sent
+		"""
+		self.queueLines((lineToSend,), target, priority, shouldLogLine)
+
+	def queueLines(self, linesToSend: typing.Iterable[str], target: str = None, priority: int = PRIORITY_REPLY, shouldLogLines: bool = True):
+		"""
+		Queue multiple lines for the same target at once, for instance all the parts of a message that was too long to fit in a single line. The lines will be sent in the provided order
+		The parameters are the same as for 'queueLine', except that 'linesToSend' is a list of lines
+		"""
+		if target:
+			target = target.lower()
+		targetQueues = self.queuesByPriority[priority]
+		targetQueue = targetQueues.get(target, None)
+		if targetQueue is None:
+			targetQueue = collections.deque()
+			targetQueues[target] = targetQueue
+		queuedAt = time.monotonic()
+		previousTargetQueueLength = len(targetQueue)
+		targetQueue.extend((lineToSend, queuedAt, shouldLogLines) for lineToSend in linesToSend)
+		addedLineCount = len(targetQueue) - previousTargetQueueLength
+		if addedLineCount == 0:
+			if previousTargetQueueLength == 0:
+				del targetQueues[target]
+			return
+		self.queueLength += addedLineCount
+		if self.queueLength > self.maxQueueLength:
+			self.maxQueueLength = self.queueLength
+		# If there's not yet a greenlet clearing the queue, create one
+		if not self.lineSendingGreenlet:
+			self.lineSendingGreenlet = gevent.spawn(self._sendQueuedLines)
+
+	def _popNextQueuedLine(self):
+		"""
+		Remove the line that should be sent next from the queue
+		:return: A tuple with the line, the time it was queued at, and whether it should be logged, or None if the queue is empty
+		"""
+		for targetQueues in self.queuesByPriority:
+			if targetQueues:
+				target, targetQueue = next(iter(targetQueues.items()))
+				queuedLineTuple = targetQueue.popleft()
+				#Move this target to the back of the line, so the other targets get their turn first
+				if targetQueue:
+					targetQueues.move_to_end(target)
+				else:
+					del targetQueues[target]
+				self.queueLength -= 1
+				return queuedLineTuple
+		return None
+
+	def _sendQueuedLines(self):
+		try:
+			while self.queueLength > 0:
+				#Verify that we're still connected, otherwise there's no use in sending anything
+				if self.bot.ircSocket is None:
+					self.clearQueue()
+					break
+				if self.tokenBucket:
+					secondsToWait = self.tokenBucket.getSecondsUntilAvailable()
+					if secondsToWait > 0:
+						gevent.sleep(secondsToWait)
+						continue
+				#Collect all the lines we're allowed to send right now, so they can be sent in a single write. Without rate limiting, that's all of them
+				linesToSend = []
+				now = time.monotonic()
+				while self.queueLength > 0 and (not self.tokenBucket or self.tokenBucket.tryConsume()):
+					lineToSend, queuedAt, shouldLogLine = self._popNextQueuedLine()
+					linesToSend.append((lineToSend, shouldLogLine))
+					secondsInQueue = now - queuedAt
+					self.totalSecondsInQueue += secondsInQueue
+					if secondsInQueue > self.maxSecondsInQueue:
+						self.maxSecondsInQueue = secondsInQueue
+				self.sentQueuedLineCount += len(linesToSend)
+				self.socketWriteCount += 1
+				self.bot.sendLinesToServer(linesToSend)
+		except gevent.GreenletExit:
+			self.logger.info("|{}| Line sender greenlet was killed".format(self.bot.serverfolder))
+		finally:
+			self.lineSendingGreenlet = None
+
+	def clearQueue(self):
+		for targetQueues in self.queuesByPriority:
+			targetQueues.clear()
+		self.queueLength = 0
+
+	def clear(self):
+		"""Stop sending lines and remove all the queued lines, for instance because the connection was lost"""
+		if self.lineSendingGreenlet:
+			self.lineSendingGreenlet.kill()
+			self.lineSendingGreenlet = None
+		self.clearQueue()
+
+	def getQueueLength(self, priority: int = None) -> int:
+		if priority is None:
+			return self.queueLength
+		return sum(len(targetQueue) for targetQueue in self.queuesByPriority[priority].values())
+
+	def getStatistics(self) -> typing.Dict[str, typing.Union[int, float]]:
+		"""
+		Get statistics about the queue, to see whether the pacing settings fit this server
+		:return: A dictionary with the current and maximum queue length, the number of lines sent through the queue and the number of socket writes that took, and the average and maximum number of seconds lines spent in the queue
+		"""
+		return {'queueLength': self.queueLength, 'maxQueueLength': self.maxQueueLength, 'sentLineCount': self.sentQueuedLineCount, 'socketWriteCount': self.socketWriteCount,
+				'averageSecondsInQueue': self.totalSecondsInQueue / self.sentQueuedLineCount if self.sentQueuedLineCount else 0.0, 'maxSecondsInQueue': self.maxSecondsInQueue}
@@ -0,0 +1,200 @@
+import bisect, datetime, gzip, io, json, logging, os, re
+from typing import Iterator, List, Tuple, Union
+
+import gevent
+import gevent.lock
+
+
+class MessageLogArchive(object):
+	"""
+	Compresses old message logs, and reads (parts of) both plain and compressed message logs
+	Compressed logs are gzip files made up of separately compressed blocks of lines, so they can still be read with any gzip tool. Next to each compressed log
+	  an index file is stored with the time of the first line in each block and where that block starts, so reading a time window only has to decompress the blocks in that window
+	In plain log files, the start of a time window is found with a binary search on the line times, since log lines are written in order
+	Lines are read one at a time, so even large logs don't have to be loaded into memory completely
+	"""
+
+	BLOCK_SIZE = 65536  # How many bytes of log lines go into a single compressed block
+	ARCHIVE_EXTENSION = '.gz'
+	ARCHIVE_INDEX_EXTENSION = '.index'
+	COMPRESSION_LEVEL = 6  # gzip's default of 9 is a lot slower and barely makes logs smaller
+
+	_LOG_FILENAME_REGEX = re.compile(r"(.+)-(\d{4}-\d\d-\d\d)\.log")
+
+	def __init__(self, logfolder: str):
+		"""
+		:param logfolder: The folder with the log files to archive and read
+		"""
+		self.logger = logging.getLogger('DideRobot')
+		self.logfolder = logfolder
+		self._lock = gevent.lock.Semaphore()  # Makes sure only one archiving run happens at a time
+
+	@staticmethod
+	def getLineTime(logline: Union[str, bytes]) -> Union[str, bytes, None]:
+		"""
+		Get the time a log line was logged at, in 'HH:MM:SS' format
+		:param logline: The log line to get the time of, as a string or as bytes
+		:return: The time of the log line, as the same type as the provided log line, or None if the line doesn't start with a time
+		"""
+		if len(logline) >= 10 and logline[0:1] in ('[', b'[') and logline[9:10] in (']', b']'):
+			return logline[1:9]
+		return None
+
+	def archiveOldLogs(self, maxAgeInDays: int) -> int:
+		"""
+		Compress the log files that are older than the provided number of days, and remove the uncompressed files. This runs in a thread, so it doesn't block the bots
+		:param maxAgeInDays: Log files from more than this many days ago get compressed. Can't be lower than 1, so logs that could still be written to aren't compressed
+		:return: The number of log files that were compressed
+		"""
+		lastDayToArchive = (datetime.date.today() - datetime.timedelta(days=max(1, maxAgeInDays) + 1)).isoformat()
+		with self._lock:
+			return gevent.get_hub().threadpool.apply(self._archiveOldLogs, (lastDayToArchive,))
+
+	def _archiveOldLogs(self, lastDayToArchive: str) -> int:
+		archivedFileCount = 0
+		for logfilename in sorted(os.listdir(self.logfolder)):
+			filenameMatch = self._LOG_FILENAME_REGEX.fullmatch(logfilename)
+			if not filenameMatch or filenameMatch.group(2) > lastDayToArchive:
+				continue
+			try:
+				self._archiveLogfile(os.path.join(self.logfolder, logfilename))
+				archivedFileCount += 1
+			except OSError as e:
+				self.logger.error("[MessageLogArchive] Unable to archive log file '{}': {}".format(logfilename, e))
+		return archivedFileCount
+
+	def _archiveLogfile(self, logfilePath: str):
+		archivePath = logfilePath + self.ARCHIVE_EXTENSION
+		archiveIndexPath = logfilePath + self.ARCHIVE_INDEX_EXTENSION
+		blockIndex = []  # A list of [time of first line, offset of block] lists
+		with open(logfilePath, 'rb') as logfile, open(archivePath + '.tmp', 'wb') as archivefile:
+			blockLines = []
+			blockSize = 0
+			blockStartTime = None
+			lastLineTime = b'00:00:00'
+			for logline in logfile:
+				lineTime = self.getLineTime(logline) or lastLineTime
+				if not blockLines:
+					blockStartTime = lineTime
+				blockLines.append(logline)
+				blockSize += len(logline)
+				lastLineTime = lineTime
+				if blockSize >= self.BLOCK_SIZE:
+					blockIndex.append([blockStartTime.decode('utf-8'), archivefile.tell()])
+					archivefile.write(gzip.compress(b"".join(blockLines), compresslevel=self.COMPRESSION_LEVEL))
+					blockLines = []
+					blockSize = 0
+			if blockLines:
+				blockIndex.append([blockStartTime.decode('utf-8'), archivefile.tell()])
+				archivefile.write(gzip.compress(b"".join(blockLines), compresslevel=self.COMPRESSION_LEVEL))
+		with open(archiveIndexPath + '.tmp', 'w', encoding='utf-8') as archiveIndexFile:
+			json.dump(blockIndex, archiveIndexFile)
+		#Only replace the plain log file once the archive is completely written, so a crash halfway through doesn't lose any logs
+		os.replace(archiveIndexPath + '.tmp', archiveIndexPath)
+		os.replace(archivePath + '.tmp', archivePath)
+		os.remove(logfilePath)
+
+	def hasLog(self, sanitizedSource: str, day: str) -> bool:
+		"""
+		Check whether there's a plain or compressed log for the provided source and day
+		:param sanitizedSource: The source (channel or nickname) of the log, as sanitized by the MessageLogger
+		:param day: The day of the log, in 'yyyy-mm-dd' format
+		"""
+		logfilePath = os.path.join(self.logfolder, "{}-{}.log".format(sanitizedSource, day))
+		return os.path.isfile(logfilePath) or os.path.isfile(logfilePath + self.ARCHIVE_EXTENSION)
+
+	def iterateLogLines(self, sanitizedSource: str, startDateTime: datetime.datetime, endDateTime: datetime.datetime) -> Iterator[Tuple[str, str]]:
+		"""
+		Read the lines logged for the provided source between the provided start and end times, which can span multiple days. Days without a log are skipped
+		This reads from disk while iterating, so when reading a large window, it's best to iterate in a thread
+		:param sanitizedSource: The source (channel or nickname) to read the log of, as sanitized by the MessageLogger
+		:param startDateTime: The time of the first line to return
+		:param endDateTime: The time of the last line to return, inclusive
+		:return: A generator that yields (day, log line) tuples, with the day in 'yyyy-mm-dd' format and the log line including the newline at the end
+		"""
+		day = startDateTime.date()
+		while day <= endDateTime.date():
+			dayString = day.isoformat()
+			startTime = startDateTime.strftime("%H:%M:%S") if day == startDateTime.date() else None
+			endTime = endDateTime.strftime("%H:%M:%S") if day == endDateTime.date() else None
+			for logline in self.readDayLines(sanitizedSource, dayString, startTime, endTime):
+				yield dayString, logline
+			day += datetime.timedelta(days=1)
+
+	def readDayLines(self, sanitizedSource: str, day: str, startTime: str = None, endTime: str = None) -> Iterator[str]:
+		"""
+		Read the lines logged for the provided source on the provided day, from either the plain or the compressed log
+		:param sanitizedSource: The source (channel or nickname) to read the log of, as sanitized by the MessageLogger
+		:param day: The day to read the log of, in 'yyyy-mm-dd' format
+		:param startTime: If provided, only lines from this time or later are returned. Should be in 'HH:MM:SS' format
+		:param endTime: If provided, only lines from this time or earlier are returned. Should be in 'HH:MM:SS' format
+		:return: A generator that yields the matching log lines, including the newline at the end. Yields nothing if there's no log for that day
+		"""
+		logfilePath = os.path.join(self.logfolder, "{}-{}.log".format(sanitizedSource, day))
+		isArchived = False
+		if os.path.isfile(logfilePath):
+			rawLogfile = open(logfilePath, 'rb')
+			if startTime:
+				rawLogfile.seek(self._findStartOffsetInLogfile(rawLogfile, startTime.encode('utf-8')))
+		elif os.path.isfile(logfilePath + self.ARCHIVE_EXTENSION):
+			isArchived = True
+			rawLogfile = open(logfilePath + self.ARCHIVE_EXTENSION, 'rb')
+			if startTime:
+				rawLogfile.seek(self._findStartOffsetInArchive(logfilePath + self.ARCHIVE_INDEX_EXTENSION, startTime))
+		else:
+			return
+		with rawLogfile:
+			#Each compressed block is a separate gzip member, and the gzip reader continues with the next member when it reaches the end of one
+			logfile = gzip.GzipFile(fileobj=rawLogfile) if isArchived else rawLogfile
+			#Decoding the log in chunks is a lot faster than decoding it line by line
+			logfile = io.TextIOWrapper(logfile, encoding='utf-8', errors='replace', newline='\n')
+			if not startTime and not endTime:
+				yield from logfile
+				return
+			for logline in logfile:
+				lineTime = self.getLineTime(logline)
+				if lineTime is not None:
+					if startTime and lineTime < startTime:
+						continue
+					if endTime and lineTime > endTime:
+						break
+					#Once we're past the start time, lines can't be earlier than it anymore, so stop checking
+					startTime = None
+				elif startTime:
+					continue
+				yield logline
+
+	def _findStartOffsetInLogfile(self, logfile, startTime: bytes) -> int:
+		"""Find an offset in a plain log file shortly before the first line logged at or after the provided time, by doing a binary search on the line times"""
+		lowOffset = 0
+		highOffset = os.fstat(logfile.fileno()).st_size
+		while highOffset - lowOffset > 4096:
+			middleOffset = (lowOffset + highOffset) // 2
+			logfile.seek(middleOffset)
+			#We probably landed in the middle of a line, skip to the start of the next one
+			logfile.readline()
+			lineTime = self.getLineTime(logfile.readline())
+			if lineTime is not None and lineTime < startTime:
+				lowOffset = middleOffset
+			else:
+				highOffset = middleOffset
+		#The lowest offset is either the start of the file or in the middle of a line that's too early, so skip to the start of the next line
+		logfile.seek(lowOffset)
+		if lowOffset > 0:
+			logfile.readline()
+		return logfile.tell()
+
+	def _findStartOffsetInArchive(self, archiveIndexPath: str, startTime: str) -> int:
+		"""Find the offset of the compressed block that contains the first line logged at or after the provided time, using the archive's block index"""
+		try:
+			with open(archiveIndexPath, 'r', encoding='utf-8') as archiveIndexFile:
+				blockIndex: List[List] = json.load(archiveIndexFile)
+		except (OSError, ValueError) as e:
+			#Without an index we can still read the whole archive, it's just slower
+			self.logger.warning("[MessageLogArchive] Unable to read archive index '{}', reading the whole archive: {}".format(archiveIndexPath, e))
+			return 0
+		if not blockIndex:
+			return 0
+		#Lines at the start time could be at the end of the block before the first block that starts at that time, so start at that earlier block
+		blockNumber = max(0, bisect.bisect_left([blockStartTime for blockStartTime, blockOffset in blockIndex], startTime) - 1)
+		return blockIndex[blockNumber][1]
@@ -0,0 +1,161 @@
+import logging, os, re, sqlite3
+from typing import Iterable, List, Tuple, Union
+
+import gevent
+import gevent.lock
+
+import Constants
+
+
+class MessageLogIndex(object):
+	"""
+	A full-text search index of the channel logs of a single server, stored in an SQLite database with an FTS5 table
+	Log files are indexed incrementally: for each log file the index remembers up to where it's been read, so only new lines need to be read on the next update
+	Updates and searches run in a thread, so they don't block the bots. Private message logs aren't indexed
+	"""
+
+	#Parses a log line into its time, nickname, and text. Lines without a nickname, like joins and quits, get 'None' as nickname
+	_LOG_LINE_REGEX = re.compile(r"\[(\d\d:\d\d:\d\d)\] (?:\[notice\] )?(?:\*(\S+) |(\S+): )?(.*)")
+	_LOG_FILENAME_REGEX = re.compile(r"(.+)-(\d{4}-\d\d-\d\d)\.log")
+	_EVENT_PREFIXES = frozenset(('JOIN', 'PART', 'QUIT', 'KICK'))  # The system lines that look like they're said by someone, like 'JOIN: nick (address)'
+
+	def __init__(self, logfolder: str, databasePath: str):
+		"""
+		:param logfolder: The folder with the log files to index
+		:param databasePath: Where the index database should be stored
+		"""
+		self.logger = logging.getLogger('DideRobot')
+		self.logfolder = logfolder
+		self.databasePath = databasePath
+		self._lock = gevent.lock.Semaphore()  # SQLite doesn't like multiple threads writing at once, so only run one index operation at a time
+		gevent.get_hub().threadpool.apply(self._createTables)
+
+	def _connect(self) -> sqlite3.Connection:
+		#Updating the index can take a while, so wait for other connections longer than the default 5 seconds
+		return sqlite3.connect(self.databasePath, timeout=60)
+
+	def _createTables(self):
+		with self._connect() as connection:
+			connection.execute("PRAGMA journal_mode=WAL")
+			connection.execute("CREATE TABLE IF NOT EXISTS log_lines (id INTEGER PRIMARY KEY, channel TEXT NOT NULL, day TEXT NOT NULL, time TEXT NOT NULL, nick TEXT COLLATE NOCASE, text TEXT NOT NULL)")
+			connection.execute("CREATE INDEX IF NOT EXISTS log_lines_channel_day ON log_lines (channel, day)")
+			connection.execute("CREATE INDEX IF NOT EXISTS log_lines_channel_nick_day ON log_lines (channel, nick, day)")
+			connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS log_lines_fts USING fts5(text, content='log_lines', content_rowid='id')")
+			connection.execute("CREATE TABLE IF NOT EXISTS indexed_files (filename TEXT PRIMARY KEY, byte_offset INTEGER NOT NULL)")
+
+	@staticmethod
+	def isIndexableLogfile(logfilename: str) -> bool:
+		return logfilename[0] in Constants.CHANNEL_PREFIXES and logfilename.endswith('.log')
+
+	def update(self, logfilenames: Iterable[str] = None) -> int:
+		"""
+		Add the lines that were added to the provided log files since the last update to the index
+		:param logfilenames: The names of the log files to update the index for. If not provided, all the log files in the log folder are checked, which is useful to index existing logs
+		:return: The number of lines that were added to the index
+		"""
+		with self._lock:
+			return gevent.get_hub().threadpool.apply(self._update, (logfilenames,))
+
+	def _update(self, logfilenames: Union[Iterable[str], None]) -> int:
+		if logfilenames is None:
+			logfilenames = sorted(os.listdir(self.logfolder))
+		addedLineCount = 0
+		with self._connect() as connection:
+			#Read the offsets inside a write transaction, so if another update is somehow running at the same time (the lock above only works between greenlets, not between the threads doing the work),
+			#  this one waits until that one is done and then sees its offsets, instead of indexing the same lines again
+			connection.execute("BEGIN IMMEDIATE")
+			indexedOffsets = dict(connection.execute("SELECT filename, byte_offset FROM indexed_files"))
+			for logfilename in logfilenames:
+				if not self.isIndexableLogfile(logfilename):
+					continue
+				filenameMatch = self._LOG_FILENAME_REGEX.fullmatch(logfilename)
+				if not filenameMatch:
+					continue
+				logfilePath = os.path.join(self.logfolder, logfilename)
+				offset = indexedOffsets.get(logfilename, 0)
+				try:
+					if os.path.getsize(logfilePath) <= offset:
+						continue
+					with open(logfilePath, 'rb') as logfile:
+						logfile.seek(offset)
+						newData = logfile.read()
+				except OSError as e:
+					self.logger.error("[MessageLogIndex] Unable to read log file '{}' for indexing: {}".format(logfilename, e))
+					continue
+				#Only index complete lines, an incomplete last line gets indexed in the next update
+				lastNewlineIndex = newData.rfind(b'\n')
+				if lastNewlineIndex < 0:
+					continue
+				rows = self._parseLogLines(filenameMatch.group(1).lower(), filenameMatch.group(2), newData[:lastNewlineIndex].decode('utf-8', errors='replace').split('\n'))
+				if rows:
+					previousMaxId = connection.execute("SELECT COALESCE(MAX(id), 0) FROM log_lines").fetchone()[0]
+					connection.executemany("INSERT INTO log_lines (channel, day, time, nick, text) VALUES (?, ?, ?, ?, ?)", rows)
+					connection.execute("INSERT INTO log_lines_fts (rowid, text) SELECT id, text FROM log_lines WHERE id > ?", (previousMaxId,))
+					addedLineCount += len(rows)
+				connection.execute("INSERT OR REPLACE INTO indexed_files (filename, byte_offset) VALUES (?, ?)", (logfilename, offset + lastNewlineIndex + 1))
+		return addedLineCount
+
+	@classmethod
+	def _parseLogLines(cls, channel: str, day: str, loglines: List[str]) -> List[Tuple[str, str, str, Union[str, None], str]]:
+		rows = []
+		for logline in loglines:
+			lineMatch = cls._LOG_LINE_REGEX.fullmatch(logline)
+			if not lineMatch:
+				continue
+			time, actionNick, sayNick, text = lineMatch.groups()
+			nick = actionNick or sayNick
+			if nick in cls._EVENT_PREFIXES:
+				#This is a system line like 'JOIN: nick (address)', not something somebody said
+				nick = None
+				text = logline[11:]
+			rows.append((channel, day, time, nick, text))
+		return rows
+
+	def search(self, channel: str, searchQuery: str = None, nick: str = None, startDay: str = None, endDay: str = None, maxResultCount: int = 5) -> List[Tuple[str, str, Union[str, None], str]]:
+		"""
+		Search the indexed logs of the provided channel
+		:param channel: The channel to search the logs of
+		:param searchQuery: The words to search for. All words need to be in a line for it to match, and text between double quotes is searched for as a phrase. If not provided, lines aren't filtered on text
+		:param nick: If provided, only lines said by this nickname are returned
+		:param startDay: If provided, only lines from this day or later are returned. Should be in 'yyyy-mm-dd' format
+		:param endDay: If provided, only lines from this day or earlier are returned. Should be in 'yyyy-mm-dd' format
+		:param maxResultCount: The maximum number of lines to return
+		:return: A list of matching lines as (day, time, nick, text) tuples, newest first. The nick is None for lines like joins and quits
+		"""
+		conditions = ["log_lines.channel = ?"]
+		parameters = [channel.lower()]
+		if nick:
+			conditions.append("log_lines.nick = ?")
+			parameters.append(nick)
+		if startDay:
+			conditions.append("log_lines.day >= ?")
+			parameters.append(startDay)
+		if endDay:
+			conditions.append("log_lines.day <= ?")
+			parameters.append(endDay)
+		ftsQuery = self.createFtsQuery(searchQuery) if searchQuery else None
+		if ftsQuery:
+			query = "SELECT log_lines.day, log_lines.time, log_lines.nick, log_lines.text FROM log_lines_fts JOIN log_lines ON log_lines.id = log_lines_fts.rowid " \
+					"WHERE log_lines_fts MATCH ? AND {} ORDER BY log_lines_fts.rowid DESC LIMIT ?".format(" AND ".join(conditions))
+			parameters.insert(0, ftsQuery)
+		else:
+			query = "SELECT day, time, nick, text FROM log_lines WHERE {} ORDER BY day DESC, id DESC LIMIT ?".format(" AND ".join(conditions).replace("log_lines.", ""))
+		parameters.append(maxResultCount)
+		return gevent.get_hub().threadpool.apply(self._runQuery, (query, parameters))
+
+	def _runQuery(self, query: str, parameters: list) -> list:
+		with self._connect() as connection:
+			return connection.execute(query, parameters).fetchall()
+
+	@staticmethod
+	def createFtsQuery(searchQuery: str) -> str:
+		"""
+		Turn user input into a safe FTS5 query. Every word and every phrase between double quotes becomes a quoted FTS5 string, so characters in the input can't be interpreted as FTS5 operators
+		:return: The FTS5 query, or an empty string if the input didn't contain anything to search for
+		"""
+		terms = []
+		for phrase, word in re.findall(r'"([^"]*)"|(\S+)', searchQuery):
+			term = (phrase or word).strip()
+			if term:
+				terms.append('"{}"'.format(term.replace('"', '""')))
+		return " ".join(terms)
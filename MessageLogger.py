@@ -1,9 +1,22 @@
-import datetime, logging, os, re
+import collections, datetime, logging, os, re, time
+
+import gevent
+import gevent.event
+import gevent.lock
 
 import Constants
 import GlobalStore
+from MessageLogArchive import MessageLogArchive
+from MessageLogIndex import MessageLogIndex
 
 class MessageLogger(object):
+	"""
+	Writes the messages the bot sees to daily log files per channel or user
+	Logged lines are buffered in memory and written by a background greenlet, so logging a message doesn't have to wait for the disk. The actual disk writes happen in a thread, so they don't block the bots either
+	The buffer is written when enough lines are waiting or when the oldest line has waited long enough, both configurable in the settings. It's also written at the end of each day and when the bot quits
+	Channel logs are also added to a full-text search index every once in a while, see the MessageLogIndex class
+	Logs older than a configurable number of days get compressed, and (parts of) logs can be read through the 'logArchive' attribute, see the MessageLogArchive class
+	"""
 	logfiles = {}
 	currentDay = 0
 	logfolder = None
@@ -11,7 +24,10 @@ class MessageLogger(object):
 	shouldKeepSystemLogs = True
 	shouldKeepChannelLogs = True
 	shouldKeepPrivateLogs = True
-	
+	shouldEchoToConsole = True
+	secondsBetweenFlushes = 1.0
+	maxBufferedLineCount = 200
+
 	def __init__(self, bot):
 		self.logger = logging.getLogger('DideRobot')
 		self.bot = bot
@@ -19,8 +35,27 @@ class MessageLogger(object):
 		self.logger.info("Creating new message logger for '{}', using logfolder '{}'".format(bot.serverfolder, self.logfolder))
 		if not os.path.exists(self.logfolder):
 				os.makedirs(self.logfolder)
+		self.bufferedLines = collections.deque()  # Holds (logfilename, logline) tuples that still need to be written, oldest first
+		self.sanitizedSources = {}  # Keys are source names, values are those names with characters that aren't allowed in filenames replaced
+		self._flushLock = gevent.lock.Semaphore()  # Makes sure only one flush writes to the files at a time, and that files don't get closed during a flush
+		self._flushRequestedEvent = gevent.event.Event()  # Wakes up the writer greenlet early when the buffer is full enough
+		self._timestampSecond = None  # The second the cached timestamp strings are for, so they only need to be formatted once per second
+		self._timestamp = None
+		self._dateString = None
+		self.writerGreenlet = None
+		self.existingLogsGreenlet = None  # Indexes and compresses the logs that already existed when this logger was created
+		self.isStopping = False  # Set when the logger is stopped, so the background greenlets finish what they're doing and then end, instead of getting killed halfway
+		self.searchIndex = None  # If channel logs should be searchable, this is the MessageLogIndex that they're added to
+		self.logfilenamesToIndex = set()  # The names of the log files that were written to since the last search index update
+		self.lastSearchIndexUpdateTime = time.monotonic()
+		self.logArchive = MessageLogArchive(self.logfolder)  # Compresses old logs, and reads both compressed and uncompressed logs
 		self.updateLogSettings()
 		self.currentDay = datetime.datetime.now().day
+		self.lastArchiveDay = self.currentDay
+		if self.shouldKeepChannelLogs and self.bot.settings.get("indexChannelLogs", True):
+			self.searchIndex = MessageLogIndex(self.logfolder, os.path.join(GlobalStore.scriptfolder, 'serverSettings', bot.serverfolder, 'LogIndex.db'))
+		self.existingLogsGreenlet = gevent.spawn(self._processExistingLogs)
+		self.writerGreenlet = gevent.spawn(self._keepFlushing)
 
 	def updateLogSettings(self):
 		self.logger.info("[MessageLogger] |{}| Reloading settings".format(self.bot.serverfolder))
@@ -28,6 +63,13 @@ class MessageLogger(object):
 		self.shouldKeepSystemLogs = self.bot.settings["keepSystemLogs"]
 		self.shouldKeepChannelLogs = self.bot.settings["keepChannelLogs"]
 		self.shouldKeepPrivateLogs = self.bot.settings["keepPrivateLogs"]
+		self.shouldEchoToConsole = self.bot.settings.get("echoMessageLogToConsole", True)
+		#If this is 0 or lower, every line gets written immediately instead of being buffered
+		self.secondsBetweenFlushes = self.bot.settings.get("messageLogSecondsBetweenWrites", 1.0)
+		self.maxBufferedLineCount = max(1, self.bot.settings.get("messageLogMaxBufferedLines", 200))
+		self.secondsBetweenSearchIndexUpdates = self.bot.settings.get("logIndexSecondsBetweenUpdates", 60)
+		#If this is 0 or lower, logs never get compressed
+		self.daysBeforeArchiving = self.bot.settings.get("messageLogDaysBeforeArchiving", 7)
 		#Let's not let any file handlers linger about, in case logging settings were changed
 		self.closelogs()
 
@@ -41,44 +83,155 @@ class MessageLogger(object):
 		elif source[0] not in Constants.CHANNEL_PREFIXES and not self.shouldKeepPrivateLogs:
 			return
 
-		now = datetime.datetime.now()
-		#If we're at a new day, close all the logs, since they're daily
-		if now.day != self.currentDay:
-			self.logger.info("[MessageLogger] New day, new message logs")
-			self.closelogs()
-			self.currentDay = datetime.datetime.now().day
-
-		timestamp = now.strftime("%H:%M:%S")
-		print("[MessageLogger] |{0}| {1} [{2}] {3}".format(self.bot.serverfolder, source, timestamp, msg))
-
-		#Remove invalid characters from the source name (like '|')
-		oldSource = source
-		source, replacementCount = re.subn(r"[^a-zA-Z0-9_#]", "_", source)
-		if replacementCount > 0:
-			self.logger.debug("[MessageLogger] Replaced source '{}' with '{}' to prevent illegal-character error (changecount: {})".format(oldSource, source, replacementCount))
-
-		#If no file has been opened for this source, open it
-		if source not in self.logfiles:
-			logfilename = "{}-{}.log".format(source, now.strftime("%Y-%m-%d"))
+		#Formatting the time is relatively slow, and a lot of messages arrive in the same second, so only do it once per second
+		now = time.time()
+		if int(now) != self._timestampSecond:
+			nowDateTime = datetime.datetime.fromtimestamp(now)
+			#If we're at a new day, write and close all the logs, since they're daily
+			if nowDateTime.day != self.currentDay:
+				self.logger.info("[MessageLogger] New day, new message logs")
+				self.flush()
+				self.closelogs()
+				self.currentDay = nowDateTime.day
+			self._timestampSecond = int(now)
+			self._timestamp = nowDateTime.strftime("%H:%M:%S")
+			self._dateString = nowDateTime.strftime("%Y-%m-%d")
+
+		if self.shouldEchoToConsole:
+			print("[MessageLogger] |{0}| {1} [{2}] {3}".format(self.bot.serverfolder, source, self._timestamp, msg))
+
+		self.bufferedLines.append(("{}-{}.log".format(self.sanitizeSource(source), self._dateString), "[{0}] {1}\n".format(self._timestamp, msg)))
+		if self.secondsBetweenFlushes <= 0:
+			self.flush()
+		elif len(self.bufferedLines) >= self.maxBufferedLineCount:
+			self._flushRequestedEvent.set()
+
+	def sanitizeSource(self, source: str) -> str:
+		"""
+		Remove characters that aren't allowed in filenames (like '|') from the provided source name, so it can be used in a log filename
+		"""
+		sanitizedSource = self.sanitizedSources.get(source, None)
+		if sanitizedSource is None:
+			sanitizedSource, replacementCount = re.subn(r"[^a-zA-Z0-9_#]", "_", source)
+			if replacementCount > 0:
+				self.logger.debug("[MessageLogger] Replaced source '{}' with '{}' to prevent illegal-character error (changecount: {})".format(source, sanitizedSource, replacementCount))
+			#Private message sources are nicknames, so there could be a lot of them. Don't let this grow endlessly
+			if len(self.sanitizedSources) >= 1000:
+				self.sanitizedSources.clear()
+			self.sanitizedSources[source] = sanitizedSource
+		return sanitizedSource
+
+	def _keepFlushing(self):
+		"""Runs in the writer greenlet, and writes the buffered lines to the log files whenever enough lines are buffered or enough time has passed"""
+		while not self.isStopping:
+			#If every line gets written immediately, this greenlet only needs to update the search index
+			self._flushRequestedEvent.wait(self.secondsBetweenFlushes if self.secondsBetweenFlushes > 0 else self.secondsBetweenSearchIndexUpdates)
+			self._flushRequestedEvent.clear()
+			#'stop' does the final writes itself
+			if self.isStopping:
+				break
 			try:
-				self.logfiles[source] = open(os.path.join(self.logfolder, logfilename), 'a', encoding='utf-8')
-			except IOError as e:
-				self.logger.error("[MessageLogger] Error while trying to open logfile '{}': {} [error number {}]".format(logfilename, e.strerror, e.errno))
+				self.flush()
+				if self.searchIndex and time.monotonic() - self.lastSearchIndexUpdateTime >= self.secondsBetweenSearchIndexUpdates:
+					self.updateSearchIndex()
+				#Once a day, compress the logs that got old enough
+				if self.currentDay != self.lastArchiveDay:
+					self.lastArchiveDay = self.currentDay
+					self.archiveOldLogs()
+			except Exception as e:
+				self.logger.error("[MessageLogger] |{}| {} exception while writing message logs: {}".format(self.bot.serverfolder, type(e).__name__, e), exc_info=True)
+
+	def flush(self):
+		"""Write all the buffered lines to their log files. Only the calling greenlet waits for the writing to finish, the actual disk writes happen in a thread"""
+		with self._flushLock:
+			if not self.bufferedLines:
 				return
-		self.logfiles[source].write("[{0}] {1}\n".format(timestamp, msg))
-		self.logfiles[source].flush()
+			#Group the lines per file, so each file only gets one write
+			linesPerLogfile = {}
+			while self.bufferedLines:
+				logfilename, logline = self.bufferedLines.popleft()
+				if logfilename in linesPerLogfile:
+					linesPerLogfile[logfilename].append(logline)
+				else:
+					linesPerLogfile[logfilename] = [logline]
+			gevent.get_hub().threadpool.apply(self._writeLines, (linesPerLogfile,))
+			if self.searchIndex:
+				self.logfilenamesToIndex.update(logfilename for logfilename in linesPerLogfile if MessageLogIndex.isIndexableLogfile(logfilename))
+
+	def _writeLines(self, linesPerLogfile):
+		"""Runs in a thread. Appends the provided lines to the provided log files, opening them if needed"""
+		for logfilename, loglines in linesPerLogfile.items():
+			logfile = self.logfiles.get(logfilename, None)
+			#If no file has been opened for this source, open it
+			if logfile is None:
+				try:
+					logfile = open(os.path.join(self.logfolder, logfilename), 'a', encoding='utf-8')
+				except IOError as e:
+					self.logger.error("[MessageLogger] Error while trying to open logfile '{}': {} [error number {}]".format(logfilename, e.strerror, e.errno))
+					continue
+				self.logfiles[logfilename] = logfile
+			logfile.write("".join(loglines))
+			logfile.flush()
+
+	def updateSearchIndex(self):
+		"""Write the buffered lines, and add the lines written since the last update to the search index. Only the calling greenlet waits for this"""
+		if not self.searchIndex:
+			return
+		self.flush()
+		self.lastSearchIndexUpdateTime = time.monotonic()
+		if self.logfilenamesToIndex:
+			logfilenamesToIndex = self.logfilenamesToIndex
+			self.logfilenamesToIndex = set()
+			self.searchIndex.update(logfilenamesToIndex)
+
+	def archiveOldLogs(self):
+		"""Compress the logs that are older than the number of days set in the settings. Only the calling greenlet waits for this, the compressing happens in a thread"""
+		if self.daysBeforeArchiving <= 0:
+			return
+		#Make sure everything is in the search index before the plain log files get removed, since the index only reads plain log files
+		self.updateSearchIndex()
+		archivedFileCount = self.logArchive.archiveOldLogs(self.daysBeforeArchiving)
+		if archivedFileCount > 0:
+			self.logger.info("[MessageLogger] |{}| Compressed {:,} old log files".format(self.bot.serverfolder, archivedFileCount))
+
+	def _processExistingLogs(self):
+		"""Runs once when the message logger is created, to add logs that were written while the index didn't exist or the bot wasn't running to the search index, and then compress old logs"""
+		try:
+			if self.searchIndex:
+				self.searchIndex.update()
+			if not self.isStopping:
+				self.archiveOldLogs()
+		except Exception as e:
+			self.logger.error("[MessageLogger] |{}| {} exception while processing existing message logs: {}".format(self.bot.serverfolder, type(e).__name__, e), exc_info=True)
+
+	def stop(self):
+		"""Write the remaining buffered lines, close the log files, and stop the writer greenlet. Should be called when the bot quits"""
+		#Don't kill the background greenlets, since that doesn't stop the index or archive work they may be waiting on in a thread, and the final index update below would then run at the same time
+		#  Instead let them finish what they're doing and wait for them to end
+		self.isStopping = True
+		self._flushRequestedEvent.set()
+		for greenlet in (self.existingLogsGreenlet, self.writerGreenlet):
+			if greenlet:
+				greenlet.join()
+		self.existingLogsGreenlet = None
+		self.writerGreenlet = None
+		self.flush()
+		self.updateSearchIndex()
+		self.closelogs()
 
 	def closelog(self, source):
-		if source in self.logfiles:
-			self.logger.info("[MessageLogger] |{}| closing log '{}'".format(self.bot.serverfolder, source))
-			self.logfiles[source].close()
-			del self.logfiles[source]
-			return True
-		return False
-			
+		sanitizedSource = self.sanitizedSources.get(source, source)
+		with self._flushLock:
+			logfilenames = [logfilename for logfilename in self.logfiles if logfilename.rsplit('-', 3)[0] == sanitizedSource]
+			for logfilename in logfilenames:
+				self.logger.info("[MessageLogger] |{}| closing log '{}'".format(self.bot.serverfolder, logfilename))
+				self.logfiles.pop(logfilename).close()
+		return len(logfilenames) > 0
+
 	def closelogs(self):
 		self.logger.info("[MessageLogger] |{}| Closing ALL logs".format(self.bot.serverfolder))
-		for source, logfile in self.logfiles.items():
-			logfile.close()
-		self.logfiles = {}
+		with self._flushLock:
+			for logfile in self.logfiles.values():
+				logfile.close()
+			self.logfiles = {}
 		return True
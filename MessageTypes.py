@@ -18,6 +18,7 @@ RPL_ENDOFMOTD = 'RPL_ENDOFMOTD'
 RPL_ENDOFNAMES = 'RPL_ENDOFNAMES'
 RPL_ENDOFWHO = 'RPL_ENDOFWHO'
 RPL_GLOBALUSERS = 'RPL_GLOBALUSERS'
+RPL_HOSTHIDDEN = 'RPL_HOSTHIDDEN'
 RPL_ISUPPORT = 'RPL_ISUPPORT'
 RPL_LOCALUSERS = 'RPL_LOCALUSERS'
 RPL_LUSERCHANNELS = 'RPL_LUSERCHANNELS'
@@ -34,17 +35,20 @@ RPL_TOPIC = 'RPL_TOPIC'
 RPL_TOPICWHOTIME = 'RPL_TOPICWHOTIME'
 RPL_WELCOME = 'RPL_WELCOME'
 RPL_WHOREPLY = 'RPL_WHOREPLY'
+RPL_WHOSPCRPL = 'RPL_WHOSPCRPL'
 RPL_YOURHOST = 'RPL_YOURHOST'
 
 # Errors a server can send
 ERR_NICKNAMEINUSE = 'ERR_NICKNAMEINUSE'
+ERR_NOMOTD = 'ERR_NOMOTD'
 ERR_NOTEXTTOSEND = 'ERR_NOTEXTTOSEND'
+ERR_UNKNOWNCOMMAND = 'ERR_UNKNOWNCOMMAND'
 
 
 # Server messages get sent as numbers, provide a conversion dictionary
 IRC_NUMERIC_TO_TYPE = {"001": RPL_WELCOME, "002": RPL_YOURHOST, "003": RPL_CREATED, "004": RPL_MYINFO, "005": RPL_ISUPPORT,
 					   "251": RPL_LUSERCLIENT, "252": RPL_LUSEROP, "253": RPL_LUSERUNKNOWN, "254": RPL_LUSERCHANNELS, "255": RPL_LUSERME,
 					   "265": RPL_LOCALUSERS, "266": RPL_GLOBALUSERS, "315": RPL_ENDOFWHO, "331": RPL_NOTOPIC, "332": RPL_TOPIC, "333": RPL_TOPICWHOTIME,
-					   "352": RPL_WHOREPLY, "353": RPL_NAMREPLY, "366": RPL_ENDOFNAMES, "372": RPL_MOTD, "375": RPL_MOTDSTART, "376": RPL_ENDOFMOTD,
-					   "412": ERR_NOTEXTTOSEND, "433": ERR_NICKNAMEINUSE}
+					   "352": RPL_WHOREPLY, "353": RPL_NAMREPLY, "354": RPL_WHOSPCRPL, "366": RPL_ENDOFNAMES, "372": RPL_MOTD, "375": RPL_MOTDSTART, "376": RPL_ENDOFMOTD, "396": RPL_HOSTHIDDEN,
+					   "412": ERR_NOTEXTTOSEND, "421": ERR_UNKNOWNCOMMAND, "422": ERR_NOMOTD, "433": ERR_NICKNAMEINUSE}
 
@@ -0,0 +1,172 @@
+import logging, os, pickle, struct, sys
+from typing import Any, Callable, Dict, Union
+
+import gevent
+import gevent.queue
+import gevent.subprocess
+
+from CustomExceptions import CommandException
+
+
+#Jobs and their results are sent between the bot and the worker processes as pickled tuples, prefixed by their length in bytes
+_LENGTH_PREFIX = struct.Struct('!I')
+
+
+class ProcessPoolTimeoutException(CommandException):
+	"""Raised when a function running in a worker process takes longer than the allowed time"""
+	def __init__(self, displayMessage="Sorry, that took too long, so I gave up. Maybe try a more specific query?"):
+		super(ProcessPoolTimeoutException, self).__init__(displayMessage, False)
+
+
+class _WorkerProcess(object):
+	"""A single worker process, which runs the jobs it gets sent one at a time"""
+	def __init__(self, generation: int):
+		self.generation = generation  # Used to know whether this worker got started before the last 'restartWorkers' call, meaning it could still have old code loaded
+		self.process = gevent.subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=gevent.subprocess.PIPE, stdout=gevent.subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+	def runJob(self, jobData: bytes):
+		"""
+		Send a pickled job to this worker and wait for the result. Only the calling greenlet waits, the rest of the bot keeps running
+		:return: A tuple with whether the job succeeded, and either the result or the exception that was raised
+		"""
+		self.process.stdin.write(_LENGTH_PREFIX.pack(len(jobData)) + jobData)
+		self.process.stdin.flush()
+		lengthPrefix = self.process.stdout.read(_LENGTH_PREFIX.size)
+		if len(lengthPrefix) < _LENGTH_PREFIX.size:
+			raise CommandException("Worker process quit unexpectedly (exit code {})".format(self.process.poll()))
+		return pickle.loads(self.process.stdout.read(_LENGTH_PREFIX.unpack(lengthPrefix)[0]))
+
+	def isAlive(self) -> bool:
+		return self.process.poll() is None
+
+	def stop(self):
+		if self.isAlive():
+			self.process.kill()
+			self.process.wait()
+		self.process.stdin.close()
+		self.process.stdout.close()
+
+
+class ProcessPool(object):
+	"""
+	A pool of warm worker processes that CPU-heavy functions can be run in, so they don't block all the bots while they run
+	Only the greenlet that runs a function in the pool waits for the result, the rest of the bot keeps handling IRC traffic in the meantime
+	Functions and their arguments get pickled to send them to the worker, so only module-level functions and static methods can be used, and the arguments and result have to be picklable
+	"""
+
+	def __init__(self, workerCount: int, defaultTimeout: float = 30.0):
+		"""
+		:param workerCount: How many worker processes to start, which is also how many functions can run in the pool at the same time
+		:param defaultTimeout: How many seconds a function is allowed to run by default before its worker process gets killed
+		"""
+		self.logger = logging.getLogger('DideRobot')
+		self.workerCount = workerCount
+		self.defaultTimeout = defaultTimeout
+		self.generation = 0
+		self.idleWorkers = gevent.queue.Queue()
+		self.isStopped = False
+		for i in range(workerCount):
+			self.idleWorkers.put(_WorkerProcess(self.generation))
+
+		#Statistics
+		self.finishedJobCount = 0
+		self.timedOutJobCount = 0
+		self.cancelledJobCount = 0
+
+	def run(self, function: Callable, *args, timeout: float = None, **kwargs) -> Any:
+		"""
+		Run the provided function with the provided arguments in a worker process, and return its result. This blocks the calling greenlet until the result is in
+		If the calling greenlet gets killed while waiting, the job is cancelled and the worker process running it is replaced
+		:param function: The function to run. Has to be a module-level function or a static method, since it gets pickled
+		:param timeout: How many seconds the function is allowed to run. If omitted, the default timeout of the pool is used
+		:return: Whatever the function returned
+		:raises ProcessPoolTimeoutException: Raised if the function didn't finish within the timeout
+		:raises Exception: If the function raised an exception, that exception gets raised here too
+		"""
+		if self.isStopped:
+			raise CommandException("Process pool is stopped")
+		jobData = pickle.dumps((function, args, kwargs), pickle.HIGHEST_PROTOCOL)
+		if timeout is None:
+			timeout = self.defaultTimeout
+		worker = self.idleWorkers.get()
+		if worker.generation != self.generation or not worker.isAlive():
+			worker.stop()
+			worker = _WorkerProcess(self.generation)
+		try:
+			with gevent.Timeout(timeout, ProcessPoolTimeoutException):
+				wasSuccessful, result = worker.runJob(jobData)
+		except ProcessPoolTimeoutException:
+			self.timedOutJobCount += 1
+			self.logger.warning("|ProcessPool| Running '{}' took longer than {} seconds, killing its worker process".format(function.__qualname__, timeout))
+			self._replaceWorker(worker)
+			raise
+		except BaseException:
+			#Either the job got cancelled by killing this greenlet, or the worker process broke. The worker could still be busy or in an unknown state, so replace it
+			self.cancelledJobCount += 1
+			self._replaceWorker(worker)
+			raise
+		self.idleWorkers.put(worker)
+		self.finishedJobCount += 1
+		if not wasSuccessful:
+			raise result
+		return result
+
+	def submit(self, function: Callable, *args, timeout: float = None, **kwargs) -> gevent.Greenlet:
+		"""
+		Start running the provided function in a worker process without waiting for the result
+		The parameters are the same as for 'run'
+		:return: A greenlet whose 'get' method returns the result once it's in. Killing the greenlet cancels the job
+		"""
+		return gevent.spawn(self.run, function, *args, timeout=timeout, **kwargs)
+
+	def _replaceWorker(self, worker: _WorkerProcess):
+		worker.stop()
+		if not self.isStopped:
+			self.idleWorkers.put(_WorkerProcess(self.generation))
+
+	def restartWorkers(self):
+		"""
+		Make sure the worker processes get restarted, for instance because a command module got reloaded and the workers could still have the old version loaded
+		Idle workers are restarted when they're next needed, busy workers are allowed to finish their current job first
+		"""
+		self.generation += 1
+
+	def stop(self):
+		"""Stop all the idle worker processes. Busy workers get stopped once they finish"""
+		self.isStopped = True
+		while not self.idleWorkers.empty():
+			self.idleWorkers.get().stop()
+
+	def getStatistics(self) -> Dict[str, Union[int, float]]:
+		return {'workerCount': self.workerCount, 'idleWorkerCount': self.idleWorkers.qsize(), 'finishedJobCount': self.finishedJobCount, 'timedOutJobCount': self.timedOutJobCount, 'cancelledJobCount': self.cancelledJobCount}
+
+
+def _runWorker():
+	"""The main loop of a worker process: read a pickled job from standard input, run it, and write the pickled result to standard output"""
+	#Make sure the bot's modules can be imported when unpickling the function to run
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	jobInput = sys.stdin.buffer
+	resultOutput = sys.stdout.buffer
+	#Commands could print things, which shouldn't end up in the result stream
+	sys.stdout = sys.stderr
+	while True:
+		lengthPrefix = jobInput.read(_LENGTH_PREFIX.size)
+		if len(lengthPrefix) < _LENGTH_PREFIX.size:
+			#The bot closed the connection, so we should quit
+			break
+		jobData = jobInput.read(_LENGTH_PREFIX.unpack(lengthPrefix)[0])
+		try:
+			function, args, kwargs = pickle.loads(jobData)
+			resultData = pickle.dumps((True, function(*args, **kwargs)), pickle.HIGHEST_PROTOCOL)
+		except Exception as e:
+			try:
+				resultData = pickle.dumps((False, e), pickle.HIGHEST_PROTOCOL)
+			except Exception:
+				#Not every exception can be pickled, send a generic one in that case
+				resultData = pickle.dumps((False, CommandException("{} exception in worker process: {}".format(type(e).__name__, e))), pickle.HIGHEST_PROTOCOL)
+		resultOutput.write(_LENGTH_PREFIX.pack(len(resultData)) + resultData)
+		resultOutput.flush()
+
+
+if __name__ == '__main__':
+	_runWorker()
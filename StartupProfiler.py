@@ -0,0 +1,84 @@
+import builtins, contextlib, sys, time, tracemalloc
+from typing import List
+
+import GlobalStore
+
+
+class StartupProfiler(object):
+	"""
+	Measures how long the parts of starting up take and how much memory they use, like imports, loading commands, and starting the bots
+	Imports are measured by temporarily replacing the built-in import function. Nested imports are measured too, and their time is included in the time of the import that caused them
+	"""
+
+	def __init__(self):
+		self.entries = []  # A list of (category, name, seconds, memoryDeltaInBytes) tuples, in the order the measurements finished
+		self.startTime = None
+		self.stopTime = None
+		self._originalImportFunction = None
+
+	def start(self):
+		self.startTime = time.perf_counter()
+		tracemalloc.start()
+		self._originalImportFunction = builtins.__import__
+		builtins.__import__ = self._measuredImport
+
+	def stop(self):
+		if self._originalImportFunction:
+			builtins.__import__ = self._originalImportFunction
+			self._originalImportFunction = None
+		tracemalloc.stop()
+		self.stopTime = time.perf_counter()
+
+	def _measuredImport(self, name, globals=None, locals=None, fromlist=(), level=0):
+		#Only measure the first import of a module, later imports just get it from 'sys.modules'
+		if level == 0 and name not in sys.modules:
+			with self.measure('import', name):
+				return self._originalImportFunction(name, globals, locals, fromlist, level)
+		return self._originalImportFunction(name, globals, locals, fromlist, level)
+
+	@contextlib.contextmanager
+	def measure(self, category: str, name: str):
+		"""
+		Measure the time and memory use of the code inside this context manager
+		:param category: What kind of thing is measured, for instance 'import' or 'command onLoad'
+		:param name: What is measured, for instance the name of the imported module
+		"""
+		memoryAtStart = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+		startTime = time.perf_counter()
+		try:
+			yield
+		finally:
+			memoryDelta = (tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0) - memoryAtStart
+			self.entries.append((category, name, time.perf_counter() - startTime, memoryDelta))
+
+	def getEntriesOverBudget(self, budgetInSeconds: float) -> List[tuple]:
+		"""
+		:return: The measurements that took longer than the provided budget, slowest first, in the same format as the 'entries' list
+		"""
+		return sorted((entry for entry in self.entries if entry[2] > budgetInSeconds), key=lambda entry: entry[2], reverse=True)
+
+	def getReport(self, budgetInSeconds: float) -> str:
+		"""
+		Get a report of all the measurements, slowest first. Imports are cumulative, so they include the time of the imports they caused
+		Measurements that run in greenlets at the same time, like the bot starts, are wall-clock times, so they include time spent in the other greenlets while they were waiting
+		:param budgetInSeconds: Measurements that took longer than this are flagged in the report
+		:return: The report, as a multi-line string
+		"""
+		totalSeconds = (self.stopTime or time.perf_counter()) - self.startTime
+		reportLines = ["Startup took {:.3f} seconds. Budget per entry is {:.0f} ms, {:,} entries are over budget. Timings include the overhead of memory tracing".format(
+			totalSeconds, budgetInSeconds * 1000, len(self.getEntriesOverBudget(budgetInSeconds))),
+			"Entries that run concurrently in greenlets (like 'bot start') are wall-clock times, so they include time spent in other greenlets while they were waiting. Their memory deltas can include other greenlets' allocations too", "",
+			"{:>10}  {:>10}  {:<20}  {}".format("Time (ms)", "Mem (KiB)", "Category", "Name")]
+		for category, name, seconds, memoryDelta in sorted(self.entries, key=lambda entry: entry[2], reverse=True):
+			reportLines.append("{:>10.1f}  {:>10,.0f}  {:<20}  {}{}".format(seconds * 1000, memoryDelta / 1024, category, name, "  [OVER BUDGET]" if seconds > budgetInSeconds else ""))
+		return "\n".join(reportLines)
+
+
+def measureIfProfiling(category: str, name: str):
+	"""
+	If startup profiling is enabled, return a context manager that measures the time and memory use of the code inside it. Otherwise, return one that does nothing
+	The parameters are the same as for 'StartupProfiler.measure'
+	"""
+	if GlobalStore.startupProfiler:
+		return GlobalStore.startupProfiler.measure(category, name)
+	return contextlib.nullcontext()
@@ -1,6 +1,6 @@
 import json, os
 
-import GlobalStore, PermissionLevel
+import GlobalStore, MessageTypes, PermissionLevel
 from commands.CommandTemplate import CommandTemplate
 from IrcMessage import IrcMessage
 from CustomExceptions import CommandInputException
@@ -8,6 +8,8 @@ from CustomExceptions import CommandInputException
 
 class Command(CommandTemplate):
 	triggers = ['alias']
+	passiveListenerMessageTypes = (MessageTypes.SAY,)
+	passiveListenerTriggerFilter = True  #Aliases work like command triggers, they're just not known when the module loads
 	helptext = "Allows you to make shortcut commands, called aliases. Parameters are 'list' to see which are available, 'show' to see a specific one, " \
 			   "'serveradd' to add a serverwide alias or 'channeladd' for channel-specific, or 'remove' to remove. 'sethelp' sets a helptext for an alias, 'help' shows that helptext" \
 			   "Uses the same format as Generate's grammar files. Use '<CP>' for the command prefix, '<0>' for the whole message, '<n>' for the nth message part, " \
@@ -1,4 +1,4 @@
-import os, re
+import copy, os, re
 
 from commands.CommandTemplate import CommandTemplate
 import GlobalStore, PermissionLevel
@@ -70,7 +70,7 @@ class Command(CommandTemplate):
 				value = settings[settingsKey]
 				del settings[settingsKey]
 				try:
-					self.verifyAndParseSettings(message.bot, settingsKey, value)
+					self.verifyAndParseSettings(message.bot, settingsKey, value, settings)
 				except SettingException as se:
 					# Inform the user something went wrong
 					self.logWarning("[changeSettings] Deleting key '{}' resulted in a failed verification: {}".format(settingsKey, se.displayMessage))
@@ -101,10 +101,11 @@ class Command(CommandTemplate):
 							newSettingValue = float(newSettingValue)
 					except ValueError:
 						return message.reply("'{}' is not a valid number, while the '{}' setting requires a numerical value".format(newSettingValue, settingsKey))
-				oldValue = settings.get(settingsKey, None)
+				#Use the raw stored value, since 'get' returns read-only copies, and copy it so the stored value can be restored if the new one fails verification
+				oldValue = copy.deepcopy(settings[settingsKey]) if settingsKey in settings else None
 				settings[settingsKey] = newSettingValue
 				try:
-					self.verifyAndParseSettings(message.bot, settingsKey, oldValue)
+					self.verifyAndParseSettings(message.bot, settingsKey, oldValue, settings)
 				except SettingException as se:
 					self.logWarning("[changeSettings] Changing setting '{}' from '{}' to '{}' resulted in failed verification: {}".format(settingsKey, oldValue, newSettingValue, se.displayMessage))
 					return message.reply("Something went wrong when parsing the change of the value for '{}' to '{}'. Please check the logs".format(settingsKey, settings[settingsKey]))
@@ -115,7 +116,8 @@ class Command(CommandTemplate):
 					return message.reply("The setting '{}' does not exist. Check your spelling or use 'setlist' to create the list".format(settingsKey))
 				if not isinstance(settings[settingsKey], list):
 					return message.reply("The setting '{}' is not a list. Use 'set' to change it".format(settingsKey))
-				oldValue = settings[settingsKey]
+				#Copy the list, since it's changed in place below and the old version should be restored if the change fails verification
+				oldValue = list(settings[settingsKey])
 				if param == 'add':
 					settings[settingsKey].append(newSettingValue)
 				elif param == 'remove':
@@ -123,7 +125,7 @@ class Command(CommandTemplate):
 						return message.reply("The setting '{}' does not contain the value '{}', so I cannot remove it".format(settingsKey, newSettingValue))
 					settings[settingsKey].remove(newSettingValue)
 				try:
-					self.verifyAndParseSettings(message.bot, settingsKey, oldValue)
+					self.verifyAndParseSettings(message.bot, settingsKey, oldValue, settings)
 				except SettingException as se:
 					self.logWarning("[changeSettings] Changing list setting '{}' from '{}' to '{}' resulted in failed verification: {}".format(settingsKey, oldValue, newSettingValue, se.displayMessage))
 					return message.reply("Something went wrong when parsing the new settings. Please check the log for errors")
@@ -171,12 +173,20 @@ class Command(CommandTemplate):
 			GlobalStore.commandhandler.loadApiKeys()
 			return message.reply("API keys file reloaded")
 
-	def verifyAndParseSettings(self, bot, changedKey=None, oldValue=None):
+	def verifyAndParseSettings(self, bot, changedKey=None, oldValue=None, changedSettings=None):
+		"""
+		Verify the bot's settings after a change, and save and apply them if they're valid. If they're not, the changed key is set back to the old value
+		:param changedKey: The settings key that was changed
+		:param oldValue: The raw value the changed key had before the change, so not a read-only copy from 'get'
+		:param changedSettings: The settings the changed key is in, either the bot's settings or a channel's settings dict. Defaults to the bot's settings
+		"""
+		#Settings could have been changed inside a channel's settings or a list, which the settings manager can't detect by itself
+		bot.settings.settingsChanged()
 		try:
 			bot.settings.verifySettings()
 		except SettingException as se:
 			if changedKey is not None:
-				bot.settings[changedKey] = oldValue
+				(changedSettings if changedSettings is not None else bot.settings)[changedKey] = oldValue
 				self.verifyAndParseSettings(bot, None, None)
 			raise se
 		else:
@@ -2,7 +2,7 @@ import logging
 
 import gevent
 
-import MessageTypes
+import GlobalStore, MessageTypes
 
 class CommandTemplate(object):
 	"""
@@ -16,10 +16,17 @@ class CommandTemplate(object):
 
 	minPermissionLevel = None  # If kept on None, every user is allowed to call this command. If it's set to a PermissionLevel (see the PermissionLevel class), then only users with at least that permission level are allowed to use this command
 	callInThread = False  #If you think your command will be slow, set this to True to make it run in a separate 'thread', meaning the bot won't be blocked while the command is running
+	maxConcurrentExecutions = None  #If 'callInThread' is True, this limits how many times this command can run at the same time. Keep it None to use the CommandExecutor's default limit
+	rateLimitCost = 1  #How much calling this command counts towards the per-user and per-channel rate limits (see the CommandRateLimiter class). Set it higher for expensive commands, or to 0 to never rate-limit this command
 	showInCommandList = True  #If this is set to False, this command won't be shown in the '!help' list of all commands
 	stopAfterThisCommand = False  #Some commands might affect the list of loaded commands, which leads to errors if all commands get called. If this is set to True and the command executes, no further commands are asked if they should execute
 	scheduledFunctionTime = None  #The command's 'executeScheduledFunction' method gets called periodically, with a wait of the number of seconds specified here between each call. Set to None if you don't want to run a scheduled method
 
+	#Commands only get asked about messages with one of their triggers. If your command overrides 'shouldExecute' to react to other messages too, it becomes a 'passive listener', and then these filters decide which messages it gets asked about
+	passiveListenerMessageTypes = None  #The message types the 'shouldExecute' override should be asked about, or None for all message types
+	passiveListenerTriggerFilter = None  #Set to True to only be asked about messages with a command trigger, to False to only be asked about messages without one, or keep it None for both
+	passiveListenerNeedsUrl = False  #If set to True, the 'shouldExecute' override only gets asked about messages that contain a URL
+
 	#These are for internal use and shouldn't be overwritten in your command
 	scheduledFunctionGreenlet = None  #The greenlet that manages the scheduled function, or None if there isn't one
 	scheduledFunctionIsExecuting = False  #Is set to True if the scheduled function is running, so we know when we can kill the scheduler greenlet. Can be read in your 'execute' method but shouldn't be changed there
@@ -105,6 +112,14 @@ class CommandTemplate(object):
 		"""
 		pass
 
+	def executeWhenRateLimited(self, message):
+		"""
+		This gets called instead of 'execute' if the message used one of this command's triggers, but the user or channel hit the rate limit (see the CommandRateLimiter class)
+		Override this if your command also does passive work in 'execute' that should happen for every message, like delivering waiting messages. It's called directly, even if 'callInThread' is True, so keep it quick
+		:param message: The IrcMessage object that represents the received IRC message
+		"""
+		pass
+
 	def keepRunningScheduledFunction(self):
 		"""
 		This method takes makes sure the scheduled function gets called on schedule
@@ -144,6 +159,19 @@ class CommandTemplate(object):
 		"""
 		pass
 
+	@staticmethod
+	def runInProcess(function, *args, timeout: float = None, **kwargs):
+		"""
+		Run a CPU-heavy function in a worker process if those are enabled, so it doesn't block the bots while it runs. If there are no worker processes, the function is just called directly
+		Only the greenlet calling this waits for the result, so this works best in commands that have 'callInThread' set to True
+		:param function: The function to run. Since it gets sent to the worker process, it has to be a static method or a module-level function, and its arguments and result have to be picklable
+		:param timeout: How many seconds the function is allowed to run in a worker process before it's cancelled. If omitted, the default timeout of the process pool is used
+		:return: Whatever the function returned
+		"""
+		if GlobalStore.commandhandler and GlobalStore.commandhandler.processPool:
+			return GlobalStore.commandhandler.processPool.run(function, *args, timeout=timeout, **kwargs)
+		return function(*args, **kwargs)
+
 	#Some convenience logging methods, no need to override these. You can call a 'log[level]' method in your command if you want to log something
 	# The log message gets written to file and standard output if the log level in the settings is set to the same or a lower logging level as the logging command
 	@staticmethod
@@ -18,6 +18,7 @@ class Command(CommandTemplate):
 	triggers = ['generate', 'gen', 'generateseeded', 'genseeded']
 	helptext = "Generate random stories or words. Reload generators with '{commandPrefix}generate reload'. Call a specific generator with '{commandPrefix}generate [genName]'. Enter 'random' to let me pick, or choose from: "
 	callInThread = True
+	rateLimitCost = 2  #Some grammars take a while to parse
 
 	generators = {}
 	filesLocation = os.path.join(GlobalStore.scriptfolder, "data", "generators")
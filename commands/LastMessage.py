@@ -5,6 +5,7 @@ import GlobalStore, MessageTypes
 
 class Command(CommandTemplate):
 	triggers = ['lastmessage']
+	passiveListenerTriggerFilter = False  #Bot commands shouldn't be stored as the last message
 	helptext = "Stores the last message for each channel the bot is in, so other modules can retrieve it through a commandfunction"
 
 	# Stores the last message. Key is the server name, value is a nested dict, which has the channel as key and the message as value
@@ -15,6 +15,8 @@ class Command(CommandTemplate):
 			   "Subcommands: list, create, destroy, add, remove, get, random, getbyid, search, getall, info, rename, edit, setdescription, cleardescription, setadmin. " \
 			   "Use '{commandPrefix}help list [subcommand]' to get details on how to use that subcommand"
 
+	rateLimitCost = 2  #Some subcommands upload the whole list to a paste site
+
 	databasePath = os.path.join(GlobalStore.scriptfolder, "data", "Lists.db")
 
 	def onLoad(self):
@@ -48,15 +48,15 @@ class Command(CommandTemplate):
 					channelname = message.messageParts[1]
 					if not channelname[0] in Constants.CHANNEL_PREFIXES:
 						channelname = '#' + channelname
-				if channelname not in message.bot.channelsUserList:
+				if channelname not in message.bot.channelMembership:
 					replytext = "I'm not familiar with the channel '{}', sorry".format(channelname)
 				else:
-					nickToMatch = message.messageParts[0].lower() + '!'  #Add an exclamation mark to make sure the match is the full nick, not just the start
-					replytext = "I'm sorry, but I don't know who you're talking about..."  #Set it in advance, in case we don't find a match
-					for channelUserAddress in message.bot.channelsUserList[channelname]:
-						if channelUserAddress.lower().startswith(nickToMatch):
-							userAddress = channelUserAddress
-							break
+					channelUser = message.bot.channelMembership.getChannelUser(channelname, message.messageParts[0])
+					#We need the user's host to look up their location, and we don't know that if the server hasn't told us
+					if channelUser and channelUser.host:
+						userAddress = channelUser.address
+					else:
+						replytext = "I'm sorry, but I don't know who you're talking about..."
 
 		if userAddress != "":
 			username = userAddress.split("!", 1)[0]
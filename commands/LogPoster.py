@@ -1,8 +1,9 @@
-import datetime, os, time
+import datetime, time
+
+import gevent
 
 from commands.CommandTemplate import CommandTemplate
 from IrcMessage import IrcMessage
-import GlobalStore
 from util import WebUtil
 from CustomExceptions import WebRequestException
 
@@ -10,7 +11,11 @@ from CustomExceptions import WebRequestException
 class Command(CommandTemplate):
 	triggers = ['log']
 	helptext = "Posts the log of the given day. If you don't provide any parameters, it posts today's log." \
-			   " You can also provide a day in 'yyyy-mm-dd' format, or for instance '-1' to get yesterday's log"
+			   " You can also provide a day in 'yyyy-mm-dd' format, or for instance '-1' to get yesterday's log." \
+			   " Add a time range like '14:00-16:30' after the day to only get that part of the day, or use for instance '2h' or '30m' to get the last 2 hours or the last 30 minutes"
+	callInThread = True
+
+	MAX_HOURS_BACK = 7 * 24  # The longest window that can be requested with the 'Nh' or 'Nm' parameter, so nobody asks for years of log
 	
 	def execute(self, message):
 		"""
@@ -24,9 +29,20 @@ class Command(CommandTemplate):
 			replytext = "I'm sorry, I was told not to keep logs for this channel"
 		else:
 			date = None
+			startDateTime = None
+			endDateTime = None
 			if message.messagePartsLength == 0:
 				#No special parameters, post today's log
 				date = datetime.datetime.now()
+			elif message.messageParts[0][-1:].lower() in ('h', 'm') and message.messageParts[0][:-1].isdigit():
+				#A number of hours or minutes to go back, like '2h' or '30m'
+				amount = int(message.messageParts[0][:-1])
+				timeBack = datetime.timedelta(hours=amount) if message.messageParts[0][-1].lower() == 'h' else datetime.timedelta(minutes=amount)
+				if amount <= 0 or timeBack > datetime.timedelta(hours=self.MAX_HOURS_BACK):
+					replytext = "Please provide a positive amount of hours or minutes that's not longer than {:,} hours".format(self.MAX_HOURS_BACK)
+				else:
+					endDateTime = datetime.datetime.now()
+					startDateTime = endDateTime - timeBack
 			elif message.messageParts[0].startswith('-') and len(message.messageParts[0]) > 1:
 				#Assume it's a negative number
 				try:
@@ -44,22 +60,41 @@ class Command(CommandTemplate):
 					replytext = "Date format entered in wrong format. Please provide it as 'yyyy-mm-dd'"
 			else:
 				#I don't know what argument was entered, but it's nothing we can use
-				replytext = "Unknown parameters provided. Please provide a date in 'yyyy-mm-dd' format, or the amount of days you want to go back (for instance '-1' for yesterday's log)"
+				replytext = "Unknown parameters provided. Please provide a date in 'yyyy-mm-dd' format, the amount of days you want to go back (for instance '-1' for yesterday's log), or the amount of hours or minutes you want to go back (for instance '2h' or '30m')"
 
-			#If we have a datetime object, parse it to the text format we save logs as
 			if date:
-				logfilename = "{}-{}.log".format(message.source, date.strftime("%Y-%m-%d"))
-				logfilename = os.path.join(GlobalStore.scriptfolder, "serverSettings", message.bot.serverfolder, "logs", logfilename)
-				#check if we've got a log for this channel and day
-				if not os.path.exists(logfilename):
+				startDateTime = date.replace(hour=0, minute=0, second=0, microsecond=0)
+				endDateTime = date.replace(hour=23, minute=59, second=59, microsecond=0)
+				#A time range within the day can be provided too, like '14:00-16:30'
+				if message.messagePartsLength > 1:
+					try:
+						rangeStart, rangeEnd = message.messageParts[1].split('-', 1)
+						rangeStart = datetime.datetime.strptime(rangeStart, "%H:%M")
+						rangeEnd = datetime.datetime.strptime(rangeEnd, "%H:%M")
+						startDateTime = startDateTime.replace(hour=rangeStart.hour, minute=rangeStart.minute)
+						endDateTime = endDateTime.replace(hour=rangeEnd.hour, minute=rangeEnd.minute)
+					except ValueError:
+						replytext = "Time range entered in wrong format. Please provide it as 'HH:MM-HH:MM', for instance '14:00-16:30'"
+						startDateTime = None
+
+			if startDateTime and endDateTime:
+				messageLogger = message.bot.messageLogger
+				sanitizedSource = messageLogger.sanitizeSource(message.source)
+				#Logged messages are written in the background, make sure the log file is up to date
+				messageLogger.flush()
+				#Reading the log can take a while for long periods, so do it in a thread
+				logtext = gevent.get_hub().threadpool.apply(self.getLogText, (messageLogger.logArchive, sanitizedSource, startDateTime, endDateTime))
+				if date and not logtext and not messageLogger.logArchive.hasLog(sanitizedSource, date.strftime("%Y-%m-%d")):
 					replytext = "Sorry, no log for that day was found"
+				elif not logtext:
+					replytext = "Sorry, nothing was logged in that period"
 				else:
-					logtext = ""
-					with open(logfilename, 'r', encoding='utf-8') as logfile:
-						for line in logfile:
-							logtext += line
+					if date and message.messagePartsLength <= 1:
+						logTitle = "Log for {} from {}".format(message.source, date.strftime("%Y-%m-%d"))
+					else:
+						logTitle = "Log for {} from {} to {}".format(message.source, startDateTime.strftime("%Y-%m-%d %H:%M"), endDateTime.strftime("%Y-%m-%d %H:%M"))
 					try:
-						pasteLink = WebUtil.uploadText(logtext, "Log for {} from {}".format(message.source, date.strftime("%Y-%m-%d")), 600)
+						pasteLink = WebUtil.uploadText(logtext, logTitle, 600)
 					except WebRequestException as wre:
 						self.logError("[LogPoster] Uploading log failed: {}".format(wre))
 						replytext = "Something went wrong with uploading the log, sorry. Either try again in a bit, or tell my owner(s) so they can try to fix it"
@@ -67,3 +102,19 @@ class Command(CommandTemplate):
 						replytext = "Log uploaded to Paste.ee: {} (Expires in 10 minutes)".format(pasteLink)
 
 		message.reply(replytext)
+
+	@staticmethod
+	def getLogText(logArchive, sanitizedSource, startDateTime, endDateTime):
+		"""
+		Get the logged lines between the provided times as a single string. If the period spans multiple days, each day starts with a line with the date
+		:type logArchive: MessageLogArchive.MessageLogArchive
+		"""
+		loglines = []
+		isMultipleDays = startDateTime.date() != endDateTime.date()
+		currentDay = None
+		for day, logline in logArchive.iterateLogLines(sanitizedSource, startDateTime, endDateTime):
+			if isMultipleDays and day != currentDay:
+				loglines.append("--- {} ---\n".format(day))
+				currentDay = day
+			loglines.append(logline)
+		return "".join(loglines)
@@ -0,0 +1,77 @@
+import datetime, time
+
+from commands.CommandTemplate import CommandTemplate
+from IrcMessage import IrcMessage
+from CustomExceptions import CommandInputException
+import Constants
+
+
+class Command(CommandTemplate):
+	triggers = ['logsearch']
+	helptext = "Searches this channel's logs. Add words to search for, or put text between double quotes to search for that exact phrase. " \
+			   "Add 'nick:[nickname]' to only find lines from that person, and 'from:[date]' and/or 'to:[date]' to limit the days searched. " \
+			   "Dates can be in 'yyyy-mm-dd' format, or for instance '-7' for a week ago. Shows the most recent matching lines first"
+	callInThread = True
+	rateLimitCost = 2
+
+	MAX_RESULT_COUNT = 3
+
+	def execute(self, message):
+		"""
+		:type message: IrcMessage
+		"""
+		if message.isPrivateMessage:
+			raise CommandInputException("Private conversations aren't logged in a searchable way, so there's nothing for me to search, sorry")
+		messageLogger = message.bot.messageLogger
+		if not messageLogger.shouldKeepChannelLogs or not messageLogger.searchIndex:
+			raise CommandInputException("I'm not keeping searchable logs for this channel, sorry")
+		if message.messagePartsLength == 0:
+			raise CommandInputException("Please tell me what to search for. " + self.getHelp(message))
+
+		nick = None
+		startDay = None
+		endDay = None
+		searchQueryParts = []
+		for messagePart in message.messageParts:
+			lowercaseMessagePart = messagePart.lower()
+			if lowercaseMessagePart.startswith('nick:') and len(messagePart) > 5:
+				nick = messagePart[5:]
+			elif lowercaseMessagePart.startswith('from:') and len(messagePart) > 5:
+				startDay = self.parseDay(messagePart[5:])
+			elif lowercaseMessagePart.startswith('to:') and len(messagePart) > 3:
+				endDay = self.parseDay(messagePart[3:])
+			else:
+				searchQueryParts.append(messagePart)
+		searchQuery = " ".join(searchQueryParts)
+		if not searchQuery and not nick:
+			raise CommandInputException("Please add some words to search for or a nick to search the lines of, otherwise I'd just be returning random lines")
+
+		#Make sure the most recent lines are in the index too
+		messageLogger.updateSearchIndex()
+		startTime = time.perf_counter()
+		results = messageLogger.searchIndex.search(messageLogger.sanitizeSource(message.source), searchQuery, nick, startDay, endDay, self.MAX_RESULT_COUNT)
+		self.logDebug("[LogSearch] Searching for '{}' (nick: {}, from: {}, to: {}) took {:.1f} ms".format(searchQuery, nick, startDay, endDay, (time.perf_counter() - startTime) * 1000))
+		if not results:
+			return message.reply("I couldn't find any lines in the logs that match your search, sorry")
+		resultStrings = []
+		for day, lineTime, lineNick, text in results:
+			if lineNick:
+				resultStrings.append("[{} {}] {}: {}".format(day, lineTime, lineNick, text))
+			else:
+				resultStrings.append("[{} {}] {}".format(day, lineTime, text))
+		message.replyWithLengthLimit(Constants.GREY_SEPARATOR.join(resultStrings))
+
+	@staticmethod
+	def parseDay(dayString: str) -> str:
+		"""
+		Turn the provided day string into the 'yyyy-mm-dd' format the log index uses
+		:param dayString: Either a date in 'yyyy-mm-dd' format, or a negative number of days ago
+		:return: The day in 'yyyy-mm-dd' format
+		:raises CommandInputException: Raised if the day string isn't in one of the supported formats
+		"""
+		try:
+			if dayString.startswith('-'):
+				return (datetime.date.today() + datetime.timedelta(days=int(dayString))).isoformat()
+			return datetime.datetime.strptime(dayString, "%Y-%m-%d").date().isoformat()
+		except ValueError:
+			raise CommandInputException("I don't understand the date '{}'. Please provide it in 'yyyy-mm-dd' format, or as the number of days ago, like '-7'".format(dayString))
@@ -6,6 +6,7 @@ from bs4 import BeautifulSoup
 from commands.CommandTemplate import CommandTemplate
 import Constants
 import GlobalStore
+import LineScheduler
 import PermissionLevel
 from util import DateTimeUtil, IrcFormattingUtil
 from IrcMessage import IrcMessage
@@ -250,22 +251,28 @@ class Command(CommandTemplate):
 			# Reverse the messages so we get them old to new, instead of new to old
 			messageList.reverse()
 			# Report the new messages where they should be reported
+			# Collect the channels per server first, so channels on the same server can get the messages in one combined line if the server allows that
+			targetChannelsPerServer = {}
 			for target in self.watchData[username]['targets']:
 				# 'target' is a tuple with the server name at [0] and the channel name at [1]
 				# Just ignore it if we're either not on the server or not in the channel
 				if target[0] not in GlobalStore.bothandler.bots:
 					continue
-				targetbot = GlobalStore.bothandler.bots[target[0]]
-				if target[1] not in targetbot.channelsUserList:
+				if target[1] not in GlobalStore.bothandler.bots[target[0]].channelsUserList:
 					continue
-				targetchannel = target[1]
-				# Now go tell that channel all about the new messages
-				for messageData in messageList:
-					formattedMessage  = self.formatMessage(username, messageData)
-					targetbot.sendLengthLimitedMessage(targetchannel, formattedMessage.mainString, formattedMessage.suffix)
-				# If we skipped a few message, make a mention of that too
-				if numberOfMessagesSkipped > 0:
-					targetbot.sendMessage(targetchannel, "(skipped at least {:,} of {}'s messages)".format(numberOfMessagesSkipped, self.getDisplayName(username)))
+				targetChannelsPerServer.setdefault(target[0], []).append(target[1])
+			if not targetChannelsPerServer:
+				continue
+			formattedMessages = [self.formatMessage(username, messageData) for messageData in messageList]
+			for servername, targetchannels in targetChannelsPerServer.items():
+				targetbot = GlobalStore.bothandler.bots[servername]
+				for targetchannel in targetbot.combineMessageTargets(targetchannels):
+					# Now go tell those channels all about the new messages
+					for formattedMessage in formattedMessages:
+						targetbot.sendLengthLimitedMessage(targetchannel, formattedMessage.mainString, formattedMessage.suffix, priority=LineScheduler.PRIORITY_BACKGROUND)
+					# If we skipped a few message, make a mention of that too
+					if numberOfMessagesSkipped > 0:
+						targetbot.sendMessage(targetchannel, "(skipped at least {:,} of {}'s messages)".format(numberOfMessagesSkipped, self.getDisplayName(username)), priority=LineScheduler.PRIORITY_BACKGROUND)
 		if watchDataChanged:
 			self.saveWatchData()
 
@@ -6,7 +6,7 @@ from commands.CommandTemplate import CommandTemplate
 from IrcMessage import IrcMessage
 from CustomExceptions import CommandException, CommandInputException
 import Constants
-from util import StringUtil, WebUtil
+from util import SingleFlightUtil, StringUtil, WebUtil
 from StringWithSuffix import StringWithSuffix
 
 
@@ -38,6 +38,18 @@ class Command(CommandTemplate):
 		if not shouldPickRandomPage and not searchQuery:
 			return message.reply("What do you want me to search for? Or if you don't know what you want, use the '{}random' command and be surprised!".format(message.trigger))
 
+		if shouldPickRandomPage:
+			article = self.retrieveArticle(wikiApiUrl, wikiDisplayName, searchQuery, shouldPickRandomPage)
+		else:
+			# If multiple people search for the same article at the same time, only look it up once
+			article = SingleFlightUtil.runSingleFlight(('mediawiki', wikiApiUrl.lower(), searchQuery.strip().lower()), self.retrieveArticle, wikiApiUrl, wikiDisplayName, searchQuery, shouldPickRandomPage)
+		message.replyWithLengthLimit(article)
+
+	def retrieveArticle(self, wikiApiUrl, wikiDisplayName, searchQuery, shouldPickRandomPage):
+		"""
+		Retrieve the start of the article from the provided wiki that best matches the search query, or a random article
+		:return: The start of the article text, with the article URL as suffix
+		"""
 		# We want 1200 characters because that's the maximum allowed, and because we don't know how much we have to chop off because they're preceding images
 		# We also want the sectionformat to be 'wiki' so we can see where the intro paragraph ends (We can't use 'exintro' for this because images can come first so we'd only get their caption)
 		requestParams = {'format': 'json', 'utf8': True, 'redirects': True, 'action': 'query', 'prop': 'extracts|info',
@@ -61,7 +73,7 @@ class Command(CommandTemplate):
 			# Should only happen for Fandom searches and a non-existent wiki
 			raise CommandInputException("{} doesn't appear to exist. Maybe you made a typo? Or maybe you made a whole new fandom!".format(wikiDisplayName))
 		if apiResult.status_code != 200:
-			self.logError("[MediaWiki] {} returned an unexpected result for commandtrigger '{}' and query '{}'. Status code is {}, response is {}".format(wikiApiUrl, message.trigger, searchQuery, apiResult.status_code, apiResult.text))
+			self.logError("[MediaWiki] {} returned an unexpected result for query '{}' (random: {}). Status code is {}, response is {}".format(wikiApiUrl, searchQuery, shouldPickRandomPage, apiResult.status_code, apiResult.text))
 			raise CommandException("Uh oh, something went wrong with retrieving data from {}. Either they're having issues, or I am. If this keeps happening, please tell my owner(s) to look into this!".format(wikiDisplayName))
 
 		try:
@@ -88,4 +100,4 @@ class Command(CommandTemplate):
 			articleText = articleText.rsplit('\t', 1)[1].strip()
 		# Replace any remaining newlines with spaces
 		articleText = StringUtil.removeNewlines(articleText)
-		message.replyWithLengthLimit(StringWithSuffix(articleText, Constants.GREY_SEPARATOR + articleData["canonicalurl"]))
+		return StringWithSuffix(articleText, Constants.GREY_SEPARATOR + articleData["canonicalurl"])
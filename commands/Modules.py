@@ -16,6 +16,8 @@ class Command(CommandTemplate):
 		if message.messagePartsLength > 0:
 			modulename = message.messageParts[0]
 		
+		#Make sure modules that would only be loaded on first use are known too
+		GlobalStore.commandhandler.loadLazyCommands()
 		if modulename in GlobalStore.commandhandler.commands and GlobalStore.commandhandler.isCommandAllowedForBot(message.bot, modulename, message.source):
 			module = GlobalStore.commandhandler.commands[modulename]
 			replytext = "Module '{0}' has triggers: {1}; Helptext: {2}".format(modulename, ", ".join(module.triggers), module.helptext.format(commandPrefix=message.bot.getCommandPrefix(message.source)))
@@ -12,6 +12,7 @@ import GlobalStore
 import PermissionLevel
 from util import IrcFormattingUtil
 from util import FileUtil
+from util import SingleFlightUtil
 from util import StringUtil
 from util import WebUtil
 from IrcMessage import IrcMessage
@@ -27,13 +28,14 @@ class Command(CommandTemplate):
 	helptext += "'{commandPrefix}mtglink' returns links to the card on Gatherer and ScryFall.com"
 	scheduledFunctionTime = 172800.0  #Every other day, since it doesn't update too often
 	callInThread = True  #If a call causes a card update, make sure that doesn't block the whole bot
+	rateLimitCost = 2  #Searches can go through all the cards, which is slow
 
 	areCardfilesInUse = False
 	dataFormatVersion = '4.5.1'
 	FORCE_UPDATE_AFTER_SECONDS = 7776000 # 90 days in seconds
 
 	def onLoad(self):
-		GlobalStore.commandhandler.addCommandFunction(__file__, 'searchMagicTheGatheringCards', self.getFormattedResultFromSearchString)
+		GlobalStore.commandhandler.addCommandFunction(__file__, 'searchMagicTheGatheringCards', self.getFormattedResultFromSearchString, cacheTtl=3600, cacheKeyFunction=self.getSearchCacheKey)
 
 	def executeScheduledFunction(self):
 		if not self.areCardfilesInUse and self.shouldUpdate():
@@ -128,6 +130,12 @@ class Command(CommandTemplate):
 					replytext = self.formatSearchResult(matchingCards, message.trigger.endswith('f'), shouldPickRandomCard, numberOfCardsToList, searchDict.get('name', None), True)
 			message.reply(replytext)
 
+	def getSearchCacheKey(self, searchType, searchString, extendedInfo=False, resultListLength=10):
+		#Random searches should return a different card each time, and results from while the cardfiles are updating aren't actual results, so don't cache those
+		if searchType.startswith('random') or self.areCardfilesInUse:
+			return None
+		return searchType, searchString.strip().lower() if searchString else "", extendedInfo, resultListLength
+
 	def getFormattedResultFromSearchString(self, searchType, searchString, extendedInfo=False, resultListLength=10):
 		if self.areCardfilesInUse:
 			return "[Updating cardfiles]"
@@ -151,13 +159,16 @@ class Command(CommandTemplate):
 		#Make sure the search string is an actual string, and not None or something
 		if searchString is None:
 			searchString = ""
+		#Searching goes through all the cards, so if multiple people do the same search at the same time, only search once
+		return SingleFlightUtil.runSingleFlight(('mtgsearch', searchType, searchString.strip().lower()), self.searchCardsBySearchString, searchType, searchString)
 
+	def searchCardsBySearchString(self, searchType, searchString):
 		#Check if the user passed valid search terms
 		searchDict = self.parseSearchParameters(searchType, searchString)
 		#Check if the entered search terms can be converted to the regex we need
 		regexDict = self.searchDictToRegexDict(searchDict)
-		#Search for cards matching the regex dict
-		matchingCards = self.searchCardStore(regexDict)
+		#Search for cards matching the regex dict. This goes through every card, so do it in a worker process if possible
+		matchingCards = self.runInProcess(self.searchCardStore, regexDict)
 		#Clear the stored regexes, since we don't need them anymore
 		del regexDict
 		re.purge()
@@ -1034,6 +1045,8 @@ class Command(CommandTemplate):
 		gc.collect()
 
 		self.areCardfilesInUse = False
+		#Cached search results could be outdated now
+		GlobalStore.commandhandler.clearCommandFunctionCache('searchMagicTheGatheringCards')
 		self.logInfo("[MtG] updating database took {} seconds".format(time.time() - starttime))
 		return replytext
 
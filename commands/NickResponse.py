@@ -7,6 +7,7 @@ import MessageTypes
 class Command(CommandTemplate):
 	"""A module that responds with basic info when just the bot's name is said"""
 	helptext = "SAY MY NAME- I mean, if you just say my name, I'll give you some basic info about myself"
+	passiveListenerMessageTypes = (MessageTypes.SAY,)
 
 	def shouldExecute(self, message):
 		if message.messageType != MessageTypes.SAY:
@@ -0,0 +1,47 @@
+from commands.CommandTemplate import CommandTemplate
+import GlobalStore, PermissionLevel
+from IrcMessage import IrcMessage
+from CustomExceptions import CommandInputException
+
+
+class Command(CommandTemplate):
+	triggers = ['stats']
+	helptext = "Shows internal statistics of the bot, useful for tuning settings. Subcommands: 'sendqueue' shows how many lines are waiting to be sent to this server and how long they waited, " \
+			   "'commands' shows how many slow commands are running and waiting to run, 'functioncache' shows how well the cached command functions are cached, 'ratelimit' shows how often commands got rate-limited"
+	minPermissionLevel = PermissionLevel.SERVER
+
+	def execute(self, message):
+		"""
+		:type message: IrcMessage
+		"""
+		if message.messagePartsLength == 0:
+			raise CommandInputException("Please provide which statistics you want to see. " + self.helptext)
+		subcommand = message.messageParts[0].lower()
+		if subcommand == 'sendqueue':
+			stats = message.bot.lineScheduler.getStatistics()
+			replytext = "Lines queued: {queueLength:,} (max {maxQueueLength:,}). Lines sent through queue: {sentLineCount:,} in {socketWriteCount:,} writes. " \
+						"Time in queue: {averageSecondsInQueue:.2f}s average, {maxSecondsInQueue:.2f}s max".format(**stats)
+		elif subcommand == 'commands':
+			stats = GlobalStore.commandhandler.commandExecutor.getStatistics()
+			replytext = "Commands running: {activeWorkerCount:,} (max {maxWorkers:,}). Waiting: {queueLength:,} (max {maxQueueLength:,}). Started: {startedJobCount:,}. Had to wait: {queuedJobCount:,}, " \
+						"{averageSecondsInQueue:.2f}s on average. Rejected: {rejectedJobCount:,} because the queue was full or the user had too many waiting, {expiredJobCount:,} because they waited too long".format(**stats)
+			if stats['activeWorkersPerCommand']:
+				replytext += ". Running per command: " + ", ".join("{}: {}".format(commandname, count) for commandname, count in sorted(stats['activeWorkersPerCommand'].items()))
+		elif subcommand == 'functioncache':
+			statsByFunctionName = GlobalStore.commandhandler.getCommandFunctionCacheStatistics()
+			if not statsByFunctionName:
+				replytext = "No command functions have caching enabled"
+			else:
+				cacheDescriptions = []
+				for functionName, stats in sorted(statsByFunctionName.items()):
+					totalCallCount = stats['hitCount'] + stats['missCount']
+					cacheDescriptions.append("{}: {entryCount:,}/{maxEntries:,} entries, {hitCount:,} hits, {missCount:,} misses ({:.0%} hit rate), {uncacheableCount:,} uncacheable, {evictionCount:,} evicted, {expirationCount:,} expired".format(
+						functionName, stats['hitCount'] / totalCallCount if totalCallCount > 0 else 0, **stats))
+				replytext = "; ".join(cacheDescriptions)
+		elif subcommand == 'ratelimit':
+			stats = GlobalStore.commandhandler.commandRateLimiter.getStatistics()
+			replytext = "Command calls allowed: {allowedCount:,}. Rate-limited: {limitedCount:,}. Allowed because of permission level: {exemptCount:,}. " \
+						"Tracked users: {userBucketCount:,}, channels: {channelBucketCount:,}, user-command pairs: {userCommandBucketCount:,}".format(**stats)
+		else:
+			raise CommandInputException("Unknown statistics type '{}'. {}".format(subcommand, self.helptext))
+		message.reply(replytext)
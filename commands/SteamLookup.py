@@ -6,7 +6,7 @@ import Constants, GlobalStore
 from commands.CommandTemplate import CommandTemplate
 from CustomExceptions import CommandException, CommandInputException
 from IrcMessage import IrcMessage
-from util import StringUtil
+from util import SingleFlightUtil, StringUtil
 from StringWithSuffix import StringWithSuffix
 
 
@@ -28,9 +28,18 @@ class Command(CommandTemplate):
 		if message.messagePartsLength == 0:
 			raise CommandInputException("Please also provide a game name to search for, there's too many games for me to pick one")
 
+		# If multiple people look up the same game at the same time, only look it up once
+		return message.replyWithLengthLimit(SingleFlightUtil.runSingleFlight(('steamsearch', message.message.strip().lower()), self.getDescriptionFromSearchQuery, message.message))
+
+	def getDescriptionFromSearchQuery(self, searchQuery):
+		"""
+		Get a description of the Steam app that best matches the provided search query
+		:param searchQuery: The name of the app to search for
+		:return: A string describing the best-matching app, limited to message length
+		"""
 		# First search for the app ID
 		try:
-			searchResult = requests.get("https://store.steampowered.com/api/storesearch", params={'term': message.message, 'cc': 'US'}, timeout=5)
+			searchResult = requests.get("https://store.steampowered.com/api/storesearch", params={'term': searchQuery, 'cc': 'US'}, timeout=5)
 			searchData = searchResult.json()
 			if searchData['total'] == 0 or not searchData['items']:
 				raise CommandInputException("That search didn't return any results. Maybe you made a typo? Or you've got a game to make")
@@ -39,7 +48,7 @@ class Command(CommandTemplate):
 			if 'price' in matchingApp:
 				pricesByCountry['US'] = '${:.2f}'.format(matchingApp['price']['final'] / 100)
 			appId = StringUtil.forceToString(matchingApp['id'])
-			return message.replyWithLengthLimit(self.getDescriptionFromAppId(appId, True, pricesByCountry))
+			return self.getDescriptionFromAppId(appId, True, pricesByCountry)
 		except requests.exceptions.Timeout:
 			raise CommandException("Seems Steam is having some issues, they didn't return the data as quickly as normal. You should try again in a little while", False)
 
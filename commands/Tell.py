@@ -10,6 +10,7 @@ from IrcMessage import IrcMessage
 
 class Command(CommandTemplate):
 	triggers = ['tell']
+	passiveListenerMessageTypes = (MessageTypes.SAY,)  #Every message needs to be checked, since the speaker could have tells waiting for them
 	helptext = "Stores messages you want to send to other users, and says them to that user when they speak. Add a tell in a PM to me, and I'll tell it privately. Usage: {commandPrefix}tell [username] [message]"
 
 	tellsFileLocation = os.path.join(GlobalStore.scriptfolder, "data", "tells.json")
@@ -39,24 +40,7 @@ class Command(CommandTemplate):
 		serverfolder = message.bot.serverfolder
 
 		#Check if the person that said something has tells waiting for them
-		usernick = message.userNickname.lower()
-		if serverfolder in self.storedTells and usernick in self.storedTells[serverfolder]:
-			publicTells = self.retrieveTells(serverfolder, usernick, message.source)
-			sentTell = False
-			for tell in publicTells:
-				message.bot.sendMessage(message.source, self.formatTell(message.userNickname, tell))
-				sentTell = True
-			#If we haven't spammed the user enough, send them their private tells as well
-			if len(publicTells) < self.maxTellsAtATime:
-				for tell in self.retrieveTells(serverfolder, usernick, "_private", self.maxTellsAtATime - len(publicTells)):
-					message.bot.sendMessage(message.userNickname, self.formatTell(message.userNickname, tell), MessageTypes.NOTICE)
-					sentTell = True
-			if sentTell:
-				if len(self.storedTells[serverfolder][usernick]) == 0:
-					self.storedTells[serverfolder].pop(usernick)
-				if len(self.storedTells[serverfolder]) == 0:
-					self.storedTells.pop(serverfolder)
-				self.saveTellsToFile()
+		self.deliverTells(message)
 
 		#Check if we need to add a new tell
 		if message.trigger and message.trigger in self.triggers:
@@ -89,6 +73,35 @@ class Command(CommandTemplate):
 			message.reply(replytext)
 
 
+	def executeWhenRateLimited(self, message):
+		#Adding a new tell got rate-limited, but the sender could still have tells waiting for them
+		self.deliverTells(message)
+
+	def deliverTells(self, message):
+		"""
+		Send the tells that are waiting for the sender of the provided message, if there are any
+		:type message: IrcMessage
+		"""
+		serverfolder = message.bot.serverfolder
+		usernick = message.userNickname.lower()
+		if serverfolder in self.storedTells and usernick in self.storedTells[serverfolder]:
+			publicTells = self.retrieveTells(serverfolder, usernick, message.source)
+			sentTell = False
+			for tell in publicTells:
+				message.bot.sendMessage(message.source, self.formatTell(message.userNickname, tell))
+				sentTell = True
+			#If we haven't spammed the user enough, send them their private tells as well
+			if len(publicTells) < self.maxTellsAtATime:
+				for tell in self.retrieveTells(serverfolder, usernick, "_private", self.maxTellsAtATime - len(publicTells)):
+					message.bot.sendMessage(message.userNickname, self.formatTell(message.userNickname, tell), MessageTypes.NOTICE)
+					sentTell = True
+			if sentTell:
+				if len(self.storedTells[serverfolder][usernick]) == 0:
+					self.storedTells[serverfolder].pop(usernick)
+				if len(self.storedTells[serverfolder]) == 0:
+					self.storedTells.pop(serverfolder)
+				self.saveTellsToFile()
+
 	@staticmethod
 	def createTell(message):
 		#		round to remove the milliseconds for nicer display
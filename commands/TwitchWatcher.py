@@ -2,7 +2,7 @@ import datetime, json, os, time
 
 import requests
 
-import Constants, GlobalStore, PermissionLevel
+import Constants, GlobalStore, LineScheduler, PermissionLevel
 from util import DateTimeUtil, IrcFormattingUtil, StringUtil
 from commands.CommandTemplate import CommandTemplate
 from CustomExceptions import CommandException
@@ -40,7 +40,7 @@ class Command(CommandTemplate):
 			return
 
 		#Register the stream lookup method as a globally accessible command function
-		GlobalStore.commandhandler.addCommandFunction(__file__, 'getTwitchStreamInfo', self.getStreamerInfo)
+		GlobalStore.commandhandler.addCommandFunction(__file__, 'getTwitchStreamInfo', self.getStreamerInfo, cacheTtl=60)
 
 		#Load stored data on followed streams and the like
 		datafilepath = os.path.join(GlobalStore.scriptfolder, 'data', 'TwitchWatcherData.json')
@@ -440,11 +440,11 @@ class Command(CommandTemplate):
 				#Now make the bot say it
 				if useShortReportString:
 					# 'reportEntries' is a list of strings, report them all in one go
-					GlobalStore.bothandler.bots[server].sendMessage(channel, self.streamerWentLivePrefix + Constants.GREY_SEPARATOR.join(reportEntries))
+					GlobalStore.bothandler.bots[server].sendMessage(channel, self.streamerWentLivePrefix + Constants.GREY_SEPARATOR.join(reportEntries), priority=LineScheduler.PRIORITY_BACKGROUND)
 				else:
 					# 'reportEntries' is a list of StringWithSuffix's, report each separately
 					for reportEntry in reportEntries:
-						GlobalStore.bothandler.bots[server].sendLengthLimitedMessage(channel, self.streamerWentLivePrefix + reportEntry.mainString, reportEntry.suffix)
+						GlobalStore.bothandler.bots[server].sendLengthLimitedMessage(channel, self.streamerWentLivePrefix + reportEntry.mainString, reportEntry.suffix, priority=LineScheduler.PRIORITY_BACKGROUND)
 
 	def retrieveChannelInfo(self, streamername):
 		try:
@@ -3,7 +3,7 @@ import base64, datetime, html, json, os
 import requests
 
 from commands.CommandTemplate import CommandTemplate
-import Constants, GlobalStore, PermissionLevel
+import Constants, GlobalStore, LineScheduler, PermissionLevel
 from util import DateTimeUtil, IrcFormattingUtil, StringUtil
 from IrcMessage import IrcMessage
 from CustomExceptions import CommandInputException, WebRequestException
@@ -300,22 +300,28 @@ class Command(CommandTemplate):
 			#Reverse the tweets so we get them old to new, instead of new to old
 			tweets.reverse()
 			#New recent tweets! Shout about it (if we're in the place where we should shout)
+			#Collect the channels per server first, so channels on the same server can get the tweets in one combined line if the server allows that
+			targetChannelsPerServer = {}
 			for target in self.watchData[username]['targets']:
 				#'target' is a tuple with the server name at [0] and the channel name at [1]
 				#Just ignore it if we're either not on the server or not in the channel
 				if target[0] not in GlobalStore.bothandler.bots:
 					continue
-				targetbot = GlobalStore.bothandler.bots[target[0]]
-				if target[1] not in targetbot.channelsUserList:
+				if target[1] not in GlobalStore.bothandler.bots[target[0]].channelsUserList:
 					continue
-				targetchannel = target[1]
-				#Now go tell that channel all about the tweets
-				for tweet in tweets:
-					formattedTweet = self.formatNewTweetText(username, tweet)
-					targetbot.sendLengthLimitedMessage(targetchannel, formattedTweet.mainString, suffix=formattedTweet.suffix)
-				#If we skipped a few tweets, make a mention of that too
-				if tweetsSkipped > 0:
-					targetbot.sendMessage(targetchannel, "(skipped {:,} of {}'s tweets)".format(tweetsSkipped, self.getDisplayName(username)))
+				targetChannelsPerServer.setdefault(target[0], []).append(target[1])
+			if not targetChannelsPerServer:
+				continue
+			formattedTweets = [self.formatNewTweetText(username, tweet) for tweet in tweets]
+			for servername, targetchannels in targetChannelsPerServer.items():
+				targetbot = GlobalStore.bothandler.bots[servername]
+				for targetchannel in targetbot.combineMessageTargets(targetchannels):
+					#Now go tell those channels all about the tweets
+					for formattedTweet in formattedTweets:
+						targetbot.sendLengthLimitedMessage(targetchannel, formattedTweet.mainString, suffix=formattedTweet.suffix, priority=LineScheduler.PRIORITY_BACKGROUND)
+					#If we skipped a few tweets, make a mention of that too
+					if tweetsSkipped > 0:
+						targetbot.sendMessage(targetchannel, "(skipped {:,} of {}'s tweets)".format(tweetsSkipped, self.getDisplayName(username)), priority=LineScheduler.PRIORITY_BACKGROUND)
 		if watchDataChanged:
 			self.saveWatchData()
 
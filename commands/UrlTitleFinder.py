@@ -9,7 +9,7 @@ import GlobalStore
 import MessageTypes
 from IrcMessage import IrcMessage
 from CustomExceptions import CommandException, WebRequestException
-from util import DateTimeUtil, IrcFormattingUtil, StringUtil, WebUtil
+from util import DateTimeUtil, IrcFormattingUtil, SingleFlightUtil, StringUtil, WebUtil
 from StringWithSuffix import StringWithSuffix
 
 class Command(CommandTemplate):
@@ -18,6 +18,8 @@ class Command(CommandTemplate):
 	helptext = "Shows the title of the page somebody just posted a link to"
 	showInCommandList = False
 	callInThread = True  #We can't know how slow sites are, so prevent the bot from locking up on slow sites
+	passiveListenerMessageTypes = (MessageTypes.SAY, MessageTypes.ACTION)
+	passiveListenerNeedsUrl = True
 
 	#The maximum time a title look-up is allowed to take
 	lookupTimeoutSeconds = 5.0
@@ -39,22 +41,30 @@ class Command(CommandTemplate):
 		else:
 			for url in urlmatches:
 				url = url.strip(".,'\"")
-				# Go through the methods alphabetically, and use the generic method last
-				title = None
-				for parseMethod in (self.retrieveBlueskyTitle, self.retrieveImgurTitle, self.retrieveMastodonTitle, self.retrieveSteamTitle, self.retrieveTumblrTitle,
-									self.retrieveTwitchTitle, self.retrieveTwitterTitle, self.retrieveWikipediaTitle, self.retrieveYoutubeTitle, self.retrieveGenericTitle):
-					try:
-						title = parseMethod(url)
-					except requests.exceptions.Timeout:
-						self.logWarning("[url] '{}' took too long to respond, ignoring".format(url))
-					except requests.exceptions.ConnectionError as error:
-						self.logError("[url] A connection error occurred while trying to retrieve '{}': {}".format(url, error))
-					except WebRequestException as error:
-						self.logError(f"[UrlTitleFinder] A WebRequestException happened while resolving URL '{url}': {error}")
-					# Found a title, so we're done. It could be either a string or a StringWithSuffix, but the reply method can handle both
-					if title:
-						message.replyWithLengthLimit(title)
-						break
+				# If the same link gets posted in multiple channels at the same time, only look it up once
+				title = SingleFlightUtil.runSingleFlight(('urltitle', url), self.retrieveTitle, url)
+				# The title could be either a string or a StringWithSuffix, but the reply method can handle both
+				if title:
+					message.replyWithLengthLimit(title)
+
+	@staticmethod
+	def retrieveTitle(url):
+		# Go through the methods alphabetically, and use the generic method last
+		for parseMethod in (Command.retrieveBlueskyTitle, Command.retrieveImgurTitle, Command.retrieveMastodonTitle, Command.retrieveSteamTitle, Command.retrieveTumblrTitle,
+							Command.retrieveTwitchTitle, Command.retrieveTwitterTitle, Command.retrieveWikipediaTitle, Command.retrieveYoutubeTitle, Command.retrieveGenericTitle):
+			title = None
+			try:
+				title = parseMethod(url)
+			except requests.exceptions.Timeout:
+				Command.logWarning("[url] '{}' took too long to respond, ignoring".format(url))
+			except requests.exceptions.ConnectionError as error:
+				Command.logError("[url] A connection error occurred while trying to retrieve '{}': {}".format(url, error))
+			except WebRequestException as error:
+				Command.logError(f"[UrlTitleFinder] A WebRequestException happened while resolving URL '{url}': {error}")
+			# Found a title, so we're done
+			if title:
+				return title
+		return None
 
 	@staticmethod
 	def retrieveGenericTitle(url):
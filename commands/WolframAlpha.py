@@ -21,7 +21,9 @@ class Command(CommandTemplate):
 	callInThread = True  #WolframAlpha can be a bit slow
 
 	def onLoad(self):
-		GlobalStore.commandhandler.addCommandFunctions(__file__, "fetchWolframAlphaData", self.fetchWolframData, "searchWolframAlpha", self.searchWolfram)
+		#Cache the results for a short while only, since answers can depend on the current time
+		GlobalStore.commandhandler.addCommandFunction(__file__, "fetchWolframAlphaData", self.fetchWolframData, cacheTtl=60, cacheMaxMemory=1024 * 1024)
+		GlobalStore.commandhandler.addCommandFunction(__file__, "searchWolframAlpha", self.searchWolfram, cacheTtl=60)
 
 	def execute(self, message):
 		"""
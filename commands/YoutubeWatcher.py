@@ -4,6 +4,7 @@ import requests
 
 import Constants
 import GlobalStore
+import LineScheduler
 import PermissionLevel
 from util import DateTimeUtil, DictUtil, IrcFormattingUtil, StringUtil
 from commands.CommandTemplate import CommandTemplate
@@ -49,7 +50,7 @@ class Command(CommandTemplate):
 		return apiKey
 
 	def onLoad(self):
-		GlobalStore.commandhandler.addCommandFunction(__file__, 'getYoutubeVideoDescription', self.getVideoDisplayString)
+		GlobalStore.commandhandler.addCommandFunction(__file__, 'getYoutubeVideoDescription', self.getVideoDisplayString, cacheTtl=600)
 
 		if not GlobalStore.commandhandler.getApiKey('google'):
 			self.logError("[YoutubeWatcher] Google API key not found, YoutubeWatcher module will not work")
@@ -101,18 +102,24 @@ class Command(CommandTemplate):
 						else:
 							newVideosPerServerChannelString[serverChannelString].append(newVideoDict)
 		videoIdToDescription = {}
-		#Now we can report the newly found videos to each IRC channel
+		#Now we can report the newly found videos to each IRC channel. Collect the channels per server and video first, so channels on the same server can get a video in one combined line if the server allows that
+		channelsPerServerAndVideoId = {}
 		while newVideosPerServerChannelString:
 			serverChannelString, videoList = newVideosPerServerChannelString.popitem()
+			server, channel = serverChannelString.rsplit(' ', 1)
+			if server not in GlobalStore.bothandler.bots:
+				continue
 			for videoDict in videoList:
 				videoId = videoDict['videoId']
-				server, channel = serverChannelString.rsplit(' ', 1)
-				if server in GlobalStore.bothandler.bots:
-					if videoId not in videoIdToDescription:
-						description = self.getVideoDisplayString(videoId, includeViewCount=False, includeUploadDate=False, includeUrl=True)
-						description.mainString = self.newVideoPrefix + description.mainString
-						videoIdToDescription[videoId] = description
-					GlobalStore.bothandler.bots[server].sendLengthLimitedMessage(channel, videoIdToDescription[videoId].mainString, videoIdToDescription[videoId].suffix)
+				if videoId not in videoIdToDescription:
+					description = self.getVideoDisplayString(videoId, includeViewCount=False, includeUploadDate=False, includeUrl=True)
+					description.mainString = self.newVideoPrefix + description.mainString
+					videoIdToDescription[videoId] = description
+				channelsPerServerAndVideoId.setdefault((server, videoId), []).append(channel)
+		for (server, videoId), channels in channelsPerServerAndVideoId.items():
+			bot = GlobalStore.bothandler.bots[server]
+			for combinedChannels in bot.combineMessageTargets(channels):
+				bot.sendLengthLimitedMessage(combinedChannels, videoIdToDescription[videoId].mainString, videoIdToDescription[videoId].suffix, priority=LineScheduler.PRIORITY_BACKGROUND)
 		if shouldSaveWatchedData:
 			#New video info was stored, so save it to disk too
 			self.saveWatchedChannelsData()
@@ -1,21 +1,52 @@
 import argparse, logging, os, sys
 import logging.handlers
 
+#If startup profiling is enabled, start it before the other imports, so their import time gets measured too
+import GlobalStore
+from StartupProfiler import StartupProfiler, measureIfProfiling
+if __name__ == '__main__' and '--profilestartup' in sys.argv:
+	GlobalStore.startupProfiler = StartupProfiler()
+	GlobalStore.startupProfiler.start()
+
 import gevent
 import gevent.monkey
 
-import GlobalStore
 from CommandHandler import CommandHandler
 from BotHandler import BotHandler
 
 
+def finishStartupProfiling(budgetInMilliseconds: float, greenletsToWaitFor=None):
+	"""
+	Stop the startup profiler, write its report to a file, and log which parts of starting up took longer than the budget
+	:param greenletsToWaitFor: Greenlets that are still part of starting up, like the ones starting the bots. Profiling is only finished once these are done, so their measurements are complete
+	"""
+	if greenletsToWaitFor:
+		gevent.joinall(greenletsToWaitFor)
+	profiler = GlobalStore.startupProfiler
+	GlobalStore.startupProfiler = None
+	profiler.stop()
+	budgetInSeconds = budgetInMilliseconds / 1000
+	reportFilePath = os.path.join(GlobalStore.scriptfolder, 'StartupProfile.txt')
+	with open(reportFilePath, 'w', encoding='utf-8') as reportFile:
+		reportFile.write(profiler.getReport(budgetInSeconds))
+	logger = logging.getLogger('DideRobot')
+	logger.info("Startup took {:.3f} seconds, profile report written to '{}'".format(profiler.stopTime - profiler.startTime, reportFilePath))
+	for category, name, seconds, memoryDelta in profiler.getEntriesOverBudget(budgetInSeconds):
+		logger.warning("Startup {} '{}' took {:.1f} ms, which is over the budget of {:.0f} ms".format(category, name, seconds * 1000, budgetInMilliseconds))
+
+
 if __name__ == '__main__':
 	#First make sure everything is gevent-compatible
-	gevent.monkey.patch_all()
+	with measureIfProfiling('phase', 'gevent monkey patching'):
+		gevent.monkey.patch_all()
 
 	#Set up fancy argument parsing
 	argparser = argparse.ArgumentParser()
 	argparser.add_argument("serverlist", help="The comma-separated list of folders in serverSettings that you want to load the config from and start")
+	argparser.add_argument("--lazyload", action="store_true", help="Only load commands that just react to their triggers the first time one of their triggers is used, which makes starting up faster")
+	argparser.add_argument("--processworkers", type=int, default=0, help="The number of worker processes to start for CPU-heavy commands, so those don't block the bots. Set to 0 (the default) to run everything in the main process")
+	argparser.add_argument("--profilestartup", action="store_true", help="Measure how long each import, command load, and bot start takes and how much memory it uses, and write a report to 'StartupProfile.txt'")
+	argparser.add_argument("--startupbudget", type=float, default=100.0, help="When profiling startup, parts of starting up that take longer than this many milliseconds are flagged. Defaults to 100")
 	args = argparser.parse_args()
 
 	#Set up error and debug logging
@@ -36,13 +67,22 @@ if __name__ == '__main__':
 	logger.addHandler(loggingStreamHandler)
 
 	#Start up the CommandHandler and have it load in all the modules
-	GlobalStore.commandhandler = CommandHandler()
-	GlobalStore.commandhandler.loadCommands()
+	with measureIfProfiling('phase', 'CommandHandler init'):
+		GlobalStore.commandhandler = CommandHandler()
+	if args.processworkers > 0:
+		with measureIfProfiling('phase', 'process pool start'):
+			GlobalStore.commandhandler.startProcessPool(args.processworkers)
+	GlobalStore.commandhandler.shouldLoadCommandsLazily = args.lazyload
+	with measureIfProfiling('phase', 'loading all commands'):
+		GlobalStore.commandhandler.loadCommands()
 
 	#Get the config files we need to load from the argument parser
 	serverfolderList = args.serverlist.split(',')
 	#Start up the bots
 	bothandler = BotHandler(serverfolderList)
+	if GlobalStore.startupProfiler:
+		#The bots get started in greenlets that can yield while starting (for instance to open the log index database in a thread), so wait for them explicitly before finishing profiling
+		gevent.spawn(finishStartupProfiling, args.startupbudget, bothandler.botStartGreenlets)
 
 	#Only quit once every bot and command finishes running
 	gevent.wait()
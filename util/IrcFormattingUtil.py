@@ -117,3 +117,104 @@ def removeFormatting(text):
 		# The colour character is followed by color numbers
 		text = re.sub(COLOUR + r"\d{1,2}(,\d{1,2})?", '', text)
 	return text
+
+# Matches a single formatting code in UTF-8 encoded text. Formatting characters are all ASCII, so they can't occur inside a multi-byte character
+_FORMATTING_BYTES_REGEX = re.compile(b"\x03(?:(\\d{1,2})(?:,(\\d{1,2}))?)?|[\x02\x1d\x1f\x0f]")
+_TOGGLE_FORMATTING_BYTES = {BOLD.encode('utf-8'): 0, ITALIC.encode('utf-8'): 1, UNDERLINE.encode('utf-8'): 2}
+_NO_FORMATTING = (False, False, False, None, None)
+
+def _updateFormattingState(formattingState, encodedText):
+	"""
+	Apply the formatting codes in the provided text to the provided formatting state
+	:param formattingState: A tuple with whether bold, italic, and underline are on, and the text and background colour number (as bytes, or None if not set)
+	:param encodedText: The UTF-8 encoded text whose formatting codes should be applied
+	:return: The formatting state at the end of the provided text
+	"""
+	# Everything before the last 'clear formatting' character doesn't matter, so only look at what comes after it
+	scanStartIndex = encodedText.rfind(b"\x0f") + 1
+	if scanStartIndex > 0:
+		formattingState = _NO_FORMATTING
+	if not _FORMATTING_BYTES_REGEX.search(encodedText, scanStartIndex):
+		return formattingState
+	formattingState = list(formattingState)
+	for match in _FORMATTING_BYTES_REGEX.finditer(encodedText, scanStartIndex):
+		formattingCode = match.group(0)
+		if formattingCode in _TOGGLE_FORMATTING_BYTES:
+			toggleIndex = _TOGGLE_FORMATTING_BYTES[formattingCode]
+			formattingState[toggleIndex] = not formattingState[toggleIndex]
+		elif match.group(1) is None:
+			# A colour character without numbers resets the colours
+			formattingState[3] = None
+			formattingState[4] = None
+		else:
+			# A text colour without a background colour leaves the background colour as it was
+			formattingState[3] = match.group(1)
+			if match.group(2) is not None:
+				formattingState[4] = match.group(2)
+	return tuple(formattingState)
+
+def _formattingStateToBytes(formattingState):
+	formattingBytes = b""
+	for toggleFormattingBytes, toggleIndex in _TOGGLE_FORMATTING_BYTES.items():
+		if formattingState[toggleIndex]:
+			formattingBytes += toggleFormattingBytes
+	if formattingState[3] is not None:
+		# Always use two digits, so a number at the start of the text doesn't get mistaken for part of the colour
+		formattingBytes += b"\x03" + formattingState[3].zfill(2)
+		if formattingState[4] is not None:
+			formattingBytes += b"," + formattingState[4].zfill(2)
+	return formattingBytes
+
+def splitTextByByteLength(text, maxByteLength, shouldCarryFormatting=True):
+	"""
+	Split the provided text into parts that are each at most the provided number of bytes long when UTF-8 encoded, since IRC line length limits are in bytes, not in characters
+	Parts are split on a space if there's one in the second half of the part, otherwise on a character boundary. Colour codes are never split
+	:param text: The text to split. It shouldn't contain newlines, those should be handled before calling this
+	:param maxByteLength: The maximum length in bytes each part is allowed to be
+	:param shouldCarryFormatting: If True, the formatting that is active at the end of a part gets repeated at the start of the next part, so for instance a bold sentence stays bold when it gets split up
+	:return: A list of the text parts, in order. If the text is short enough, this is a list with just the provided text
+	"""
+	encodedText = text.encode('utf-8')
+	textByteLength = len(encodedText)
+	if textByteLength <= maxByteLength:
+		return [text]
+	if maxByteLength < 6:
+		raise ValueError("Maximum byte length should be at least 6, to fit the longest possible colour code, but it is {}".format(maxByteLength))
+	textParts = []
+	formattingState = _NO_FORMATTING
+	formattingPrefix = b""
+	startIndex = 0
+	while startIndex < textByteLength:
+		# With a very low maximum length, the carried formatting could leave no room for the text itself. Leave out the formatting then
+		if len(formattingPrefix) > maxByteLength - 6:
+			formattingPrefix = b""
+		partByteLength = maxByteLength - len(formattingPrefix)
+		endIndex = startIndex + partByteLength
+		if endIndex >= textByteLength:
+			endIndex = textByteLength
+			nextStartIndex = textByteLength
+		else:
+			# Don't split in the middle of a multi-byte character. UTF-8 continuation bytes all start with the bits '10'
+			while endIndex > startIndex and encodedText[endIndex] & 0xC0 == 0x80:
+				endIndex -= 1
+			# Prefer splitting on a space, if that doesn't make the part too short. The space itself doesn't need to be sent
+			spaceIndex = encodedText.rfind(b" ", startIndex, endIndex + 1)
+			if spaceIndex > startIndex + partByteLength // 2:
+				endIndex = spaceIndex
+				nextStartIndex = spaceIndex + 1
+			else:
+				# Make sure a colour code doesn't get split up, since then its numbers would show up as text in the next part
+				colourIndex = encodedText.rfind(b"\x03", max(startIndex, endIndex - 5), endIndex)
+				if colourIndex > startIndex and _FORMATTING_BYTES_REGEX.match(encodedText, colourIndex).end() > endIndex:
+					endIndex = colourIndex
+				nextStartIndex = endIndex
+		encodedTextPart = encodedText[startIndex:endIndex]
+		textParts.append((formattingPrefix + encodedTextPart).decode('utf-8'))
+		if shouldCarryFormatting:
+			formattingState = _updateFormattingState(formattingState, encodedTextPart)
+			formattingPrefix = _formattingStateToBytes(formattingState)
+			# If the prefix ends with a text colour, a comma and a number at the start of the next part would be seen as a background colour. Two bolds cancel each other out, so use those to separate them
+			if formattingState[3] is not None and formattingState[4] is None and encodedText.startswith(b",", nextStartIndex):
+				formattingPrefix += b"\x02\x02"
+		startIndex = nextStartIndex
+	return textParts
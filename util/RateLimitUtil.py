@@ -0,0 +1,63 @@
+import time
+
+
+class TokenBucket(object):
+	"""
+	A token bucket rate limiter. The bucket holds at most 'capacity' tokens and gets refilled with 'refillRate' tokens per second
+	Every action costs one or more tokens, so short bursts up to the capacity are allowed immediately, while the long-term rate stays limited to the refill rate
+	"""
+	def __init__(self, capacity: float, refillRate: float):
+		"""
+		Create a new token bucket, which starts out full
+		:param capacity: The maximum number of tokens the bucket can hold, which is also the largest burst that's allowed
+		:param refillRate: How many tokens get added to the bucket per second
+		"""
+		self.capacity = capacity
+		self.refillRate = refillRate
+		self.tokens = capacity
+		self._lastRefillTime = time.monotonic()
+
+	def _refill(self):
+		now = time.monotonic()
+		if self.tokens < self.capacity:
+			self.tokens = min(self.capacity, self.tokens + (now - self._lastRefillTime) * self.refillRate)
+		self._lastRefillTime = now
+
+	def setRate(self, capacity: float, refillRate: float):
+		"""
+		Change the capacity and refill rate of this bucket, keeping the tokens that are currently available (up to the new capacity)
+		"""
+		self._refill()
+		self.capacity = capacity
+		self.refillRate = refillRate
+		self.tokens = min(self.tokens, capacity)
+
+	def tryConsume(self, tokenCount: float = 1) -> bool:
+		"""
+		Take the provided number of tokens from the bucket, if there are enough available
+		:param tokenCount: How many tokens to take from the bucket
+		:return: True if there were enough tokens and they were taken, False if there weren't enough tokens, in which case none are taken
+		"""
+		self._refill()
+		if self.tokens >= tokenCount:
+			self.tokens -= tokenCount
+			return True
+		return False
+
+	def isFull(self) -> bool:
+		"""
+		:return: True if the bucket holds its maximum number of tokens, meaning it hasn't been used recently
+		"""
+		self._refill()
+		return self.tokens >= self.capacity
+
+	def getSecondsUntilAvailable(self, tokenCount: float = 1) -> float:
+		"""
+		Get how long it takes until the provided number of tokens is available
+		:param tokenCount: The number of tokens that need to be available
+		:return: The number of seconds until the bucket has the provided number of tokens, or 0.0 if they're available right now
+		"""
+		self._refill()
+		if self.tokens >= tokenCount:
+			return 0.0
+		return (tokenCount - self.tokens) / self.refillRate
@@ -0,0 +1,40 @@
+from typing import Any, Callable, Hashable
+
+import gevent.event
+
+
+_inFlightResults = {}  # Keys are the keys of the calls that are currently running, values are AsyncResults that the other callers with the same key wait on
+_NO_RESULT = object()  # Signals waiting callers that the running call got interrupted without a result or an exception, so they should try again themselves
+
+def runSingleFlight(key: Hashable, function: Callable, *args, **kwargs) -> Any:
+	"""
+	Call the provided function, unless a call with the same key is already running. In that case, wait for that call to finish and return its result instead
+	That way, if multiple users ask for the same slow lookup at the same time, the lookup only happens once. If the function raises an exception, all the waiting callers get that exception too
+	Since all callers get the same result object, callers shouldn't change the result
+	:param key: Identifies what's being looked up. Calls with the same key get the same result, so this should be normalized, and it should include a name for the lookup so it doesn't clash with other lookups. For instance: ('steamsearch', searchQuery.lower())
+	:param function: The function to call if no call with the same key is running
+	:param args: The arguments to pass to the function
+	:param kwargs: The keyword arguments to pass to the function
+	:return: The result of the function, either from this call or from the call that was already running
+	"""
+	while key in _inFlightResults:
+		result = _inFlightResults[key].get()
+		if result is not _NO_RESULT:
+			return result
+		#The call we were waiting on got killed. If no other waiting caller took over yet, the loop ends and we run it ourselves
+	asyncResult = gevent.event.AsyncResult()
+	_inFlightResults[key] = asyncResult
+	try:
+		result = function(*args, **kwargs)
+	except Exception as e:
+		asyncResult.set_exception(e)
+		raise
+	except BaseException:
+		#Probably a GreenletExit because this greenlet got killed. That shouldn't stop the callers waiting on us, so let them retry
+		asyncResult.set(_NO_RESULT)
+		raise
+	else:
+		asyncResult.set(result)
+		return result
+	finally:
+		del _inFlightResults[key]